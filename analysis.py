@@ -2,193 +2,318 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 import gc
+import importlib.util
 import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 
-def read_large_csv_optimized(file_path):
+from instrumentation import stage, staged_chunks
+from memory_budget import ColumnarFrameBuilder, plan_csv_read, stream_chunk_rows
+from date_parse import MAX_DISTINCT_DATE_RATIO, MISSING_DAY, sample_date_columns, parse_date_column, to_day_numbers
+from compressed_input import open_export
+
+# Bump whenever a change alters analysis results (invalidates cached results)
+ANALYSIS_VERSION = '2'
+
+# Shipment categories in integer-code order used by the aggregation kernel
+SHIPMENT_CATEGORIES = ['Delivered', 'RTO', 'Damage/Lost', 'Undelivered', 'Other']
+CATEGORY_COUNT_COLUMNS = ['delivered_count', 'rto_count', 'damage_lost_count', 'undelivered_count', 'other_count']
+
+# Dimensions broken down by days_after_tat_breach
+BREAKDOWN_DIMENSIONS = ['payment_method', 'applied_zone', 'parent_courier_name']
+
+# Define optimized data types to reduce memory usage
+CSV_DTYPES = {
+    'parent_courier_name': 'category',
+    'courier_name': 'category',
+    'payment_method': 'category',
+    'tracking_status_group': 'category',
+    'applied_zone': 'category',
+    'pickup_state': 'category',
+    'delivery_state': 'category',
+    'delivery_city': 'category',
+    'company_name': 'category',
+    'shipment_mode': 'category'
+}
+DATE_COLUMNS = ['first_attempt_date', 'final_courier_edd', 'delivered_date', 'rapidshyp_edd']
+
+# Only these columns are read from an export (tracking_status_group is in CSV_DTYPES)
+ANALYSIS_COLUMNS = [*CSV_DTYPES, *DATE_COLUMNS]
+
+# Columns an export must have for the analysis to run (the rest are optional)
+REQUIRED_COLUMNS = [
+    col for col in ANALYSIS_COLUMNS if col not in ('company_name', 'shipment_mode', 'delivery_city')
+]
+
+# Day-number columns (int32 days since 1970-01-01) shared by the date parse
+# and breach classification stages
+DAY_COLUMNS = {'effective_edd': 'effective_edd_day', 'first_attempt_date': 'first_attempt_day'}
+
+# 'c' (default) or 'pyarrow' when pyarrow is installed
+CSV_ENGINE = os.environ.get('CSV_ENGINE', 'c')
+
+# Files whose in-memory analysis would exceed the memory budget are streamed
+# by default, in chunks sized from the budget (see memory_budget.py)
+
+# Worker processes for the per-dimension aggregation (1 = run in-process)
+PARALLEL_WORKERS = int(os.environ.get('ANALYSIS_PARALLEL_WORKERS', 1))
+
+def csv_read_options(file_path, extra_columns=()):
+    """
+    read_csv arguments projecting an export onto the analysis columns (plus any
+    extra_columns, read as strings), with categorical dtypes applied during the
+    read. Date columns with few distinct values are read as categoricals and
+    parsed once per value later; the others are parsed during the read in
+    their detected format.
+    """
+    with open_export(file_path) as f:
+        header = pd.read_csv(f, nrows=0).columns
+    columns = [col for col in [*ANALYSIS_COLUMNS, *extra_columns] if col in header]
+    dtype = {col: CSV_DTYPES.get(col, str) for col in columns if col in CSV_DTYPES or col in extra_columns}
+    
+    # date_format also carries the detected format of the categorical date
+    # columns, for the date parse stage (read_csv only applies it to parse_dates)
+    parse_dates = []
+    date_formats = {}
+    for col, (date_format, distinct) in sample_date_columns(file_path, [col for col in DATE_COLUMNS if col in columns]).items():
+        if distinct <= MAX_DISTINCT_DATE_RATIO:
+            dtype[col] = 'category'
+            date_formats[col] = date_format
+        else:
+            parse_dates.append(col)
+            date_formats[col] = date_format or 'ISO8601'
+    
+    return {
+        'usecols': columns,
+        'dtype': dtype,
+        'parse_dates': parse_dates,
+        'date_format': date_formats
+    }
+
+def _resolve_csv_engine(engine):
+    """
+    Fall back to the C parser when pyarrow is requested but not installed
+    """
+    engine = engine or CSV_ENGINE
+    if engine == 'pyarrow':
+        if importlib.util.find_spec('pyarrow') is None:
+            print("pyarrow is not installed. Falling back to the C CSV engine...")
+            return 'c'
+    return engine
+
+def _normalize_pyarrow_frame(df):
+    """
+    Match the C engine's output: empty strings are missing, parsed dates are
+    datetime64[ns] (the rest are parsed by the date parse stage)
+    """
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype) and '' in df[col].cat.categories:
+            df[col] = df[col].cat.remove_categories([''])
+    
+    for col in DATE_COLUMNS:
+        if col in df.columns and pd.api.types.is_datetime64_dtype(df[col]):
+            df[col] = df[col].astype('datetime64[ns]')
+    
+    return df
+
+def read_csv_chunks(file_path, chunk_size, read_options):
+    """Chunks of an export, decompressed as they are read"""
+    with open_export(file_path) as f:
+        yield from pd.read_csv(f, chunksize=chunk_size, low_memory=False, **read_options)
+
+def read_large_csv_optimized(file_path, engine=None, extra_columns=()):
     """
     Memory-optimized CSV reading for large files
     """
     print(f"📊 Loading large dataset: {file_path}")
     
-    # Define optimized data types to reduce memory usage
-    dtype_dict = {
-        'parent_courier_name': 'category',
-        'courier_name': 'category',
-        'payment_method': 'category',
-        'tracking_status_group': 'category',
-        'applied_zone': 'category',
-        'pickup_state': 'category',
-        'delivery_state': 'category',
-        'delivery_city': 'category',
-        'company_name': 'category',
-        'shipment_mode': 'category'
-    }
-    
     try:
-        # Check file size
-        file_size = os.path.getsize(file_path) / (1024 * 1024)  # MB
-        print(f"File size: {file_size:.2f} MB")
-        
-        if file_size > 50:  # Large file - use chunked reading
-            print("Large file detected. Using chunked processing...")
-            chunks = []
-            chunk_size = 10000  # Process 10k rows at a time
+        with stage('load') as counts:
+            read_options = csv_read_options(file_path, extra_columns)
+            print(f"Reading {len(read_options['usecols'])} analysis columns")
+            
+            # Check file size
+            file_size = os.path.getsize(file_path) / (1024 * 1024)  # MB
+            print(f"File size: {file_size:.2f} MB")
             
-            for i, chunk in enumerate(pd.read_csv(file_path, chunksize=chunk_size, dtype=dtype_dict, low_memory=False)):
-                chunks.append(chunk)
-                if i % 10 == 0:  # Progress update every 100k rows
-                    print(f"Processed {(i+1) * chunk_size:,} rows...")
+            plan = plan_csv_read(file_path, read_options)
+            _print_read_plan(plan)
+            
+            if plan['strategy'] == 'chunked':  # Too large to parse in one call within the budget
+                chunk_size = plan['chunk_rows']
+                print(f"Large file detected. Reading in chunks of {chunk_size:,} rows...")
+                
+                # Chunks are copied once into columnar buffers, never re-concatenated
+                builder = ColumnarFrameBuilder(plan['estimated_rows'])
+                for i, chunk in enumerate(read_csv_chunks(file_path, chunk_size, read_options)):
+                    builder.append(chunk)
+                    del chunk
+                    if i % 10 == 0:
+                        print(f"Processed {builder.rows:,} rows...")
                 
-                # Memory management
-                if len(chunks) >= 50:  # Combine every 50 chunks
-                    combined_chunk = pd.concat(chunks, ignore_index=True)
-                    chunks = [combined_chunk]
-                    gc.collect()
+                df = builder.build()
+                del builder
+                gc.collect()
+            
+            elif _resolve_csv_engine(engine) == 'pyarrow':  # Small file - multithreaded Arrow parser
+                with open_export(file_path) as f:
+                    df = _normalize_pyarrow_frame(pd.read_csv(f, engine='pyarrow', **read_options))
             
-            df = pd.concat(chunks, ignore_index=True)
-            del chunks
-            gc.collect()
+            else:  # Small file - read normally
+                with open_export(file_path) as f:
+                    df = pd.read_csv(f, low_memory=False, **read_options)
             
-        else:  # Small file - read normally
-            df = pd.read_csv(file_path, dtype=dtype_dict, low_memory=False)
+            counts['rows_out'] = len(df)
+            df.attrs['date_formats'] = read_options['date_format']
         
         print(f"✅ Dataset loaded with {len(df):,} records")
         return df
-        
+    
     except Exception as e:
         print(f"Error reading CSV: {e}")
         return None
 
-def calculate_comprehensive_delivery_analysis_corrected(file_path):
+def _print_read_plan(plan):
+    if plan['budget_bytes'] is None:
+        return
+    print(f"Memory budget {plan['budget_bytes'] / (1024 * 1024):,.0f} MB; estimated "
+          f"{plan['estimated_rows']:,} rows, {plan['estimated_frame_bytes'] / (1024 * 1024):,.0f} MB in memory")
+
+def plan_export_read(file_path, extra_columns=()):
+    """Memory plan for loading an export (see memory_budget.plan_csv_read)"""
+    return plan_csv_read(file_path, csv_read_options(file_path, extra_columns))
+
+def should_stream(file_path):
+    """Stream an export when its in-memory analysis would not fit the memory budget"""
+    return not plan_export_read(file_path)['fits']
+
+def _day_numbers(df, col):
     """
-    Memory-optimized comprehensive delivery performance analysis
+    Day numbers of a date column: the ones the date parse stage stored, or
+    truncated from the datetimes for frames that did not go through it
+    """
+    if DAY_COLUMNS.get(col) in df.columns:
+        return df[DAY_COLUMNS[col]].to_numpy()
+    return to_day_numbers(df[col].to_numpy(dtype='datetime64[ns]').view(np.int64))
+
+def classify_tat_breaches(df, current_date=None):
+    """
+    Vectorized TAT breach classification on int32 day numbers.
+    
+    Adds the tat_breach, delivery_success, days_after_tat_breach and
+    shipment_category columns to df in place. Delivered rows with a
+    delivered_date but no first_attempt_date (which the old row-wise version
+    could not compare) are treated as not breached.
+    """
+    if current_date is None:
+        current_date = datetime.now()
+    today = (current_date.date() - datetime(1970, 1, 1).date()).days
+    
+    with stage('breach_classification', rows_in=len(df)) as counts:
+        status = df['tracking_status_group']
+        edd_day = _day_numbers(df, 'effective_edd').astype(np.int64)
+        attempt_day = _day_numbers(df, 'first_attempt_date').astype(np.int64)
+        
+        has_edd = edd_day != MISSING_DAY
+        has_attempt = attempt_day != MISSING_DAY
+        has_delivered = df['delivered_date'].notna().to_numpy()
+        is_delivered = (status == 'Delivered').to_numpy()
+        is_rto = (status == 'RTO').to_numpy()
+        is_damage_lost = (status == 'Damage/Lost').to_numpy()
+        is_manifested = (status == 'Manifested').to_numpy()
+        delivered_with_date = is_delivered & has_delivered
+        
+        # CORRECTED TAT breach - only after EDD date, not on same date.
+        # Delivered, RTO/Damage/Lost and undelivered shipments with an attempt are
+        # judged on the first attempt; shipments with no attempt on the current date.
+        attempt_rule = has_attempt & (delivered_with_date | is_rto | is_damage_lost | ~has_delivered)
+        no_attempt_rule = ~has_attempt & ~delivered_with_date
+        tat_breach = has_edd & ((attempt_rule & (attempt_day > edd_day)) | (no_attempt_rule & (today > edd_day)))
+        counts['rows_out'] = int(tat_breach.sum())
+    
+    with stage('day_computation', rows_in=len(df)):
+        # CORRECTED days calculation - starts from Day 1
+        breach_day = np.where(has_attempt, attempt_day, today)
+        days_after = np.maximum(breach_day - edd_day, 1)
+        
+        df['tat_breach'] = tat_breach
+        df['delivery_success'] = is_delivered.astype(int)
+        df.loc[df['tat_breach'], 'days_after_tat_breach'] = days_after[tat_breach]
+    
+    with stage('shipment_category', rows_in=len(df)):
+        df['shipment_category'] = np.select(
+            [is_delivered, is_rto, is_damage_lost, is_manifested | ~has_delivered],
+            ['Delivered', 'RTO', 'Damage/Lost', 'Undelivered'],
+            default='Other'
+        )
+    
+    return df
+
+def derive_effective_edd(df):
+    """
+    Parse the date columns and derive effective_edd (rows without any EDD are
+    kept), storing the day numbers breach classification needs in DAY_COLUMNS
+    """
+    with stage('date_parse', rows_in=len(df)):
+        # Categorical (and unparsed string) columns are parsed once per distinct
+        # value; columns parsed during the read are only truncated to days
+        date_formats = df.attrs.get('date_formats', {})
+        days = {}
+        for col in DATE_COLUMNS:
+            if col in df.columns:
+                df[col], days[col] = parse_date_column(df[col], date_formats.get(col))
+        
+        # Create enhanced EDD column 
+        df['effective_edd'] = df['final_courier_edd'].fillna(df['rapidshyp_edd'])
+        edd_day = days['final_courier_edd']
+        df[DAY_COLUMNS['effective_edd']] = np.where(edd_day != MISSING_DAY, edd_day, days['rapidshyp_edd'])
+        df[DAY_COLUMNS['first_attempt_date']] = days['first_attempt_date']
+    return df
+
+def apply_effective_edd(df):
+    """
+    Parse the date columns, derive effective_edd and drop rows without any EDD
+    """
+    derive_effective_edd(df)
+    
+    # Filter out rows where both EDDs are missing
+    with stage('edd_filter', rows_in=len(df)) as counts:
+        df.dropna(subset=['effective_edd'], inplace=True)
+        counts['rows_out'] = len(df)
+    return df
+
+def prepare_breach_dataset(file_path, current_date=None):
+    """
+    Load, parse and classify a shipment export, returning only TAT breach rows
     """
     
     # Load dataset with memory optimization
     df = read_large_csv_optimized(file_path)
     if df is None:
-        return None, None, None 
+        return None, None
     
     initial_total_records = len(df)
     
-    # Convert date columns efficiently
-    date_columns = ['first_attempt_date', 'final_courier_edd', 'delivered_date', 'rapidshyp_edd']
-    for col in date_columns:
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors='coerce')
-    
-    # Create enhanced EDD column 
-    df['effective_edd'] = df['final_courier_edd'].fillna(df['rapidshyp_edd'])
-    
-    # Filter out rows where both EDDs are missing
-    
-    df = df.dropna(subset=['effective_edd'])
+    df = apply_effective_edd(df)
     print(f"🔍 Filtered dataset: {len(df):,} records (removed {initial_total_records - len(df):,} records with missing EDD)")
     
     # Memory cleanup
     gc.collect()
     
-    # Get current date for undelivered shipments analysis
-    current_date = datetime.now()
-    
-    # CORRECTED TAT breach calculation - only after EDD date, not on same date
-    def calculate_tat_breach(row):
-        effective_edd = row['effective_edd']
-        first_attempt = row['first_attempt_date']
-        delivered = row['delivered_date']
-        status = row['tracking_status_group']
-        
-        # For delivered shipments, check if delivered AFTER EDD date (not on same date)
-        if status == 'Delivered' and pd.notna(delivered):
-            return first_attempt.date() > effective_edd.date()
-        
-        # For RTO/failed deliveries, check if first attempt was AFTER EDD date
-        if status in ['RTO', 'Damage/Lost'] and pd.notna(first_attempt):
-            return first_attempt.date() > effective_edd.date()
-        
-        # For undelivered shipments with attempt, check if attempt was AFTER EDD date
-        if pd.isna(delivered) and pd.notna(first_attempt):
-            return first_attempt.date() > effective_edd.date()
-        
-        # For shipments with no attempt made and we're past EDD date
-        if pd.isna(first_attempt):
-            return current_date.date() > effective_edd.date()
-        
-        return False
-    
     print("🔍 Calculating TAT breaches...")
-    df['tat_breach'] = df.apply(calculate_tat_breach, axis=1)
-    df['delivery_success'] = (df['tracking_status_group'] == 'Delivered').astype(int)
-    
-    # CORRECTED days calculation - starts from Day 1
-    def calculate_days_after_tat_breach(row):
-        effective_edd = row['effective_edd']
-        delivered = row['delivered_date']
-        first_attempt = row['first_attempt_date']
-        status = row['tracking_status_group']
-        
-        # For delivered shipments, use delivered_date
-        if status == 'Delivered' and pd.notna(delivered):
-            days = (first_attempt.date() - effective_edd.date()).days
-            return max(1, days)  # Minimum Day 1
-        
-        # For RTO cases, use first_attempt_date
-        elif status == 'RTO' and pd.notna(first_attempt):
-            days = (first_attempt.date() - effective_edd.date()).days
-            return max(1, days)  # Minimum Day 1
-        
-        # For other failed deliveries with attempt, use first_attempt_date
-        elif status in ['Damage/Lost'] and pd.notna(first_attempt):
-            days = (first_attempt.date() - effective_edd.date()).days
-            return max(1, days)  # Minimum Day 1
-        
-        # For undelivered shipments with attempt, use first_attempt_date
-        elif pd.isna(delivered) and pd.notna(first_attempt):
-            days = (first_attempt.date() - effective_edd.date()).days
-            return max(1, days)  # Minimum Day 1
-        
-        # For undelivered shipments with no attempt, use current date
-        elif pd.isna(delivered) and pd.isna(first_attempt):
-            days = (current_date.date() - effective_edd.date()).days
-            return max(1, days)  # Minimum Day 1
-        
-        # Default fallback
-        else:
-            days = (current_date.date() - effective_edd.date()).days
-            return max(1, days)  # Minimum Day 1
-    
-    # Apply days calculation only for TAT breach cases
     print("📅 Calculating days after TAT breach...")
-    df.loc[df['tat_breach'], 'days_after_tat_breach'] = df.loc[df['tat_breach']].apply(
-        calculate_days_after_tat_breach, axis=1
-    )
-    
-    # Categorize shipment status
-    def categorize_shipment_status(row):
-        status = row['tracking_status_group']
-        if status == 'Delivered':
-            return 'Delivered'
-        elif status == 'RTO':
-            return 'RTO'
-        elif status == 'Damage/Lost':
-            return 'Damage/Lost'
-        elif status == 'Manifested':
-            return 'Undelivered'
-        else:
-            if pd.isna(row['delivered_date']):
-                return 'Undelivered'
-            else:
-                return 'Other'
-    
-    df['shipment_category'] = df.apply(categorize_shipment_status, axis=1)
+    classify_tat_breaches(df, current_date)
     
     # Filter only TAT breach cases
-    breach_df = df[df['tat_breach'] == True].copy()
+    with stage('breach_filter', rows_in=len(df)) as counts:
+        breach_df = df[df['tat_breach'] == True].copy()
+        counts['rows_out'] = len(breach_df)
     print(f"⚠️  TAT breach cases: {len(breach_df):,} records")
     
     if len(breach_df) == 0:
         print("❌ No TAT breach cases found in the dataset")
-        return None, None
+        return None, initial_total_records
     
     # Show RTO statistics
     breach_rto_count = (breach_df['shipment_category'] == 'RTO').sum()
@@ -199,37 +324,428 @@ def calculate_comprehensive_delivery_analysis_corrected(file_path):
     del df
     gc.collect()
     
-    # Calculate daywise statistics (starting from Day 1)
+    return breach_df, initial_total_records
+
+def _encode_dimension(series):
+    """
+    Integer-code a grouping column. Returns (codes, labels, levels) where levels
+    is the full category list for categoricals (groupby keeps unobserved
+    categories for those) and None otherwise. Missing values get code -1.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories
+        return series.cat.codes.to_numpy().astype(np.int64), categories, list(categories)
+    codes, labels = pd.factorize(series, sort=True)
+    return codes.astype(np.int64), labels, None
+
+def _count_group_codes(category_codes, day_codes, n_days, dimension_codes=None, n_levels=0, day_values=None):
+    """
+    Count shipments per (group, shipment category) with a single bincount.
+    
+    Groups are days when dimension_codes is None, (dimension, day) pairs when
+    day_codes is given as well, and dimension values alone when day_codes is
+    None. With day_values, also sums the days of delivered shipments per group.
+    """
+    if dimension_codes is None:
+        group_codes, n_groups = day_codes, n_days
+    elif day_codes is None:
+        group_codes, n_groups = dimension_codes, n_levels
+    else:
+        valid = dimension_codes >= 0
+        group_codes = dimension_codes[valid].astype(np.int64) * n_days + day_codes[valid]
+        category_codes = category_codes[valid]
+        n_groups = n_levels * n_days
+    
+    n_categories = len(SHIPMENT_CATEGORIES)
+    counts = np.bincount(
+        group_codes.astype(np.int64) * n_categories + category_codes,
+        minlength=n_groups * n_categories
+    ).reshape(n_groups, n_categories)
+    
+    delivered_days = None
+    if day_values is not None:
+        delivered = category_codes == SHIPMENT_CATEGORIES.index('Delivered')
+        delivered_days = np.bincount(group_codes[delivered], weights=day_values[delivered], minlength=n_groups)
+    
+    return counts, delivered_days
+
+def _count_state(counts, index_for):
+    """
+    Build a count state from a bincount matrix, keeping only observed groups;
+    index_for builds their index from group codes
+    """
+    observed = np.flatnonzero(counts.sum(axis=1))
+    state = pd.DataFrame(counts[observed], index=index_for(observed), columns=CATEGORY_COUNT_COLUMNS)
+    state.insert(0, 'total_shipments', state.sum(axis=1))
+    return state, observed
+
+def _encode_breach_dimensions(breach_df):
+    """
+    Integer-code shipment_category, days and every dimension of breach_df once
+    """
+    category_codes = pd.Categorical(
+        breach_df['shipment_category'], categories=SHIPMENT_CATEGORIES
+    ).codes.astype(np.int8)
+    day_values = breach_df['days_after_tat_breach'].to_numpy()
+    days, day_codes = np.unique(day_values, return_inverse=True)
+    
+    encoded = {
+        'category_codes': category_codes,
+        'day_values': day_values,
+        'days': days,
+        'day_codes': day_codes.astype(np.int32),
+        'dimensions': {}
+    }
+    for dimension in BREAKDOWN_DIMENSIONS:
+        codes, labels, levels = _encode_dimension(breach_df[dimension])
+        encoded['dimensions'][dimension] = (codes.astype(np.int32), labels, levels)
+    
+    # Route combinations (pickup_state -> delivery_state) as code pairs; the
+    # route label is only built for the final table rows
+    pickup_codes, pickup_labels = _encode_route_state(breach_df['pickup_state'])
+    delivery_codes, delivery_labels = _encode_route_state(breach_df['delivery_state'])
+    route_codes = pickup_codes * len(delivery_labels) + delivery_codes
+    encoded['route'] = (route_codes.astype(np.int32), (pickup_labels, delivery_labels))
+    
+    return encoded
+
+def _encode_route_state(series):
+    """
+    Integer-code a route end; missing states get their own trailing code
+    (labelled NaN) because every shipment belongs to a route
+    """
+    codes, labels, _ = _encode_dimension(series)
+    labels = pd.Index(list(labels) + [np.nan], dtype=object)
+    return np.where(codes < 0, len(labels) - 1, codes), labels
+
+def _count_tasks(encoded):
+    """
+    Independent bincount tasks for every aggregate state: (key, array names, scalar arguments)
+    """
+    n_days = len(encoded['days'])
+    tasks = [('days', {'day_codes': 'day_codes'}, {'n_days': n_days})]
+    for dimension, (codes, labels, _) in encoded['dimensions'].items():
+        tasks.append((dimension, {'day_codes': 'day_codes', 'dimension_codes': dimension},
+                      {'n_days': n_days, 'n_levels': len(labels)}))
+    pickup_labels, delivery_labels = encoded['route'][1]
+    tasks.append(('route', {'dimension_codes': 'route', 'day_values': 'day_values'},
+                  {'n_days': n_days, 'n_levels': len(pickup_labels) * len(delivery_labels)}))
+    return tasks
+
+def _encoded_arrays(encoded):
+    arrays = {
+        'category_codes': encoded['category_codes'],
+        'day_codes': encoded['day_codes'],
+        'day_values': encoded['day_values'],
+        'route': encoded['route'][0]
+    }
+    for dimension, (codes, _, _) in encoded['dimensions'].items():
+        arrays[dimension] = codes
+    return arrays
+
+def _build_aggregates(encoded, counted):
+    """
+    Turn per-task bincount results into the mergeable aggregate states
+    """
+    days = encoded['days']
+    n_days = len(days)
+    
+    aggregates = {'levels': {}}
+    aggregates['days'], _ = _count_state(
+        counted['days'][0], lambda observed: pd.Index(days[observed], name='days_after_tat_breach')
+    )
+    
+    for dimension, (_, labels, levels) in encoded['dimensions'].items():
+        aggregates[dimension], _ = _count_state(
+            counted[dimension][0],
+            lambda observed: pd.MultiIndex.from_arrays(
+                [labels.take(observed // n_days), days[observed % n_days]],
+                names=[dimension, 'days_after_tat_breach']
+            )
+        )
+        aggregates['levels'][dimension] = levels
+    
+    pickup_labels, delivery_labels = encoded['route'][1]
+    counts, delivered_days = counted['route']
+    route_state, observed = _count_state(
+        counts,
+        lambda observed: pd.MultiIndex.from_arrays(
+            [pickup_labels.take(observed // len(delivery_labels)), delivery_labels.take(observed % len(delivery_labels))],
+            names=['pickup_state', 'delivery_state']
+        )
+    )
+    route_state['delivered_days_sum'] = delivered_days[observed]
+    aggregates['route'] = route_state
+    
+    return aggregates
+
+def aggregate_breach_dimensions(breach_df, workers=None):
+    """
+    Single-pass aggregation stage for the daywise, payment, zone, route and
+    courier breakdowns.
+    
+    shipment_category is integer-coded once and every dimension is counted with
+    np.bincount on group codes. The result holds mergeable count states (total
+    and per-category counts) that the calculate_* functions turn into tables.
+    With workers > 1 the per-dimension counts run on a process pool that reads
+    the coded columns from shared memory.
+    """
+    workers = PARALLEL_WORKERS if workers is None else workers
+    with stage('encode_dimensions', rows_in=len(breach_df)):
+        encoded = _encode_breach_dimensions(breach_df)
+    tasks = _count_tasks(encoded)
+    arrays = _encoded_arrays(encoded)
+    
+    if workers > 1:
+        with stage('groupby_parallel', rows_in=len(breach_df) * len(tasks)):
+            counted = _count_in_process_pool(arrays, tasks, workers)
+    else:
+        counted = {}
+        for key, array_names, scalars in tasks:
+            with stage(f"groupby_{key}", rows_in=len(breach_df)):
+                counted[key] = _run_count_task(arrays, array_names, scalars)
+    
+    with stage('build_aggregates'):
+        return _build_aggregates(encoded, counted)
+
+def _run_count_task(arrays, array_names, scalars):
+    task_arrays = {arg: arrays[name] for arg, name in array_names.items()}
+    return _count_group_codes(arrays['category_codes'], **{'day_codes': None, **task_arrays}, **scalars)
+
+def _count_shared_task(shared_specs, array_names, scalars):
+    """
+    Process-pool entry point: attach to the shared coded columns and run one bincount task
+    """
+    blocks = []
+    arrays = {}
+    try:
+        for name in ['category_codes', *array_names.values()]:
+            block_name, shape, dtype = shared_specs[name]
+            block = shared_memory.SharedMemory(name=block_name)
+            blocks.append(block)
+            arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        
+        counts, delivered_days = _run_count_task(arrays, array_names, scalars)
+        # Copy results out before the shared buffers are released
+        return counts.copy(), None if delivered_days is None else delivered_days.copy()
+    finally:
+        del arrays
+        for block in blocks:
+            block.close()
+
+def _count_in_process_pool(arrays, tasks, workers):
+    """
+    Run the bincount tasks on a process pool; the coded columns are copied once
+    into shared memory and only their names are sent to the workers
+    """
+    print(f"⚙️  Aggregating {len(tasks)} dimensions on {workers} worker processes...")
+    blocks = []
+    try:
+        shared_specs = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            shared_specs[name] = (block.name, array.shape, array.dtype.str)
+        
+        # spawn: never fork a threaded web worker. The pool lives only for this
+        # call so it also shuts down cleanly inside background job workers.
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = {
+                key: executor.submit(_count_shared_task, shared_specs, array_names, scalars)
+                for key, array_names, scalars in tasks
+            }
+            return {key: future.result() for key, future in futures.items()}
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+AGGREGATE_STATES = ['days', *BREAKDOWN_DIMENSIONS, 'route']
+
+def merge_breach_aggregates(left, right):
+    """
+    Merge two aggregate states (counts and sums are additive; category levels union)
+    """
+    if left is None:
+        return right
+    if right is None:
+        return left
+    
+    merged = {'levels': {}}
+    for key in AGGREGATE_STATES:
+        combined = pd.concat([left[key], right[key]])
+        merged[key] = combined.groupby(level=list(range(combined.index.nlevels)), dropna=False).sum()
+    
+    for dimension in BREAKDOWN_DIMENSIONS:
+        left_levels = left['levels'][dimension]
+        right_levels = right['levels'][dimension]
+        if left_levels is None or right_levels is None:
+            merged['levels'][dimension] = None
+        else:
+            merged['levels'][dimension] = sorted(set(left_levels) | set(right_levels))
+    
+    return merged
+
+def subtract_breach_aggregates(left, right):
+    """
+    Remove right's counts from left (e.g. superseded shipments), dropping groups
+    whose count falls to zero
+    """
+    if right is None:
+        return left
+    
+    negated = {'levels': right['levels']}
+    for key in AGGREGATE_STATES:
+        negated[key] = -right[key]
+    
+    result = merge_breach_aggregates(left, negated)
+    for key in AGGREGATE_STATES:
+        result[key] = result[key][result[key]['total_shipments'] != 0]
+    return result
+
+def aggregate_breach_chunks(file_path, chunk_size=None, breach_sink=None, current_date=None):
+    """
+    Streaming analysis mode: classify each CSV chunk and merge its aggregate
+    state, keeping neither the full DataFrame nor the breach rows in memory.
+    Returns (aggregates, initial_total_records); aggregates is None when no
+    TAT breach cases are found. breach_sink, if given, is called with each
+    chunk's breach rows. chunk_size defaults to what the memory budget allows.
+    """
+    read_options = csv_read_options(file_path)
+    if chunk_size is None:
+        plan = plan_csv_read(file_path, read_options)
+        _print_read_plan(plan)
+        chunk_size = stream_chunk_rows(plan)
+    print(f"📊 Streaming dataset in chunks of {chunk_size:,} rows: {file_path}")
+    
+    # One reference date for every chunk so results match a single-pass run
+    current_date = current_date or datetime.now()
+    aggregates = None
+    levels = {}
+    initial_total_records = 0
+    breach_total = 0
+    
+    chunks = staged_chunks('load', read_csv_chunks(file_path, chunk_size, read_options))
+    for i, chunk in enumerate(chunks):
+        initial_total_records += len(chunk)
+        chunk.attrs['date_formats'] = read_options['date_format']
+        
+        # Category levels come from every row read, breached or not
+        for dimension in BREAKDOWN_DIMENSIONS:
+            if isinstance(chunk[dimension].dtype, pd.CategoricalDtype):
+                levels[dimension] = levels.get(dimension, set()) | set(chunk[dimension].cat.categories)
+            else:
+                levels[dimension] = None
+        
+        chunk = apply_effective_edd(chunk)
+        classify_tat_breaches(chunk, current_date)
+        with stage('breach_filter', rows_in=len(chunk)) as counts:
+            breach_chunk = chunk[chunk['tat_breach']].copy()
+            counts['rows_out'] = len(breach_chunk)
+        del chunk
+        
+        if len(breach_chunk) > 0:
+            breach_chunk['days_after_tat_breach'] = breach_chunk['days_after_tat_breach'].astype('float64')
+            breach_total += len(breach_chunk)
+            if breach_sink is not None:
+                breach_sink(breach_chunk)
+            chunk_aggregates = aggregate_breach_dimensions(breach_chunk, workers=1)
+            with stage('merge_aggregates'):
+                aggregates = merge_breach_aggregates(aggregates, chunk_aggregates)
+        del breach_chunk
+        
+        if i % 10 == 0:
+            print(f"Processed {initial_total_records:,} rows ({breach_total:,} TAT breaches so far)...")
+    
+    print(f"✅ Streamed {initial_total_records:,} records")
+    print(f"⚠️  TAT breach cases: {breach_total:,} records")
+    
+    if aggregates is None:
+        print("❌ No TAT breach cases found in the dataset")
+        return None, initial_total_records
+    
+    aggregates['levels'] = {
+        dimension: None if dimension_levels is None else sorted(dimension_levels)
+        for dimension, dimension_levels in levels.items()
+    }
+    
+    breach_rto_count = aggregates['days']['rto_count'].sum()
+    print(f"📊 RTO cases in TAT breach data: {breach_rto_count:,}")
+    print(f"📊 RTO percentage in TAT breach data: {(breach_rto_count/breach_total)*100:.2f}%")
+    
+    gc.collect()
+    return aggregates, initial_total_records
+
+def _dimension_day_table(aggregates, dimension):
+    """
+    Expand a (dimension, day) count state into the groupby-shaped result table
+    """
+    state = aggregates[dimension]
+    levels = aggregates['levels'][dimension]
+    
+    if levels is not None:
+        # Categorical groupby reports every category/day combination
+        full_index = pd.MultiIndex.from_product(
+            [levels, aggregates['days'].index], names=state.index.names
+        )
+        state = state.reindex(full_index)
+    
+    table = state.reset_index()
+    if levels is not None:
+        table[dimension] = pd.Categorical(table[dimension], categories=levels)
+    
+    empty = table['total_shipments'].isna()
+    table['total_shipments'] = table['total_shipments'].fillna(0).astype(np.int64)
+    table['successful_deliveries'] = table['delivered_count'].fillna(0).astype(np.int64)
+    for col in CATEGORY_COUNT_COLUMNS:
+        # Category counts are missing (not zero) for empty combinations
+        table[col] = table[col] if empty.any() else table[col].astype(np.int64)
+    
+    return table[[dimension, 'days_after_tat_breach', 'total_shipments', 'successful_deliveries',
+                  'delivered_count', 'rto_count', 'undelivered_count']]
+
+def calculate_daywise_statistics(aggregates):
+    """
+    Calculate daywise statistics (starting from Day 1) from the aggregated counts
+    """
     print("📊 Calculating daywise statistics...")
-    daywise_stats = breach_df.groupby('days_after_tat_breach').agg(
-        total_shipments=('delivery_success', 'count'),
-        successful_deliveries=('delivery_success', 'sum'),
-        failed_deliveries=('delivery_success', lambda x: len(x) - sum(x)),
-        delivered_count=('shipment_category', lambda x: sum(x == 'Delivered')),
-        rto_count=('shipment_category', lambda x: sum(x == 'RTO')),
-        damage_lost_count=('shipment_category', lambda x: sum(x == 'Damage/Lost')),
-        undelivered_count=('shipment_category', lambda x: sum(x == 'Undelivered'))
-    ).reset_index()
+    daywise_stats = aggregates['days'].reset_index()
+    daywise_stats['successful_deliveries'] = daywise_stats['delivered_count']
+    daywise_stats['failed_deliveries'] = daywise_stats['total_shipments'] - daywise_stats['successful_deliveries']
+    daywise_stats = daywise_stats[[
+        'days_after_tat_breach', 'total_shipments', 'successful_deliveries', 'failed_deliveries',
+        'delivered_count', 'rto_count', 'damage_lost_count', 'undelivered_count'
+    ]]
     
     daywise_stats['delivery_percentage'] = (daywise_stats['successful_deliveries'] / daywise_stats['total_shipments']) * 100
     daywise_stats['rto_rate'] = (daywise_stats['rto_count'] / daywise_stats['total_shipments']) * 100
     daywise_stats['drop_in_delivery_percentage'] = daywise_stats['delivery_percentage'].diff()
     
+    return daywise_stats
+
+def calculate_comprehensive_delivery_analysis_corrected(file_path):
+    """
+    Memory-optimized comprehensive delivery performance analysis
+    """
+    breach_df, initial_total_records = prepare_breach_dataset(file_path)
+    if breach_df is None:
+        return None, None, None
+    
+    daywise_stats = calculate_daywise_statistics(aggregate_breach_dimensions(breach_df))
+    
     return daywise_stats, breach_df, initial_total_records
 
-def calculate_payment_method_analysis(breach_df):
+def calculate_payment_method_analysis(breach_df, aggregates=None):
     """
     Calculate payment method performance analysis with memory optimization
     """
     print("\n💳 Calculating Payment Method Analysis...")
     
-    payment_performance = breach_df.groupby(['payment_method', 'days_after_tat_breach']).agg(
-        total_shipments=('delivery_success', 'count'),
-        successful_deliveries=('delivery_success', 'sum'),
-        delivered_count=('shipment_category', lambda x: sum(x == 'Delivered')),
-        rto_count=('shipment_category', lambda x: sum(x == 'RTO')),
-        undelivered_count=('shipment_category', lambda x: sum(x == 'Undelivered'))
-    ).reset_index()
+    if aggregates is None:
+        aggregates = aggregate_breach_dimensions(breach_df)
+    payment_performance = _dimension_day_table(aggregates, 'payment_method')
     
     payment_performance['delivery_percentage'] = (payment_performance['successful_deliveries'] / payment_performance['total_shipments']) * 100
     payment_performance['rto_rate'] = (payment_performance['rto_count'] / payment_performance['total_shipments']) * 100
@@ -237,19 +753,15 @@ def calculate_payment_method_analysis(breach_df):
     
     return payment_performance
 
-def calculate_zone_performance_analysis(breach_df):
+def calculate_zone_performance_analysis(breach_df, aggregates=None):
     """
     Calculate zone-wise performance analysis with memory optimization
     """
     print("\n🗺️  Calculating Zone Performance Analysis...")
     
-    zone_performance = breach_df.groupby(['applied_zone', 'days_after_tat_breach']).agg(
-        total_shipments=('delivery_success', 'count'),
-        successful_deliveries=('delivery_success', 'sum'),
-        delivered_count=('shipment_category', lambda x: sum(x == 'Delivered')),
-        rto_count=('shipment_category', lambda x: sum(x == 'RTO')),
-        undelivered_count=('shipment_category', lambda x: sum(x == 'Undelivered'))
-    ).reset_index()
+    if aggregates is None:
+        aggregates = aggregate_breach_dimensions(breach_df)
+    zone_performance = _dimension_day_table(aggregates, 'applied_zone')
     
     zone_performance['delivery_percentage'] = (zone_performance['successful_deliveries'] / zone_performance['total_shipments']) * 100
     zone_performance['rto_rate'] = (zone_performance['rto_count'] / zone_performance['total_shipments']) * 100
@@ -257,24 +769,25 @@ def calculate_zone_performance_analysis(breach_df):
     
     return zone_performance
 
-def calculate_route_performance_analysis(breach_df):
+def calculate_route_performance_analysis(breach_df, aggregates=None):
     """
     Calculate route performance analysis with meaningful aggregations
     """
     print("\n🛣️  Calculating Route Performance Analysis...")
     
-    # Create route combinations (pickup_state -> delivery_state)
-    breach_df['route'] = breach_df['pickup_state'].astype(str) + ' → ' + breach_df['delivery_state'].astype(str)
+    if aggregates is None:
+        aggregates = aggregate_breach_dimensions(breach_df)
+    route_state = aggregates['route']
     
-    # Get overall route performance (not day-wise to avoid too much granularity)
-    route_summary = breach_df.groupby('route').agg(
-        total_shipments=('delivery_success', 'count'),
-        successful_deliveries=('delivery_success', 'sum'),
-        delivered_count=('shipment_category', lambda x: sum(x == 'Delivered')),
-        rto_count=('shipment_category', lambda x: sum(x == 'RTO')),
-        undelivered_count=('shipment_category', lambda x: sum(x == 'Undelivered')),
-        avg_days_to_delivery=('days_after_tat_breach', lambda x: x[breach_df.loc[x.index, 'shipment_category'] == 'Delivered'].mean())
-    ).reset_index()
+    # Get overall route performance (not day-wise to avoid too much granularity),
+    # ordered by route label as the table has always been before sorting
+    route_summary = route_state.iloc[_route_label_order(route_state.index)].reset_index()
+    route_summary['successful_deliveries'] = route_summary['delivered_count']
+    route_summary['avg_days_to_delivery'] = route_summary['delivered_days_sum'] / route_summary['delivered_count'].replace(0, np.nan)
+    route_summary = route_summary[[
+        'pickup_state', 'delivery_state', 'total_shipments', 'successful_deliveries', 'delivered_count',
+        'rto_count', 'undelivered_count', 'avg_days_to_delivery'
+    ]]
     
     # Calculate performance metrics
     route_summary['delivery_percentage'] = (route_summary['delivered_count'] / route_summary['total_shipments']) * 100
@@ -291,21 +804,17 @@ def calculate_route_performance_analysis(breach_df):
     ].reset_index(drop=True)
     
     # Add route performance categories
-    def categorize_route_performance(row):
-        delivery_rate = row['delivery_percentage']
-        if delivery_rate >= 80:
-            return 'Excellent'
-        elif delivery_rate >= 60:
-            return 'Good'
-        elif delivery_rate >= 40:
-            return 'Average'
-        else:
-            return 'Poor'
-    
-    route_summary['performance_category'] = route_summary.apply(categorize_route_performance, axis=1)
+    delivery_rate = route_summary['delivery_percentage']
+    route_summary['performance_category'] = np.select(
+        [delivery_rate >= 80, delivery_rate >= 60, delivery_rate >= 40],
+        ['Excellent', 'Good', 'Average'],
+        default='Poor'
+    )
     
-    # Separate pickup and delivery states for better analysis
-    route_summary[['pickup_state', 'delivery_state']] = route_summary['route'].str.split(' → ', expand=True)
+    # Route labels for the kept rows only (missing states read 'nan')
+    route_summary['pickup_state'] = route_summary['pickup_state'].astype(str)
+    route_summary['delivery_state'] = route_summary['delivery_state'].astype(str)
+    route_summary['route'] = route_summary['pickup_state'] + ' → ' + route_summary['delivery_state']
     
     # Reorder columns for better readability
     column_order = [
@@ -322,19 +831,24 @@ def calculate_route_performance_analysis(breach_df):
     return route_summary
 
 
-def calculate_parent_courier_performance(breach_df):
+def _route_label_order(route_index):
+    """
+    Positions that sort a (pickup_state, delivery_state) index by its
+    'pickup → delivery' label, ranking each end separately
+    """
+    pickup_rank = pd.factorize(route_index.get_level_values('pickup_state').astype(str) + ' → ', sort=True)[0]
+    delivery_rank = pd.factorize(route_index.get_level_values('delivery_state').astype(str), sort=True)[0]
+    return np.lexsort([delivery_rank, pickup_rank])
+
+def calculate_parent_courier_performance(breach_df, aggregates=None):
     """
     Calculate parent courier performance with memory optimization
     """
     print("\n📦 Calculating Parent Courier Performance...")
     
-    courier_stats = breach_df.groupby(['parent_courier_name', 'days_after_tat_breach']).agg(
-        total_shipments=('delivery_success', 'count'),
-        successful_deliveries=('delivery_success', 'sum'),
-        delivered_count=('shipment_category', lambda x: sum(x == 'Delivered')),
-        rto_count=('shipment_category', lambda x: sum(x == 'RTO')),
-        undelivered_count=('shipment_category', lambda x: sum(x == 'Undelivered'))
-    ).reset_index()
+    if aggregates is None:
+        aggregates = aggregate_breach_dimensions(breach_df)
+    courier_stats = _dimension_day_table(aggregates, 'parent_courier_name')
     
     courier_stats['delivery_percentage'] = (courier_stats['successful_deliveries'] / courier_stats['total_shipments']) * 100
     courier_stats['rto_rate'] = (courier_stats['rto_count'] / courier_stats['total_shipments']) * 100
@@ -342,24 +856,60 @@ def calculate_parent_courier_performance(breach_df):
     
     return courier_stats
 
-def analyze_comprehensive_delivery_performance_corrected(file_path):
+def calculate_result_tables(aggregates, breach_df=None):
+    """
+    The daywise, payment, zone, route and courier tables from one aggregate state
+    """
+    with stage('daywise_table') as counts:
+        daywise_stats = calculate_daywise_statistics(aggregates)
+        counts['rows_out'] = len(daywise_stats)
+    with stage('payment_method_table') as counts:
+        payment_perf = calculate_payment_method_analysis(breach_df, aggregates)
+        counts['rows_out'] = len(payment_perf)
+    with stage('zone_table') as counts:
+        zone_perf = calculate_zone_performance_analysis(breach_df, aggregates)
+        counts['rows_out'] = len(zone_perf)
+    with stage('route_table') as counts:
+        route_perf = calculate_route_performance_analysis(breach_df, aggregates)
+        counts['rows_out'] = len(route_perf)
+    with stage('courier_table') as counts:
+        courier_stats = calculate_parent_courier_performance(breach_df, aggregates)
+        counts['rows_out'] = len(courier_stats)
+    return daywise_stats, payment_perf, zone_perf, route_perf, courier_stats
+
+def analyze_comprehensive_delivery_performance_corrected(file_path, streaming=None, workers=None, breach_sink=None):
     """
     Main function with memory-optimized comprehensive analysis
+    
+    streaming=True aggregates the file chunk by chunk so peak memory is bounded
+    by the chunk size; None (default) streams files whose in-memory analysis
+    would exceed the memory budget.
+    workers > 1 runs the per-dimension aggregation on a process pool
+    (default ANALYSIS_PARALLEL_WORKERS). breach_sink, if given, receives the
+    TAT breach rows (once, or per chunk when streaming), e.g. to index them.
     """
     try:
         print("🚀 Starting Memory-Optimized Comprehensive Delivery Performance Analysis...")
         print("(TAT Breach Analysis starts from Day 1 - True Breach Cases Only)")
         print("=" * 100)
         
-        # Calculate main statistics with memory optimization
-        daywise_stats, breach_df, initial_total_records = calculate_comprehensive_delivery_analysis_corrected(file_path)
+        if streaming is None:
+            streaming = should_stream(file_path)
+        
+        if streaming:
+            # Streaming mode never materializes breach_df
+            breach_df = None
+            aggregates, initial_total_records = aggregate_breach_chunks(file_path, breach_sink=breach_sink)
+        else:
+            # Load and classify with memory optimization
+            breach_df, initial_total_records = prepare_breach_dataset(file_path)
+            if breach_df is not None and breach_sink is not None:
+                breach_sink(breach_df)
+            aggregates = aggregate_breach_dimensions(breach_df, workers) if breach_df is not None else None
         
-        if daywise_stats is not None and not daywise_stats.empty:
-            # Calculate all performance analyses
-            payment_perf = calculate_payment_method_analysis(breach_df)
-            zone_perf = calculate_zone_performance_analysis(breach_df)
-            route_perf = calculate_route_performance_analysis(breach_df)
-            courier_stats = calculate_parent_courier_performance(breach_df)
+        if aggregates is not None:
+            # Single aggregation stage shared by all performance analyses
+            daywise_stats, payment_perf, zone_perf, route_perf, courier_stats = calculate_result_tables(aggregates, breach_df)
             
             print("✅ Memory-Optimized Comprehensive analysis completed successfully!")
             
@@ -367,7 +917,7 @@ def analyze_comprehensive_delivery_performance_corrected(file_path):
         else:
             print("❌ No analysis could be performed due to insufficient data.")
             return None, None, None, None, None
-            
+    
     except Exception as e:
         print(f"❌ Error during analysis: {str(e)}")
         return None, None, None, None, None
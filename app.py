@@ -1,13 +1,34 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, send_file, flash, jsonify, Response, stream_with_context
 import os
-import pandas as pd
-import numpy as np
 from datetime import datetime
 from werkzeug.utils import secure_filename
 import zipfile
 import io
 import gc
-from analysis import analyze_comprehensive_delivery_performance_corrected
+import json
+import time
+from result_cache import (
+    RESULT_TABLES, result_cache_key, load_cached_results, load_cached_table, cached_result_tables
+)
+from jobs import submit_analysis_job, submit_batch_job, get_job_status, get_job_results
+from instrumentation import profile_run, stage, metrics_summary, load_profile
+from result_views import (
+    RESULT_VIEWS, DEFAULT_PAGE_SIZE, DOWNLOAD_FORMATS, ResultQueryError, load_result_view, query_result_view,
+    render_result_table
+)
+from breach_index import INDEX_DIMENSIONS, BreachQueryError, breach_index_exists, load_breach_index, query_breach_index
+from comparison import (
+    COMPARISON_VIEWS, ComparisonError, compare_results, compare_index_segments, parse_edd_window, comparison_records
+)
+from edd_calendar import (
+    CALENDAR_BUCKETS, CALENDAR_DIMENSIONS, DEFAULT_ROLLING_WINDOW, CalendarQueryError, query_edd_calendar
+)
+from upload_sessions import (
+    MAX_UPLOAD_BYTES, UploadError, create_upload_session, get_upload_session, write_upload_chunk,
+    complete_upload_session, delete_upload_session
+)
+from compressed_input import EXPORT_EXTENSIONS, export_base_name, is_export_file
+from storage import register_files, register_upload, touch_analysis, start_storage_cleanup
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your-fallback-secret-key')
@@ -15,10 +36,23 @@ app.secret_key = os.environ.get('SECRET_KEY', 'your-fallback-secret-key')
 # Configuration for large files
 UPLOAD_FOLDER = 'uploads'
 DOWNLOAD_FOLDER = 'downloads'
-ALLOWED_EXTENSIONS = {'csv'}
+RESULT_CACHE_FOLDER = 'cache'
+JOB_FOLDER = 'jobs'
+PROFILE_FOLDER = 'profiles'
+BREACH_INDEX_FOLDER = 'breach_index'
+ALLOWED_EXTENSIONS = set(EXPORT_EXTENSIONS)
+ZIP_STREAM_BLOCK_SIZE = 64 * 1024
 
-app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', 'uploads')
-app.config['DOWNLOAD_FOLDER'] = os.environ.get('DOWNLOAD_FOLDER', 'downloads')
+app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', UPLOAD_FOLDER)
+app.config['UPLOAD_SESSION_FOLDER'] = os.environ.get('UPLOAD_SESSION_FOLDER', os.path.join('uploads', '.sessions'))
+app.config['DOWNLOAD_FOLDER'] = os.environ.get('DOWNLOAD_FOLDER', DOWNLOAD_FOLDER)
+app.config['RESULT_CACHE_FOLDER'] = os.environ.get('RESULT_CACHE_FOLDER', RESULT_CACHE_FOLDER)
+app.config['JOB_FOLDER'] = os.environ.get('JOB_FOLDER', JOB_FOLDER)
+app.config['PROFILE_FOLDER'] = os.environ.get('PROFILE_FOLDER', PROFILE_FOLDER)
+app.config['BREACH_INDEX_FOLDER'] = os.environ.get('BREACH_INDEX_FOLDER', BREACH_INDEX_FOLDER)
+app.config['STORAGE_INDEX_FOLDER'] = os.environ.get('STORAGE_INDEX_FOLDER', 'storage')
+app.config['BREACH_INDEX_MAX_BYTES'] = int(os.environ.get('BREACH_INDEX_MAX_MB', 1000)) * 1024 * 1024
+app.config['RESULT_CACHE_MAX_BYTES'] = int(os.environ.get('RESULT_CACHE_MAX_MB', 500)) * 1024 * 1024
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
 
@@ -26,9 +60,22 @@ app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
 import socket
 socket.setdefaulttimeout(1200)  # 20 minutes timeout
 
-# Create directories if they don't exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
+# Create directories if they don't exist (wherever the environment points them)
+os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+os.makedirs(app.config['UPLOAD_SESSION_FOLDER'], exist_ok=True)
+os.makedirs(app.config['DOWNLOAD_FOLDER'], exist_ok=True)
+os.makedirs(app.config['RESULT_CACHE_FOLDER'], exist_ok=True)
+os.makedirs(app.config['JOB_FOLDER'], exist_ok=True)
+os.makedirs(app.config['PROFILE_FOLDER'], exist_ok=True)
+os.makedirs(app.config['BREACH_INDEX_FOLDER'], exist_ok=True)
+os.makedirs(app.config['STORAGE_INDEX_FOLDER'], exist_ok=True)
+
+# Uploads and downloads are indexed per analysis and expire in the background
+start_storage_cleanup(
+    app.config['STORAGE_INDEX_FOLDER'],
+    [app.config['UPLOAD_FOLDER'], app.config['DOWNLOAD_FOLDER']],
+    app.config['UPLOAD_SESSION_FOLDER']
+)
 
 # MongoDB configuration
 app.config['MONGODB_URI'] = os.environ.get('MONGODB_URI', 'mongodb://localhost:27017/delivery_analytics')
@@ -42,11 +89,17 @@ app.config['WTF_CSRF_ENABLED'] = True
 app.config['WTF_CSRF_SECRET_KEY'] = os.environ.get('CSRF_SECRET_KEY', 'csrf-secret-key') 
 
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    # Compressed exports (.csv.gz, .csv.zst, .zip) are decompressed as they are read
+    return is_export_file(filename)
+
+def upload_filename(original_filename):
+    """Timestamped, sanitized name an upload is stored under"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return f"{timestamp}_{secure_filename(original_filename)}"
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_template('index.html', max_upload_mb=MAX_UPLOAD_BYTES // (1024 * 1024))
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -62,9 +115,7 @@ def upload_file():
             return redirect(url_for('index'))
         
         if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"{timestamp}_{filename}"
+            filename = upload_filename(file.filename)
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             
             # Check file size before processing
@@ -79,16 +130,125 @@ def upload_file():
             
             # Save file efficiently
             file.save(filepath)
+            register_upload(app.config['STORAGE_INDEX_FOLDER'], filepath)
             
             return redirect(url_for('analyze', filename=filename))
         else:
-            flash('Please upload a CSV file only')
+            flash('Please upload a CSV file only (.csv, .csv.gz, .csv.zst or .zip)')
             return redirect(url_for('index'))
     
     except Exception as e:
         flash(f'Error uploading file: {str(e)}')
         return redirect(url_for('index'))
 
+@app.route('/batch', methods=['POST'])
+def batch_upload():
+    """
+    Analyze several exports (uploaded together, or already uploaded and named
+    in the 'uploads' field) as one combined dataset
+    """
+    try:
+        files = [file for file in request.files.getlist('files') if file.filename]
+        if any(not allowed_file(file.filename) for file in files):
+            flash('Please upload CSV files only (.csv, .csv.gz, .csv.zst or .zip)')
+            return redirect(url_for('index'))
+        
+        filepaths = []
+        for file in files:
+            filename = upload_filename(file.filename)
+            file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+            filepaths.append(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+            register_upload(app.config['STORAGE_INDEX_FOLDER'], filepaths[-1])
+        for filename in request.form.getlist('uploads'):
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
+            if not os.path.exists(filepath):
+                flash(f'File not found: {filename}')
+                return redirect(url_for('index'))
+            touch_analysis(app.config['STORAGE_INDEX_FOLDER'], filename)
+            filepaths.append(filepath)
+        
+        if len(filepaths) < 2:
+            flash('Select at least two CSV files for a batch analysis')
+            return redirect(url_for('index'))
+        
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        job_id = submit_batch_job(
+            filepaths,
+            f"{timestamp}_batch_{len(filepaths)}_files.csv",
+            app.config['JOB_FOLDER'],
+            app.config['RESULT_CACHE_FOLDER'],
+            app.config['RESULT_CACHE_MAX_BYTES'],
+            app.config['PROFILE_FOLDER']
+        )
+        flash(f'{len(filepaths)} files uploaded! Starting batch analysis...')
+        return redirect(url_for('job_progress', job_id=job_id))
+    
+    except Exception as e:
+        flash(f'Error uploading files: {str(e)}')
+        return redirect(url_for('index'))
+
+@app.route('/upload/sessions', methods=['POST'])
+def create_chunked_upload():
+    """
+    Start a resumable upload: {"filename": ..., "size": bytes}. Chunks are then
+    PUT in order to /upload/sessions/<upload_id>?offset=<bytes received>.
+    """
+    data = request.get_json(silent=True) or {}
+    filename = str(data.get('filename') or '')
+    if not allowed_file(filename):
+        return jsonify({"error": "Please upload a CSV file only (.csv, .csv.gz, .csv.zst or .zip)"}), 400
+    
+    try:
+        session = create_upload_session(app.config['UPLOAD_SESSION_FOLDER'], filename, int(data.get('size') or 0))
+    except (UploadError, ValueError) as e:
+        return jsonify({"error": str(e)}), getattr(e, 'status', 400)
+    return jsonify(session), 201
+
+@app.route('/upload/sessions/<upload_id>', methods=['GET', 'PUT', 'DELETE'])
+def chunked_upload(upload_id):
+    """
+    GET: the offset to resume from. PUT: append the request body at ?offset=.
+    DELETE: abandon the upload.
+    """
+    session_folder = app.config['UPLOAD_SESSION_FOLDER']
+    try:
+        if request.method == 'GET':
+            return jsonify(get_upload_session(session_folder, upload_id))
+        if request.method == 'DELETE':
+            get_upload_session(session_folder, upload_id)
+            delete_upload_session(session_folder, upload_id)
+            return '', 204
+        
+        try:
+            offset = int(request.args.get('offset', ''))
+        except ValueError:
+            return jsonify({"error": "offset must be an integer"}), 400
+        # The body is streamed to disk, never buffered whole
+        session = write_upload_chunk(session_folder, upload_id, offset, request.stream, request.content_length)
+        return jsonify(session)
+    except UploadError as e:
+        return jsonify({"error": str(e), "offset": e.offset}), e.status
+
+@app.route('/upload/sessions/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    """
+    Store a fully received upload and return where to analyze it
+    """
+    session_folder = app.config['UPLOAD_SESSION_FOLDER']
+    try:
+        session = get_upload_session(session_folder, upload_id)
+        filename = upload_filename(session['filename'])
+        complete_upload_session(session_folder, upload_id, os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        register_upload(app.config['STORAGE_INDEX_FOLDER'], os.path.join(app.config['UPLOAD_FOLDER'], filename))
+    except UploadError as e:
+        return jsonify({"error": str(e), "offset": e.offset}), e.status
+    
+    if session['size'] > 100 * 1024 * 1024:  # 100MB+
+        flash('Large file detected. Processing may take 10-15 minutes. Please be patient...')
+    else:
+        flash('File uploaded successfully! Starting analysis...')
+    return jsonify({"filename": filename, "analyze_url": url_for('analyze', filename=filename)})
+
 @app.route('/analyze/<filename>')
 def analyze(filename):
     try:
@@ -97,71 +257,119 @@ def analyze(filename):
         if not os.path.exists(filepath):
             flash('File not found')
             return redirect(url_for('index'))
+        touch_analysis(app.config['STORAGE_INDEX_FOLDER'], filename)
         
-        # Force garbage collection before analysis
-        gc.collect()
-        
-        
-        # Run memory-optimized analysis
-        results = analyze_comprehensive_delivery_performance_corrected(filepath)
-        
-        # Force garbage collection after analysis
-        gc.collect()
+        # Identical exports (refreshes, re-uploads) reuse the cached results
+        with profile_run('render', filename, app.config['PROFILE_FOLDER']) as profile:
+            with stage('content_hash'):
+                cache_key = result_cache_key(filepath)
+            with stage('cache_load'):
+                results = load_cached_results(app.config['RESULT_CACHE_FOLDER'], cache_key)
+            profile.info['cache_hit'] = results is not None
+            if results is not None and breach_index_exists(app.config['BREACH_INDEX_FOLDER'], cache_key):
+                return render_analysis_results(filename, cache_key, results)
         
-        if results is None or results[0] is None:
-            flash('Analysis failed. Please check your data format and ensure all required columns are present.')
+        # Anything else (including a cached result whose breach index was evicted) runs on the background worker pool
+        job_id = submit_analysis_job(
+            filepath,
+            app.config['JOB_FOLDER'],
+            app.config['RESULT_CACHE_FOLDER'],
+            app.config['RESULT_CACHE_MAX_BYTES'],
+            app.config['PROFILE_FOLDER'],
+            app.config['BREACH_INDEX_FOLDER'],
+            app.config['BREACH_INDEX_MAX_BYTES']
+        )
+        return redirect(url_for('job_progress', job_id=job_id))
+    
+    except Exception as e:
+        flash(f'Analysis error: {str(e)}')
+        return redirect(url_for('index'))
+
+@app.route('/jobs/<job_id>')
+def job_progress(job_id):
+    status = get_job_status(job_id, app.config['JOB_FOLDER'])
+    if status is None:
+        flash('Analysis job not found')
+        return redirect(url_for('index'))
+    
+    return render_template('processing.html', job=status)
+
+@app.route('/jobs/<job_id>/status')
+def job_status(job_id):
+    status = get_job_status(job_id, app.config['JOB_FOLDER'])
+    if status is None:
+        return jsonify({"status": "unknown", "job_id": job_id}), 404
+    
+    status['results_url'] = url_for('job_results', job_id=job_id)
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/results')
+def job_results(job_id):
+    try:
+        status = get_job_status(job_id, app.config['JOB_FOLDER'])
+        if status is None:
+            flash('Analysis job not found')
             return redirect(url_for('index'))
         
-        daywise_results, payment_results, zone_results, route_results, courier_results, initial_total_records = results
-        
-        # Generate download files
-        download_files = generate_download_files(filename, (daywise_results, payment_results, zone_results, route_results, courier_results))
-        
-        # Prepare data for display
-        analysis_data = prepare_display_data((daywise_results, payment_results, zone_results, route_results, courier_results), initial_total_records)
-        
-        # Clean up memory
-        del results
-        gc.collect()
+        if status['status'] in ('queued', 'running'):
+            return redirect(url_for('job_progress', job_id=job_id))
         
-        return render_template('results.html', 
-                             analysis_data=analysis_data,
-                             download_files=download_files,
-                             filename=filename)
+        # The status already carries the job's filename; no second job lookup
+        filename = status['filename']
+        with profile_run('render', filename, app.config['PROFILE_FOLDER']):
+            with stage('cache_load'):
+                job_results = get_job_results(job_id, app.config['RESULT_CACHE_FOLDER'], app.config['JOB_FOLDER'])
+            if job_results is None:
+                flash(status['message'])
+                return redirect(url_for('index'))
+            
+            cache_key, results = job_results
+            if results is None:
+                flash('Analysis results have expired. Please run the analysis again.')
+                return redirect(url_for('index'))
+            
+            return render_analysis_results(filename, cache_key, results)
     
     except Exception as e:
         flash(f'Analysis error: {str(e)}')
         return redirect(url_for('index'))
 
-def generate_download_files(filename, results):
-    """Generate CSV files for download with memory optimization"""
-    try:
-        daywise_results, payment_results, zone_results, route_results, courier_results = results
+def render_analysis_results(filename, cache_key, results):
+    """Render the results dashboard for an analysis results tuple"""
+    daywise_results, payment_results, zone_results, route_results, courier_results, initial_total_records = results
+    
+    with profile_run('render', filename, app.config['PROFILE_FOLDER']):
+        # Register download files
+        with stage('download_manifest'):
+            download_files = generate_download_files(filename, cache_key, (daywise_results, payment_results, zone_results, route_results, courier_results))
         
-        base_name = filename.replace('.csv', '')
-        download_files = []
+        # Prepare data for display
+        with stage('display_data', rows_in=sum(len(table) for table in results[:5] if table is not None)):
+            analysis_data = prepare_display_data((daywise_results, payment_results, zone_results, route_results, courier_results), initial_total_records)
         
-        # Save each analysis result efficiently
-        analyses = {
-            'daywise_analysis': daywise_results,
-            'payment_method_analysis': payment_results,
-            'zone_performance_analysis': zone_results,
-            'route_performance_analysis': route_results,
-            'courier_performance_analysis': courier_results
-        }
+        # Clean up memory
+        with stage('gc_collect'):
+            del results
+            gc.collect()
+        
+        with stage('html_render'):
+            return render_template('results.html', 
+                                 analysis_data=analysis_data,
+                                 download_files=download_files,
+                                 filename=filename,
+                                 base_name=export_base_name(filename))
+
+def generate_download_files(filename, cache_key, results):
+    """Register the CSV downloads of an analysis; the tables themselves live in the result cache"""
+    try:
+        base_name = export_base_name(filename)
+        download_files = [
+            f"{base_name}_{analysis_name}.csv"
+            for analysis_name, data in zip(RESULT_TABLES, results)
+            if data is not None and not data.empty
+        ]
         
-        for analysis_name, data in analyses.items():
-            if data is not None and not data.empty:
-                download_filename = f"{base_name}_{analysis_name}.csv"
-                download_path = os.path.join(app.config['DOWNLOAD_FOLDER'], download_filename)
-                
-                # Write in chunks to save memory
-                data.to_csv(download_path, index=False, chunksize=1000)
-                download_files.append(download_filename)
-                
-                # Clean up memory
-                del data
-                gc.collect()
+        write_download_manifest(base_name, cache_key, download_files)
         
         return download_files
     
@@ -169,8 +377,47 @@ def generate_download_files(filename, results):
         print(f"Error generating download files: {e}")
         return []
 
+def _manifest_path(base_name):
+    return os.path.join(app.config['DOWNLOAD_FOLDER'], f"{secure_filename(base_name)}_manifest.json")
+
+def write_download_manifest(base_name, cache_key, download_files):
+    """Record the result cache entry and files of an analysis so downloads never scan the folder"""
+    manifest = {
+        'base_name': base_name,
+        'result_key': cache_key,
+        'created_at': datetime.now().isoformat(),
+        'files': download_files
+    }
+    with open(_manifest_path(base_name), 'w') as f:
+        json.dump(manifest, f)
+    register_files(app.config['STORAGE_INDEX_FOLDER'], base_name, [_manifest_path(base_name)])
+
+def read_download_manifest(base_name):
+    """Download manifest of an analysis, or None when there is no manifest"""
+    try:
+        with open(_manifest_path(base_name)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    touch_analysis(app.config['STORAGE_INDEX_FOLDER'], base_name)
+    return manifest
+
+def split_download_filename(filename):
+    """Split '<base>_<table>.<format>' into (base, table, format), or None"""
+    stem, _, file_format = filename.rpartition('.')
+    for table in RESULT_TABLES:
+        if stem.endswith(f"_{table}") and file_format in DOWNLOAD_FORMATS:
+            return stem[:-len(table) - 1], table, file_format
+    return None
+
+def load_download_table(manifest, table):
+    """Result table behind a manifest entry, or None once the cache entry is evicted"""
+    if not manifest.get('result_key'):
+        return None
+    return load_cached_table(app.config['RESULT_CACHE_FOLDER'], manifest['result_key'], table)
+
 def prepare_display_data(results, initial_total_records):
-    """Prepare data for web display with summary statistics"""
+    """Summary statistics for the dashboard; the tables are fetched as JSON pages"""
     try:
         daywise_results, payment_results, zone_results, route_results, courier_results = results
         
@@ -191,15 +438,6 @@ def prepare_display_data(results, initial_total_records):
             analysis_data['breach_cases'] = f"{total_breach_cases:,}"
             analysis_data['delivery_rate'] = f"{delivery_rate:.1f}%"
             analysis_data['rto_rate'] = f"{rto_rate:.1f}%"
-            
-            # Process daywise data for display
-            daywise_display = daywise_results.head(15).copy()
-            daywise_display['delivery_percentage'] = daywise_display['delivery_percentage'].apply(lambda x: f"{x:.2f}%")
-            daywise_display['drop_in_delivery_percentage'] = daywise_display['drop_in_delivery_percentage'].apply(
-                lambda x: f"{x:+.2f}%" if pd.notna(x) else "N/A"
-            )
-            analysis_data['daywise'] = daywise_display.to_html(classes='table table-striped', index=False)
-            del daywise_display
         else:
             # Set default values when no data
             analysis_data['total_records'] = f"{initial_total_records:,}" if initial_total_records else "0"
@@ -207,47 +445,11 @@ def prepare_display_data(results, initial_total_records):
             analysis_data['delivery_rate'] = "0%"
             analysis_data['rto_rate'] = "0%"
         
-        # Process payment method data
-        if payment_results is not None and not payment_results.empty:
-            payment_summary = payment_results.groupby('payment_method').agg({
-                'total_shipments': 'sum',
-                'delivered_count': 'sum',
-                'rto_count': 'sum',
-                'delivery_percentage': 'mean'
-            }).reset_index()
-            payment_summary['delivery_percentage'] = (payment_summary['delivered_count'] / payment_summary['total_shipments'] * 100)
-            payment_summary['delivery_percentage'] = payment_summary['delivery_percentage'].apply(lambda x: f"{x:.2f}%")
-            analysis_data['payment'] = payment_summary.to_html(classes='table table-striped', index=False)
-            del payment_summary
-        
-        # Process zone data
-        if zone_results is not None and not zone_results.empty:
-            zone_summary = zone_results.groupby('applied_zone').agg({
-                'total_shipments': 'sum',
-                'delivered_count': 'sum',
-                'rto_count': 'sum',
-                'delivery_percentage': 'mean'
-            }).reset_index()
-            zone_summary['delivery_percentage'] = (zone_summary['delivered_count'] / zone_summary['total_shipments'] * 100)
-            zone_summary['delivery_percentage'] = zone_summary['delivery_percentage'].apply(lambda x: f"{x:.2f}%")
-            analysis_data['zone'] = zone_summary.to_html(classes='table table-striped', index=False)
-            del zone_summary
-        
-        # Process courier data
-        if courier_results is not None and not courier_results.empty:
-            courier_summary = courier_results.groupby('parent_courier_name').agg({
-                'total_shipments': 'sum',
-                'delivered_count': 'sum',
-                'rto_count': 'sum',
-                'delivery_percentage': 'mean'
-            }).reset_index()
-            courier_summary['delivery_percentage'] = (courier_summary['delivered_count'] / courier_summary['total_shipments'] * 100)
-            courier_summary['delivery_percentage'] = courier_summary['delivery_percentage'].apply(lambda x: f"{x:.2f}%")
-            analysis_data['courier'] = courier_summary.to_html(classes='table table-striped', index=False)
-            del courier_summary
-        
-        # Force garbage collection
-        gc.collect()
+        # Sections to show; their rows are loaded page by page from the results API
+        analysis_data['tables'] = {
+            view: data is not None and not data.empty
+            for view, data in zip(['daywise', 'payment', 'zone', 'route', 'courier'], results)
+        }
         
         return analysis_data
     
@@ -258,42 +460,310 @@ def prepare_display_data(results, initial_total_records):
             'total_records': f"{initial_total_records:,}" if 'initial_total_records' in locals() else "0",
             'breach_cases': "0", 
             'delivery_rate': "0%",
-            'rto_rate': "0%"
+            'rto_rate': "0%",
+            'tables': {}
         }
 
+@app.route('/api/results/<base_filename>/<view>')
+def result_table_page(base_filename, view):
+    """Sorted, filtered page of a result table: ?page=&per_page=&sort=&order=&<column>=&search="""
+    base_name = export_base_name(base_filename)
+    manifest = read_download_manifest(base_name)
+    if manifest is None or not manifest.get('result_key'):
+        return jsonify({"error": "analysis not found"}), 404
+    if view not in RESULT_VIEWS:
+        return jsonify({"error": f"unknown table: {view}", "tables": list(RESULT_VIEWS)}), 404
+    
+    with profile_run('api', f"{base_name}/{view}", app.config['PROFILE_FOLDER']):
+        with stage('cache_load'):
+            data = load_result_view(app.config['RESULT_CACHE_FOLDER'], manifest['result_key'], view)
+        if data is None:
+            return jsonify({"error": "analysis results have expired, please run the analysis again"}), 410
+        
+        args = request.args.to_dict()
+        try:
+            page = int(args.pop('page', 1))
+            per_page = int(args.pop('per_page', DEFAULT_PAGE_SIZE))
+            sort = args.pop('sort', None) or None
+            order = args.pop('order', 'asc')
+            with stage('table_query', rows_in=len(data)) as counts:
+                result = query_result_view(data, sort, order, page, per_page, filters=args)
+                counts['rows_out'] = len(result['rows'])
+        except (ValueError, ResultQueryError) as e:
+            return jsonify({"error": str(e)}), 400
+    
+    result['table'] = view
+    return jsonify(result)
+
+@app.route('/api/breaches/<base_filename>')
+def breach_drilldown(base_filename):
+    """
+    Drill-down over the indexed TAT breach rows of an analysis:
+    ?<dimension>=a,b&day_min=&day_max=&group_by=
+    """
+    base_name = export_base_name(base_filename)
+    manifest = read_download_manifest(base_name)
+    if manifest is None or not manifest.get('result_key'):
+        return jsonify({"error": "analysis not found"}), 404
+    
+    index = load_breach_index(app.config['BREACH_INDEX_FOLDER'], manifest['result_key'])
+    if index is None:
+        return jsonify({"error": "breach index not available, please run the analysis again"}), 410
+    
+    args = request.args.to_dict()
+    try:
+        day_min, day_max = args.pop('day_min', ''), args.pop('day_max', '')
+        day_min = int(day_min) if day_min else None
+        day_max = int(day_max) if day_max else None
+        group_by = args.pop('group_by', None) or None
+        filters = {dimension: [value.strip() for value in values.split(',')] for dimension, values in args.items() if values}
+        result = query_breach_index(index, filters, day_min, day_max, group_by)
+    except (ValueError, BreachQueryError) as e:
+        return jsonify({"error": str(e), "dimensions": INDEX_DIMENSIONS}), 400
+    
+    result['filters'] = filters
+    result['day_range'] = [day_min, day_max]
+    return jsonify(result)
+
+def _comparison_views(args, default=None):
+    views = args.pop('views', '')
+    return [view.strip() for view in views.split(',') if view.strip()] if views else default
+
+@app.route('/api/compare/<base_filename>/<other_base_filename>')
+def compare_analyses(base_filename, other_base_filename):
+    """
+    Compare two analyses (baseline, then current) per day, courier, zone,
+    payment method and route from their cached results: ?views=
+    """
+    started = time.perf_counter()
+    keys = []
+    for name in (base_filename, other_base_filename):
+        manifest = read_download_manifest(export_base_name(name))
+        if manifest is None or not manifest.get('result_key'):
+            return jsonify({"error": f"analysis not found: {name}"}), 404
+        keys.append(manifest['result_key'])
+    
+    try:
+        comparison = compare_results(
+            app.config['RESULT_CACHE_FOLDER'], *keys, views=_comparison_views(request.args.to_dict()),
+            index_dir=app.config['BREACH_INDEX_FOLDER']
+        )
+    except ComparisonError as e:
+        return jsonify({"error": str(e), "views": list(COMPARISON_VIEWS)}), 400
+    if comparison is None:
+        return jsonify({"error": "analysis results have expired, please run the analysis again"}), 410
+    
+    result = comparison_records(comparison, started)
+    result['baseline'], result['current'] = base_filename, other_base_filename
+    return jsonify(result)
+
+@app.route('/api/compare/<base_filename>')
+def compare_segments(base_filename):
+    """
+    Compare two segments of one analysis from its breach index, either two
+    couriers (?courier_a=&courier_b=, optionally within ?edd_from=&edd_to=)
+    or two effective_edd periods (?baseline_from=&baseline_to=&current_from=&current_to=).
+    Other ?<dimension>=a,b filters apply to both sides; ?views= limits the views.
+    """
+    started = time.perf_counter()
+    base_name = export_base_name(base_filename)
+    manifest = read_download_manifest(base_name)
+    if manifest is None or not manifest.get('result_key'):
+        return jsonify({"error": "analysis not found"}), 404
+    
+    index = load_breach_index(app.config['BREACH_INDEX_FOLDER'], manifest['result_key'])
+    if index is None:
+        return jsonify({"error": "breach index not available, please run the analysis again"}), 410
+    
+    args = request.args.to_dict()
+    try:
+        courier_a, courier_b = args.pop('courier_a', ''), args.pop('courier_b', '')
+        window_args = {name: args.pop(name, '') for name in (
+            'edd_from', 'edd_to', 'baseline_from', 'baseline_to', 'current_from', 'current_to'
+        )}
+        views = _comparison_views(args)
+        filters = {dimension: [value.strip() for value in values.split(',')] for dimension, values in args.items() if values}
+        
+        if courier_a or courier_b:
+            if not (courier_a and courier_b):
+                raise ComparisonError('courier_a and courier_b must both be given')
+            # Each side is one courier, so there is no courier view to compare
+            views = views or [view for view in COMPARISON_VIEWS if view != 'courier']
+            window = parse_edd_window(window_args['edd_from'], window_args['edd_to'])
+            baseline = {'filters': {**filters, 'parent_courier_name': [courier_a]}, 'edd_window': window}
+            current = {'filters': {**filters, 'parent_courier_name': [courier_b]}, 'edd_window': window}
+        else:
+            baseline_window = parse_edd_window(window_args['baseline_from'], window_args['baseline_to'])
+            current_window = parse_edd_window(window_args['current_from'], window_args['current_to'])
+            if baseline_window == (None, None) or current_window == (None, None):
+                raise ComparisonError('Give courier_a and courier_b, or a baseline and a current date window')
+            baseline = {'filters': filters, 'edd_window': baseline_window}
+            current = {'filters': filters, 'edd_window': current_window}
+        
+        comparison = compare_index_segments(index, baseline, current, views)
+    except ComparisonError as e:
+        return jsonify({"error": str(e), "views": list(COMPARISON_VIEWS), "dimensions": INDEX_DIMENSIONS}), 400
+    
+    result = comparison_records(comparison, started)
+    result['filters'] = filters
+    if courier_a:
+        result['baseline'], result['current'] = courier_a, courier_b
+    else:
+        result['baseline'] = [window_args['baseline_from'], window_args['baseline_to']]
+        result['current'] = [window_args['current_from'], window_args['current_to']]
+    return jsonify(result)
+
+@app.route('/api/calendar/<base_filename>')
+def edd_calendar(base_filename):
+    """
+    TAT breach counts, rates and rolling trends per effective_edd bucket from
+    the calendar cube of an analysis:
+    ?bucket=day|week|month&dimension=&values=a,b&edd_from=&edd_to=&window=
+    """
+    started = time.perf_counter()
+    base_name = export_base_name(base_filename)
+    manifest = read_download_manifest(base_name)
+    if manifest is None or not manifest.get('result_key'):
+        return jsonify({"error": "analysis not found"}), 404
+    
+    index = load_breach_index(app.config['BREACH_INDEX_FOLDER'], manifest['result_key'])
+    if index is None or index['calendar'] is None:
+        return jsonify({"error": "EDD calendar not available, please run the analysis again"}), 410
+    
+    args = request.args
+    try:
+        bucket = args.get('bucket', 'week')
+        dimension = args.get('dimension') or None
+        values = [value.strip() for value in args['values'].split(',')] if args.get('values') else None
+        window = int(args.get('window', DEFAULT_ROLLING_WINDOW))
+        edd_window = parse_edd_window(args.get('edd_from', ''), args.get('edd_to', ''))
+        with stage('calendar_query'):
+            data = query_edd_calendar(index['calendar'], index['labels'], dimension, bucket, edd_window, values, window)
+    except (ValueError, ComparisonError, CalendarQueryError) as e:
+        return jsonify({"error": str(e), "buckets": list(CALENDAR_BUCKETS), "dimensions": CALENDAR_DIMENSIONS}), 400
+    
+    return jsonify({
+        'bucket': bucket,
+        'dimension': dimension,
+        'window': window,
+        'edd_range': [args.get('edd_from') or None, args.get('edd_to') or None],
+        'columns': list(data.columns),
+        'rows': data.astype(object).where(data.notna(), None).to_numpy().tolist(),
+        'query_ms': round((time.perf_counter() - started) * 1000, 3)
+    })
 
 @app.route('/download/<filename>')
 def download_file(filename):
     try:
+        filename = secure_filename(filename)
+        
+        # Files written to disk by earlier versions are still served as-is
         file_path = os.path.join(app.config['DOWNLOAD_FOLDER'], filename)
         if os.path.exists(file_path):
             return send_file(file_path, as_attachment=True)
-        else:
+        
+        parts = split_download_filename(filename)
+        manifest = read_download_manifest(parts[0]) if parts else None
+        if manifest is None:
             flash('File not found')
             return redirect(url_for('index'))
+        
+        base_name, table, file_format = parts
+        with profile_run('download', filename, app.config['PROFILE_FOLDER']):
+            with stage('cache_load'):
+                data = load_download_table(manifest, table)
+            if data is None:
+                flash('Analysis results have expired. Please run the analysis again.')
+                return redirect(url_for('index'))
+            
+            return send_file(
+                io.BytesIO(render_result_table(data, file_format)),
+                mimetype=DOWNLOAD_FORMATS[file_format],
+                as_attachment=True,
+                download_name=filename
+            )
     except Exception as e:
         flash(f'Download error: {str(e)}')
         return redirect(url_for('index'))
 
+class _ZipStreamBuffer(io.RawIOBase):
+    """Unseekable sink for zipfile; stream_zip drains it after every block"""
+    def __init__(self):
+        self.chunks = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+    
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def stream_zip(entries):
+    """
+    Yield a ZIP archive piece by piece, holding at most one block of output in
+    memory. entries are (arcname, open_source) pairs; open_source() returns a
+    binary file object and is only called when the entry is written.
+    """
+    buffer = _ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for arcname, open_source in entries:
+            zinfo = zipfile.ZipInfo(arcname, datetime.now().timetuple()[:6])
+            zinfo.compress_type = zipfile.ZIP_DEFLATED
+            with open_source() as src, zf.open(zinfo, 'w') as dest:
+                for block in iter(lambda: src.read(ZIP_STREAM_BLOCK_SIZE), b''):
+                    dest.write(block)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            yield buffer.drain()
+    yield buffer.drain()
+
+def profiled_stream(kind, label, chunks):
+    """Run a streamed response body inside a profile run"""
+    with profile_run(kind, label, app.config['PROFILE_FOLDER']):
+        yield from chunks
+
 @app.route('/download_all/<base_filename>')
 def download_all_files(base_filename):
     try:
-        memory_file = io.BytesIO()
+        base_name = export_base_name(base_filename)
+        file_format = request.args.get('format', 'csv')
+        manifest = read_download_manifest(base_name)
+        if not manifest or not manifest['files'] or file_format not in DOWNLOAD_FORMATS:
+            flash('No result files found for this analysis. Please run the analysis again.')
+            return redirect(url_for('index'))
         
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-            download_folder = app.config['DOWNLOAD_FOLDER']
-            for filename in os.listdir(download_folder):
-                if filename.startswith(base_filename.replace('.csv', '')):
-                    file_path = os.path.join(download_folder, filename)
-                    zf.write(file_path, filename)
+        download_folder = app.config['DOWNLOAD_FOLDER']
+        cached_tables = None
+        if manifest.get('result_key'):
+            cached_tables = cached_result_tables(app.config['RESULT_CACHE_FOLDER'], manifest['result_key'])
         
-        memory_file.seek(0)
+        entries = []
+        for filename in manifest['files']:
+            file_path = os.path.join(download_folder, filename)
+            if file_format == 'csv' and os.path.exists(file_path):
+                entries.append((filename, lambda file_path=file_path: open(file_path, 'rb')))
+                continue
+            
+            _, table, _ = split_download_filename(filename)
+            if cached_tables is None or table not in cached_tables:
+                flash('Analysis results have expired. Please run the analysis again.')
+                return redirect(url_for('index'))
+            
+            entries.append((
+                f"{filename.rsplit('.', 1)[0]}.{file_format}",
+                lambda table=table: io.BytesIO(render_result_table(load_download_table(manifest, table), file_format))
+            ))
         
-        return send_file(
-            memory_file,
+        return Response(
+            stream_with_context(profiled_stream('download', f"{base_name}.zip", stream_zip(entries))),
             mimetype='application/zip',
-            as_attachment=True,
-            download_name=f"{base_filename.replace('.csv', '')}_analysis_results.zip"
+            headers={'Content-Disposition': f'attachment; filename="{secure_filename(base_name)}_analysis_results.zip"'}
         )
     
     except Exception as e:
@@ -316,10 +786,23 @@ def health():
         "status": "healthy", 
         "timestamp": datetime.now().isoformat(),
         "max_file_size_mb": app.config['MAX_CONTENT_LENGTH'] / (1024 * 1024),
-        "max_file_size_bytes": app.config['MAX_CONTENT_LENGTH']
+        "max_file_size_bytes": app.config['MAX_CONTENT_LENGTH'],
+        "max_chunked_upload_mb": MAX_UPLOAD_BYTES / (1024 * 1024)
     }
 
+@app.route('/metrics')
+def metrics():
+    """Per-stage timing and memory statistics from the most recent run profiles"""
+    return jsonify(metrics_summary(app.config['PROFILE_FOLDER']))
+
+@app.route('/metrics/profiles/<run_id>')
+def metrics_profile(run_id):
+    profile = load_profile(app.config['PROFILE_FOLDER'], run_id)
+    if profile is None:
+        return jsonify({"error": "profile not found", "run_id": run_id}), 404
+    return jsonify(profile)
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 10000))
-    print(f"Starting Flask app with 50MB limit and memory optimization")
+    print("Starting Flask app with 50MB limit and memory optimization")
     app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
@@ -0,0 +1,173 @@
+import glob
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+
+from analysis import (
+    should_stream, prepare_breach_dataset, aggregate_breach_chunks, aggregate_breach_dimensions,
+    merge_breach_aggregates, calculate_result_tables
+)
+from result_views import write_result_tables
+from compressed_input import is_export_file
+
+# Exports analyzed at once in a batch (1 = one after another, in-process)
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 2))
+
+# Optional per-value splits: split name -> export column
+SPLIT_COLUMNS = {'company': 'company_name'}
+
+def batch_input_files(paths):
+    """
+    CSV files (plain or compressed) named by paths, which may be files,
+    directories or glob patterns
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(file for file in glob.glob(os.path.join(path, '*')) if is_export_file(file)))
+        elif glob.has_magic(path):
+            # A pattern such as exports/* also matches manifests and notes
+            files.extend(sorted(file for file in glob.glob(path) if is_export_file(file)))
+        else:
+            files.append(path)
+    # A file named twice is analyzed once
+    return list(dict.fromkeys(files))
+
+def _split_label(value):
+    return 'Unknown' if pd.isna(value) else str(value)
+
+def _add_split_aggregates(splits, breach_df, columns):
+    """Merge breach_df's aggregate state per value of each split column into splits"""
+    for column in columns:
+        if column not in breach_df.columns:
+            continue
+        for value, group in breach_df.groupby(column, observed=True, dropna=False, sort=False):
+            label = _split_label(value)
+            splits[column][label] = merge_breach_aggregates(
+                splits[column].get(label), aggregate_breach_dimensions(group, workers=1)
+            )
+
+def aggregate_export(file_path, current_date, streaming=None, split_columns=()):
+    """
+    Batch worker: load and classify one export and return its aggregate state,
+    record count and (per split column) per-value aggregate states
+    """
+    if streaming is None:
+        streaming = should_stream(file_path)
+    splits = {column: {} for column in split_columns}
+    breach_sink = (lambda breach_df: _add_split_aggregates(splits, breach_df, split_columns)) if split_columns else None
+    
+    if streaming:
+        aggregates, records = aggregate_breach_chunks(file_path, breach_sink=breach_sink, current_date=current_date)
+    else:
+        breach_df, records = prepare_breach_dataset(file_path, current_date)
+        if records is None:
+            raise ValueError('the export could not be read')
+        aggregates = None
+        if breach_df is not None:
+            if breach_sink is not None:
+                breach_sink(breach_df)
+            aggregates = aggregate_breach_dimensions(breach_df, workers=1)
+    
+    return {'file': file_path, 'records': records or 0, 'aggregates': aggregates, 'splits': splits}
+
+def _tables(aggregates, records):
+    return (*calculate_result_tables(aggregates), records)
+
+def analyze_batch(file_paths, workers=None, streaming=None, split_by_file=False, split_by_company=False):
+    """
+    Analyze many exports as one dataset. Files are loaded and classified
+    concurrently on a worker pool and their aggregate states merged, so the
+    combined tables equal a single analysis of the concatenated exports.
+    
+    Returns {'combined': results, 'files': {file: results}, 'companies':
+    {company: results}, 'failed': [file]} where results is the usual
+    (daywise, payment, zone, route, courier, total_records) tuple; company
+    splits only see TAT breach rows, so their total_records is None.
+    """
+    workers = BATCH_WORKERS if workers is None else workers
+    split_columns = [SPLIT_COLUMNS['company']] if split_by_company else []
+    
+    # One reference date for every file so results match a single-file run
+    current_date = datetime.now()
+    print(f"📚 Batch analysis of {len(file_paths)} files on {min(workers, len(file_paths))} workers...")
+    
+    exports = []
+    failed = []
+    if workers > 1 and len(file_paths) > 1:
+        # spawn: never fork a threaded web worker
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = {
+                executor.submit(aggregate_export, path, current_date, streaming, split_columns): path
+                for path in file_paths
+            }
+            for future in as_completed(futures):
+                try:
+                    exports.append(future.result())
+                except Exception as e:
+                    print(f"❌ Error analyzing {futures[future]}: {e}")
+                    failed.append(futures[future])
+                    continue
+                print(f"✅ Batch: analyzed {len(exports) + len(failed)}/{len(file_paths)} files ({os.path.basename(futures[future])})")
+    else:
+        for path in file_paths:
+            try:
+                exports.append(aggregate_export(path, current_date, streaming, split_columns))
+            except Exception as e:
+                print(f"❌ Error analyzing {path}: {e}")
+                failed.append(path)
+                continue
+            print(f"✅ Batch: analyzed {len(exports) + len(failed)}/{len(file_paths)} files ({os.path.basename(path)})")
+    
+    # Merge in input order so the combined tables do not depend on completion order
+    exports.sort(key=lambda export: file_paths.index(export['file']))
+    print("🧮 Combining batch results...")
+    combined = None
+    company_aggregates = {}
+    for export in exports:
+        combined = merge_breach_aggregates(combined, export['aggregates'])
+        for label, aggregates in export['splits'].get(SPLIT_COLUMNS['company'], {}).items():
+            company_aggregates[label] = merge_breach_aggregates(company_aggregates.get(label), aggregates)
+    
+    total_records = sum(export['records'] for export in exports)
+    if combined is None:
+        print("❌ No TAT breach cases found in the batch")
+        return {'combined': None, 'files': {}, 'companies': {}, 'failed': failed}
+    
+    batch = {
+        'combined': _tables(combined, total_records),
+        'files': {},
+        'companies': {label: _tables(aggregates, None) for label, aggregates in sorted(company_aggregates.items())},
+        'failed': failed
+    }
+    if split_by_file:
+        batch['files'] = {
+            export['file']: _tables(export['aggregates'], export['records'])
+            for export in exports if export['aggregates'] is not None
+        }
+    
+    print(f"✅ Batch analysis completed: {total_records:,} records from {len(exports)} files")
+    return batch
+
+def _slug(label):
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', label).strip('_') or 'unknown'
+
+def write_batch_results(batch, output_dir, file_format='csv'):
+    """
+    Write the combined tables, and any per-file / per-company splits, in one
+    of DOWNLOAD_FORMATS
+    """
+    outputs = [('combined', batch['combined'])]
+    outputs += [(os.path.join('files', _slug(os.path.splitext(os.path.basename(path))[0])), results)
+                for path, results in batch['files'].items()]
+    outputs += [(os.path.join('companies', _slug(label)), results) for label, results in batch['companies'].items()]
+    
+    written = []
+    for name, results in outputs:
+        written.extend(write_result_tables(results, os.path.join(output_dir, name), file_format))
+    print(f"💾 Wrote {len(written)} tables to {output_dir}")
+    return written
@@ -0,0 +1,155 @@
+import argparse
+import io
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext, redirect_stdout
+
+from analysis import (
+    read_large_csv_optimized, apply_effective_edd, classify_tat_breaches, aggregate_breach_dimensions,
+    calculate_daywise_statistics, calculate_payment_method_analysis, calculate_zone_performance_analysis,
+    calculate_route_performance_analysis, calculate_parent_courier_performance,
+    analyze_comprehensive_delivery_performance_corrected
+)
+from instrumentation import current_rss_bytes
+from synthetic_data import generate_shipment_export, parse_row_count
+
+BENCHMARK_SIZES = ['10k', '1M', '10M']
+BENCHMARK_DATA_FOLDER = 'benchmark_data'
+
+# How often the peak RSS sampler polls, in seconds
+RSS_SAMPLE_INTERVAL = 0.01
+
+class _PeakRssSampler:
+    """Background thread recording the highest RSS seen while a stage runs"""
+    def __init__(self):
+        self.peak = current_rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def _run(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            self.peak = max(self.peak, current_rss_bytes())
+    
+    def __enter__(self):
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_bytes())
+
+def measure_stage(records, stage, func, rows_in=None, rows_out=len):
+    """
+    Run one pipeline stage, append its wall time, peak RSS and throughput to
+    records and return the stage result
+    """
+    rss_before = current_rss_bytes()
+    start = time.perf_counter()
+    with _PeakRssSampler() as sampler:
+        result = func()
+    seconds = time.perf_counter() - start
+    
+    rows_out = rows_out(result) if callable(rows_out) else rows_out
+    rows = rows_in if rows_in is not None else rows_out
+    records.append({
+        'stage': stage,
+        'seconds': round(seconds, 4),
+        'rows_in': rows_in,
+        'rows_out': rows_out,
+        'rows_per_second': round(rows / seconds) if rows and seconds > 0 else None,
+        'peak_rss_mb': round(sampler.peak / (1024 * 1024), 1),
+        'rss_delta_mb': round((current_rss_bytes() - rss_before) / (1024 * 1024), 1)
+    })
+    return result
+
+def benchmark_pipeline(file_path, workers=1, streaming=False):
+    """
+    Time every stage of the analysis pipeline on one export, then the
+    end-to-end analysis call
+    """
+    records = []
+    
+    df = measure_stage(records, 'load', lambda: read_large_csv_optimized(file_path))
+    total_rows = len(df)
+    df = measure_stage(records, 'effective_edd', lambda: apply_effective_edd(df), rows_in=total_rows)
+    df = measure_stage(records, 'classify_tat_breaches', lambda: classify_tat_breaches(df), rows_in=len(df))
+    breach_df = measure_stage(records, 'breach_filter', lambda: df[df['tat_breach']].copy(), rows_in=len(df))
+    del df
+    
+    breach_rows = len(breach_df)
+    aggregates = measure_stage(
+        records, 'aggregate', lambda: aggregate_breach_dimensions(breach_df, workers),
+        rows_in=breach_rows, rows_out=lambda state: len(state['days'])
+    )
+    tables = [
+        ('daywise_table', lambda: calculate_daywise_statistics(aggregates)),
+        ('payment_method_table', lambda: calculate_payment_method_analysis(breach_df, aggregates)),
+        ('zone_table', lambda: calculate_zone_performance_analysis(breach_df, aggregates)),
+        ('route_table', lambda: calculate_route_performance_analysis(breach_df, aggregates)),
+        ('courier_table', lambda: calculate_parent_courier_performance(breach_df, aggregates))
+    ]
+    for stage, func in tables:
+        measure_stage(records, stage, func, rows_in=breach_rows)
+    del breach_df, aggregates
+    
+    measure_stage(
+        records, 'end_to_end', lambda: analyze_comprehensive_delivery_performance_corrected(file_path, False, workers),
+        rows_in=total_rows, rows_out=lambda results: len(results[0]) if results[0] is not None else 0
+    )
+    if streaming:
+        measure_stage(
+            records, 'end_to_end_streaming',
+            lambda: analyze_comprehensive_delivery_performance_corrected(file_path, True, workers),
+            rows_in=total_rows, rows_out=lambda results: len(results[0]) if results[0] is not None else 0
+        )
+    return records
+
+def print_benchmark_report(rows, records):
+    print(f"\n📈 Benchmark: {rows:,} rows")
+    print(f"{'stage':<24}{'seconds':>10}{'rows/s':>14}{'peak RSS MB':>14}{'RSS delta MB':>14}")
+    for record in records:
+        rate = f"{record['rows_per_second']:,}" if record['rows_per_second'] else '-'
+        print(f"{record['stage']:<24}{record['seconds']:>10.3f}{rate:>14}{record['peak_rss_mb']:>14.1f}{record['rss_delta_mb']:>14.1f}")
+
+def run_benchmarks(sizes, data_folder=BENCHMARK_DATA_FOLDER, workers=1, streaming=False, verbose=False):
+    """
+    Generate (once) and benchmark a synthetic export for each size
+    """
+    os.makedirs(data_folder, exist_ok=True)
+    results = []
+    for size in sizes:
+        rows = parse_row_count(size)
+        file_path = os.path.join(data_folder, f"synthetic_{rows}.csv")
+        if not os.path.exists(file_path):
+            generate_shipment_export(file_path, rows)
+        
+        # The pipeline's progress prints are silenced unless asked for
+        with nullcontext() if verbose else redirect_stdout(io.StringIO()):
+            records = benchmark_pipeline(file_path, workers, streaming)
+        print_benchmark_report(rows, records)
+        results.append({
+            'rows': rows,
+            'file_size_mb': round(os.path.getsize(file_path) / (1024 * 1024), 2),
+            'workers': workers,
+            'stages': records
+        })
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the delivery analysis pipeline on synthetic exports')
+    parser.add_argument('--rows', nargs='+', default=BENCHMARK_SIZES, help='export sizes, e.g. 10k 1M 10M')
+    parser.add_argument('--data-folder', default=BENCHMARK_DATA_FOLDER, help='where synthetic exports are cached')
+    parser.add_argument('--workers', type=int, default=1, help='aggregation worker processes')
+    parser.add_argument('--streaming', action='store_true', help='also time the streaming end-to-end analysis')
+    parser.add_argument('--json', help='write the results to this JSON file')
+    parser.add_argument('--verbose', action='store_true', help='show the analysis progress output')
+    args = parser.parse_args()
+    
+    results = run_benchmarks(args.rows, args.data_folder, args.workers, args.streaming, args.verbose)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'runs': results}, f, indent=2)
+        print(f"\n💾 Benchmark results written to {args.json}")
@@ -0,0 +1,329 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from analysis import SHIPMENT_CATEGORIES, CATEGORY_COUNT_COLUMNS, DAY_COLUMNS
+from date_parse import to_day_numbers
+from edd_calendar import CALENDAR_DIMENSIONS, write_edd_calendar, load_edd_calendar
+from result_cache import META_FILENAME, TMP_PREFIX, evict_cached_results
+
+# Breach-level columns that drill-down queries can filter and group on
+INDEX_DIMENSIONS = [
+    'parent_courier_name', 'courier_name', 'payment_method', 'applied_zone', 'pickup_state', 'delivery_state'
+]
+DAY_COLUMN = 'days_after_tat_breach'
+
+# effective_edd of every row, as day numbers (see date_parse.to_day_numbers)
+EDD_DAYS_FILE = 'edd_days.npy'
+
+# Loaded (memory-mapped) indexes kept open per web worker
+BREACH_INDEX_CACHE_SIZE = int(os.environ.get('BREACH_INDEX_CACHE_SIZE', 8))
+
+# Rows sorted, packed into bitmaps and counted per block when an index is
+# written, so memory does not grow with the breach rows (a multiple of 8, so
+# bitmap blocks are whole bytes)
+INDEX_BLOCK_ROWS = 1024 * 1024
+
+# Spilled code columns, appended to as breach chunks arrive
+SPILL_DTYPES = {
+    'category': np.int8, 'days': np.int32, 'edd_days': np.int32,
+    **{dimension: np.int32 for dimension in INDEX_DIMENSIONS}
+}
+
+_index_cache = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+class BreachQueryError(ValueError):
+    """Invalid drill-down filter or grouping"""
+
+class BreachIndexBuilder:
+    """
+    Collects TAT breach rows (a whole breach_df or streamed chunks) as integer
+    codes against labels shared by every chunk, then writes the index. Codes
+    are appended to spill files as they arrive, so only the labels and the
+    row count per day stay in memory.
+    """
+    def __init__(self, spill_dir=None):
+        self.labels = {dimension: {} for dimension in INDEX_DIMENSIONS}
+        self.day_counts = {}
+        self.rows = 0
+        self.spill_root = spill_dir
+        self.spill_dir = None
+        self.spill_files = {}
+    
+    def add(self, breach_df):
+        if self.spill_dir is None:
+            if self.spill_root is not None:
+                os.makedirs(self.spill_root, exist_ok=True)
+            self.spill_dir = tempfile.mkdtemp(dir=self.spill_root, prefix=TMP_PREFIX)
+            self.spill_files = {name: open(os.path.join(self.spill_dir, f"{name}.bin"), 'wb') for name in SPILL_DTYPES}
+        
+        edd_column = DAY_COLUMNS['effective_edd']
+        if edd_column in breach_df.columns:
+            edd_days = breach_df[edd_column].to_numpy(dtype=np.int32)
+        else:
+            edd_days = to_day_numbers(breach_df['effective_edd'].to_numpy(dtype='datetime64[ns]').view(np.int64))
+        part = {
+            'category': pd.Categorical(breach_df['shipment_category'], categories=SHIPMENT_CATEGORIES).codes,
+            'days': breach_df[DAY_COLUMN].to_numpy(dtype=np.int32),
+            'edd_days': edd_days
+        }
+        for dimension in INDEX_DIMENSIONS:
+            codes, uniques = pd.factorize(breach_df[dimension])
+            known = self.labels[dimension]
+            mapping = np.array([known.setdefault(str(label), len(known)) for label in uniques] + [-1], dtype=np.int32)
+            # factorize marks missing values -1, which maps to the trailing -1
+            part[dimension] = mapping[codes]
+        
+        for name, values in part.items():
+            values.astype(SPILL_DTYPES[name], copy=False).tofile(self.spill_files[name])
+        for day, count in zip(*np.unique(part['days'], return_counts=True)):
+            self.day_counts[int(day)] = self.day_counts.get(int(day), 0) + int(count)
+        self.rows += len(breach_df)
+    
+    def close(self):
+        """Delete the spill files (the builder cannot be written afterwards)"""
+        for f in self.spill_files.values():
+            f.close()
+        self.spill_files = {}
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+    
+    def _spilled(self, name):
+        self.spill_files[name].flush()
+        return np.memmap(os.path.join(self.spill_dir, f"{name}.bin"), dtype=SPILL_DTYPES[name], mode='r', shape=(self.rows,))
+    
+    def _sort_by_day(self, spilled, outputs):
+        """
+        Stable counting sort of the spilled rows by day into outputs, a block
+        at a time: each row goes after the rows of earlier days and the earlier
+        rows of its own day
+        """
+        days = np.array(sorted(self.day_counts), dtype=np.int64)
+        counts = np.array([self.day_counts[day] for day in days], dtype=np.int64)
+        cursor = np.cumsum(counts) - counts
+        for start in range(0, self.rows, INDEX_BLOCK_ROWS):
+            end = min(start + INDEX_BLOCK_ROWS, self.rows)
+            day_codes = np.searchsorted(days, spilled['days'][start:end])
+            order = np.argsort(day_codes, kind='stable')
+            sorted_codes = day_codes[order]
+            block_counts = np.bincount(sorted_codes, minlength=len(days))
+            block_starts = np.cumsum(block_counts) - block_counts
+            destination = cursor[sorted_codes] + np.arange(end - start) - block_starts[sorted_codes]
+            for name, values in spilled.items():
+                outputs[name][destination] = values[start:end][order]
+            cursor += block_counts
+    
+    def write(self, index_dir, key, max_bytes):
+        """
+        Write the index for key (rows sorted by day, one packed bitmap per
+        dimension value, plus the EDD calendar cube), then evict old indexes
+        down to max_bytes. The spill files are deleted either way.
+        """
+        tmp_dir = None
+        try:
+            if self.rows == 0:
+                raise ValueError('no breach rows were added')
+            os.makedirs(index_dir, exist_ok=True)
+            tmp_dir = tempfile.mkdtemp(dir=index_dir, prefix=TMP_PREFIX)
+            n_rows = self.rows
+            
+            spilled = {name: self._spilled(name) for name in SPILL_DTYPES}
+            output_files = {'category': 'category.npy', 'days': 'days.npy', 'edd_days': EDD_DAYS_FILE}
+            output_dtypes = {'category': np.int8, 'days': np.int32, 'edd_days': np.int32}
+            for dimension in INDEX_DIMENSIONS:
+                output_files[dimension] = f"{dimension}.npy"
+                output_dtypes[dimension] = np.int16 if len(self.labels[dimension]) < np.iinfo(np.int16).max else np.int32
+            outputs = {
+                name: _open_output(os.path.join(tmp_dir, output_files[name]), output_dtypes[name], (n_rows,))
+                for name in SPILL_DTYPES
+            }
+            self._sort_by_day(spilled, outputs)
+            
+            for dimension in INDEX_DIMENSIONS:
+                bitmaps = _open_output(
+                    os.path.join(tmp_dir, f"{dimension}.bitmap.npy"), np.uint8,
+                    (len(self.labels[dimension]), (n_rows + 7) // 8)
+                )
+                _pack_bitmaps(outputs[dimension], bitmaps)
+                _flush(bitmaps)
+            
+            write_edd_calendar(
+                tmp_dir, outputs['edd_days'], outputs['category'],
+                {dimension: outputs[dimension] for dimension in CALENDAR_DIMENSIONS},
+                {dimension: len(self.labels[dimension]) for dimension in CALENDAR_DIMENSIONS}
+            )
+            for values in outputs.values():
+                _flush(values)
+            
+            with open(os.path.join(tmp_dir, META_FILENAME), 'w') as f:
+                json.dump({
+                    'key': key,
+                    'rows': n_rows,
+                    'labels': {dimension: list(labels) for dimension, labels in self.labels.items()}
+                }, f)
+            
+            entry_dir = os.path.join(index_dir, key)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+            tmp_dir = None
+            print(f"🗂️  Breach index written: {n_rows:,} rows")
+            
+            evict_cached_results(index_dir, max_bytes)
+        except Exception as e:
+            print(f"Error writing breach index {key}: {e}")
+        finally:
+            if tmp_dir is not None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            self.close()
+
+def _open_output(path, dtype, shape):
+    """A .npy file mapped for writing (an in-memory array for an empty one, which cannot be mapped)"""
+    if 0 in shape:
+        values = np.zeros(shape, dtype=dtype)
+        np.save(path, values)
+        return values
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+
+def _flush(values):
+    if isinstance(values, np.memmap):
+        values.flush()
+
+def _pack_bitmaps(codes, bitmaps):
+    """
+    Set each row's bit in the bitmap of its code (missing values, -1, in none),
+    a block of rows at a time: one stable sort groups a block's rows by code,
+    and the bits falling in the same bitmap byte are summed into it
+    """
+    n_bytes = bitmaps.shape[1]
+    flat_bitmaps = bitmaps.reshape(-1)
+    for start in range(0, len(codes), INDEX_BLOCK_ROWS):
+        block = np.asarray(codes[start:start + INDEX_BLOCK_ROWS], dtype=np.int64)
+        rows = np.flatnonzero(block >= 0)
+        rows = rows[np.argsort(block[rows], kind='stable')]
+        positions = block[rows] * n_bytes + (start + rows) // 8
+        bits = (0x80 >> ((start + rows) % 8)).astype(np.uint8)
+        # Blocks start on a byte boundary, so no byte is shared with another block
+        unique_positions, first = np.unique(positions, return_index=True)
+        if len(unique_positions):
+            flat_bitmaps[unique_positions] = np.add.reduceat(bits, first)
+
+def breach_index_exists(index_dir, key):
+    return os.path.exists(os.path.join(index_dir, key, META_FILENAME))
+
+def load_breach_index(index_dir, key):
+    """
+    Memory-mapped breach index for key, or None if it was never built or evicted
+    """
+    with _index_cache_lock:
+        if key in _index_cache:
+            _index_cache.move_to_end(key)
+            return _index_cache[key]
+    
+    entry_dir = os.path.join(index_dir, key)
+    try:
+        with open(os.path.join(entry_dir, META_FILENAME)) as f:
+            meta = json.load(f)
+        index = {
+            'rows': meta['rows'],
+            'labels': meta['labels'],
+            'label_codes': {dimension: {label: code for code, label in enumerate(labels)} for dimension, labels in meta['labels'].items()},
+            'category': np.load(os.path.join(entry_dir, 'category.npy'), mmap_mode='r'),
+            'days': np.load(os.path.join(entry_dir, 'days.npy'), mmap_mode='r'),
+            'edd_days': None,
+            'codes': {},
+            'bitmaps': {}
+        }
+        if os.path.exists(os.path.join(entry_dir, EDD_DAYS_FILE)):
+            # Indexes written before EDD day numbers were stored lack them
+            index['edd_days'] = np.load(os.path.join(entry_dir, EDD_DAYS_FILE), mmap_mode='r')
+        index['calendar'] = load_edd_calendar(entry_dir)
+        for dimension in INDEX_DIMENSIONS:
+            index['codes'][dimension] = np.load(os.path.join(entry_dir, f"{dimension}.npy"), mmap_mode='r')
+            index['bitmaps'][dimension] = np.load(os.path.join(entry_dir, f"{dimension}.bitmap.npy"), mmap_mode='r')
+        
+        # Touch the entry so eviction is least-recently-used
+        os.utime(os.path.join(entry_dir, META_FILENAME))
+    except FileNotFoundError:
+        # Never built, or evicted (possibly by another worker while loading)
+        return None
+    with _index_cache_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > BREACH_INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+def index_row_mask(index, filters, start, end):
+    """
+    Rows start:end matching every dimension filter (any listed value), from
+    the OR of each value's bitmap ANDed across dimensions
+    """
+    mask = np.ones(end - start, dtype=bool)
+    first_byte, last_byte = start // 8, (end + 7) // 8
+    for dimension, values in filters.items():
+        codes = [index['label_codes'][dimension][value] for value in values if value in index['label_codes'][dimension]]
+        if not codes:
+            return np.zeros(end - start, dtype=bool)
+        bits = np.bitwise_or.reduce(index['bitmaps'][dimension][codes, first_byte:last_byte], axis=0)
+        mask &= np.unpackbits(bits)[start - first_byte * 8:end - first_byte * 8].astype(bool)
+    return mask
+
+def _count_summary(category_counts):
+    total = int(category_counts.sum())
+    summary = {'total_shipments': total}
+    summary.update({column: int(count) for column, count in zip(CATEGORY_COUNT_COLUMNS, category_counts)})
+    summary['delivery_percentage'] = category_counts[0] / total * 100 if total else None
+    summary['rto_rate'] = category_counts[1] / total * 100 if total else None
+    return summary
+
+def query_breach_index(index, filters=None, day_min=None, day_max=None, group_by=None):
+    """
+    Category counts and rates of the TAT breaches matching filters
+    ({dimension: [values]}) within the day range, optionally per group_by value
+    """
+    started = time.perf_counter()
+    filters = filters or {}
+    for dimension in filters:
+        if dimension not in INDEX_DIMENSIONS:
+            raise BreachQueryError(f"Unknown filter dimension: {dimension}")
+    if group_by is not None and group_by not in (*INDEX_DIMENSIONS, DAY_COLUMN):
+        raise BreachQueryError(f"Unknown group_by dimension: {group_by}")
+    
+    # Rows are sorted by day, so the day range is a contiguous slice
+    days = index['days']
+    start = 0 if day_min is None else int(np.searchsorted(days, day_min, side='left'))
+    end = len(days) if day_max is None else int(np.searchsorted(days, day_max, side='right'))
+    end = max(start, end)
+    
+    mask = index_row_mask(index, filters, start, end)
+    categories = index['category'][start:end][mask]
+    n_categories = len(SHIPMENT_CATEGORIES)
+    result = _count_summary(np.bincount(categories, minlength=n_categories))
+    
+    if group_by is not None:
+        if group_by == DAY_COLUMN:
+            group_values, group_codes = np.unique(days[start:end][mask], return_inverse=True)
+            group_labels = [int(value) for value in group_values]
+        else:
+            group_codes = index['codes'][group_by][start:end][mask].astype(np.int64)
+            group_labels = index['labels'][group_by] + [None]
+            # Missing values (-1) are reported under a trailing None label
+            group_codes = np.where(group_codes < 0, len(group_labels) - 1, group_codes)
+        counts = np.bincount(
+            group_codes * n_categories + categories, minlength=len(group_labels) * n_categories
+        ).reshape(len(group_labels), n_categories)
+        result['groups'] = [
+            {group_by: label, **_count_summary(counts[i])}
+            for i, label in enumerate(group_labels) if counts[i].any()
+        ]
+    
+    result['query_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    return result
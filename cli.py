@@ -0,0 +1,172 @@
+import argparse
+import io
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager, redirect_stdout
+
+from analysis import analyze_comprehensive_delivery_performance_corrected
+from batch import batch_input_files, analyze_batch, write_batch_results
+from incremental import update_incremental_analysis
+from instrumentation import PROFILE_FOLDER, profile_run
+from result_views import DOWNLOAD_FORMATS, write_result_tables
+
+# Exit statuses for schedulers (argparse exits 2 on invalid arguments)
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+@contextmanager
+def _stdout_to_stderr():
+    """
+    Point file descriptor 1 at stderr, so worker processes (which inherit the
+    descriptor, not sys.stdout) cannot write into the summary either
+    """
+    sys.stdout.flush()
+    saved_fd = os.dup(1)
+    os.dup2(2, 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved_fd, 1)
+        os.close(saved_fd)
+
+def _run_summary(profile, outputs):
+    """Timing summary of one profiled run"""
+    result = profile.result
+    return {
+        'status': result['status'],
+        'seconds': result['total_seconds'],
+        'peak_rss_mb': result['peak_rss_mb'],
+        **result['info'],
+        'outputs': outputs,
+        'stages': [
+            {key: entry[key] for key in ('stage', 'calls', 'seconds', 'rows_in', 'rows_out')}
+            for entry in result['stages']
+        ]
+    }
+
+def analyze_file(file_path, output_dir, file_format='csv', streaming=None, workers=None,
+                 incremental_store=None, profile_folder=PROFILE_FOLDER):
+    """
+    Analyze one export (or merge it into an incremental store) and write its
+    tables to output_dir/<file name>/. Returns the run summary.
+    """
+    outputs = []
+    with profile_run('cli', os.path.basename(file_path), profile_folder) as profile:
+        profile.info['file'] = file_path
+        profile.info['file_size_mb'] = round(os.path.getsize(file_path) / (1024 * 1024), 2)
+        if incremental_store is not None:
+            results = update_incremental_analysis(file_path, incremental_store)
+        else:
+            results = analyze_comprehensive_delivery_performance_corrected(file_path, streaming, workers)
+        
+        if results is None or results[0] is None:
+            profile.info['status'] = 'failed'
+        else:
+            profile.info['total_records'] = int(results[5])
+            name = os.path.splitext(os.path.basename(file_path))[0]
+            outputs = write_result_tables(results, os.path.join(output_dir, name), file_format)
+    return _run_summary(profile, outputs)
+
+def analyze_files_as_batch(file_paths, output_dir, file_format='csv', streaming=None, workers=None,
+                           split_by_file=False, split_by_company=False, profile_folder=PROFILE_FOLDER):
+    """
+    Analyze the exports as one combined dataset and write the combined (and
+    split) tables to output_dir. Returns the run summary.
+    """
+    outputs = []
+    with profile_run('cli', f"batch of {len(file_paths)} files", profile_folder) as profile:
+        profile.info['files'] = file_paths
+        batch = analyze_batch(file_paths, workers, streaming, split_by_file, split_by_company)
+        profile.info['failed_files'] = batch['failed']
+        if batch['combined'] is None or batch['failed']:
+            profile.info['status'] = 'failed'
+        if batch['combined'] is not None:
+            profile.info['total_records'] = int(batch['combined'][5])
+            outputs = write_batch_results(batch, output_dir, file_format)
+    return _run_summary(profile, outputs)
+
+def run_cli(args):
+    """
+    Run the analyses asked for on the command line and return (exit status, summary)
+    """
+    started = time.perf_counter()
+    files = batch_input_files(args.inputs)
+    missing = [path for path in files if not os.path.isfile(path)]
+    if not files or missing:
+        message = f"Input files not found: {', '.join(missing)}" if missing else 'No CSV files matched the inputs'
+        return EXIT_USAGE, {'status': 'failed', 'error': message, 'runs': []}
+    
+    if args.batch:
+        runs = [analyze_files_as_batch(
+            files, args.output_dir, args.format, args.streaming, args.workers,
+            args.by_file, args.by_company, args.profile_folder
+        )]
+    else:
+        # Files run one after another; each analysis uses the worker count itself
+        runs = [
+            analyze_file(path, args.output_dir, args.format, args.streaming, args.workers,
+                         args.incremental, args.profile_folder)
+            for path in files
+        ]
+    
+    failed = sum(run['status'] != 'ok' for run in runs)
+    summary = {
+        'status': 'failed' if failed else 'ok',
+        'files': len(files),
+        'failed_runs': failed,
+        'total_seconds': round(time.perf_counter() - started, 4),
+        'output_dir': args.output_dir,
+        'format': args.format,
+        'runs': runs
+    }
+    return (EXIT_FAILED if failed else EXIT_OK), summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run the delivery performance analysis on local exports without the web app. '
+                    'Progress goes to stderr; a JSON timing summary is printed to stdout.'
+    )
+    parser.add_argument('inputs', nargs='+', help='CSV files, directories or glob patterns')
+    parser.add_argument('-o', '--output-dir', default='analysis_output', help='directory the result tables are written to')
+    parser.add_argument('-f', '--format', choices=DOWNLOAD_FORMATS, default='csv', help='result table file format')
+    parser.add_argument('--streaming', action=argparse.BooleanOptionalAction, default=None,
+                        help='stream exports in chunks (default: only exports too large for the memory budget)')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='aggregation worker processes (with --batch: exports analyzed at once)')
+    parser.add_argument('--batch', action='store_true', help='analyze all inputs as one combined dataset')
+    parser.add_argument('--by-file', action='store_true', help='with --batch, also write the tables of each export')
+    parser.add_argument('--by-company', action='store_true', help='with --batch, also write the tables of each company_name')
+    parser.add_argument('--incremental', metavar='STORE_DIR',
+                        help='merge each export, in order, into the incremental state kept in STORE_DIR')
+    parser.add_argument('--summary', metavar='PATH', help='also write the JSON summary to this file')
+    parser.add_argument('--profile-folder', default=PROFILE_FOLDER, help='where run profiles are written')
+    parser.add_argument('-q', '--quiet', action='store_true', help='hide the analysis progress output')
+    args = parser.parse_args(argv)
+    if args.batch and args.incremental:
+        parser.error('--batch and --incremental cannot be combined')
+    if (args.by_file or args.by_company) and not args.batch:
+        parser.error('--by-file and --by-company need --batch')
+    
+    # stdout carries only the summary, so it can be piped into other tools
+    progress = io.StringIO() if args.quiet else sys.stderr
+    try:
+        with _stdout_to_stderr(), redirect_stdout(progress):
+            status, summary = run_cli(args)
+    except KeyboardInterrupt:
+        return 130
+    except Exception as e:
+        status, summary = EXIT_FAILED, {'status': 'failed', 'error': str(e), 'runs': []}
+    
+    summary['exit_code'] = status
+    print(json.dumps(summary, indent=2, default=str))
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            json.dump(summary, f, indent=2, default=str)
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+import os
+import time
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from analysis import SHIPMENT_CATEGORIES
+from breach_index import INDEX_DIMENSIONS, index_row_mask, load_breach_index
+from result_views import load_result_view
+
+# Compared views: view -> the column its rows are keyed on. Cached results
+# serve them from their result views; breach indexes from their breach rows.
+COMPARISON_VIEWS = {
+    'daywise': 'days_after_tat_breach',
+    'courier': 'parent_courier_name',
+    'zone': 'applied_zone',
+    'payment': 'payment_method',
+    'route': 'route'
+}
+COUNT_COLUMNS = ['total_shipments', 'delivered_count', 'rto_count']
+
+# Views whose cached result table drops low-volume keys (the route table keeps
+# routes with 10+ shipments or the top 20). A key missing there is not a zero.
+TRUNCATED_VIEWS = ['route']
+
+# Compared rates: rate column -> the count it is a share of total_shipments of
+RATE_METRICS = {'delivery_percentage': 'delivered_count', 'rto_rate': 'rto_count'}
+
+# A rate change is flagged significant when its two-proportion z-score
+# reaches Z_CRITICAL (1.96 ~ 95%) and both sides have enough shipments
+Z_CRITICAL = float(os.environ.get('COMPARISON_Z_CRITICAL', 1.96))
+MIN_COMPARISON_SHIPMENTS = int(os.environ.get('MIN_COMPARISON_SHIPMENTS', 30))
+
+EPOCH = date(1970, 1, 1)
+
+class ComparisonError(ValueError):
+    """Invalid comparison sides, views or date windows"""
+
+def _check_views(views):
+    views = list(COMPARISON_VIEWS) if views is None else views
+    unknown = [view for view in views if view not in COMPARISON_VIEWS]
+    if unknown:
+        raise ComparisonError(f"Unknown comparison view: {', '.join(unknown)}")
+    return views
+
+def result_count_views(cache_dir, key, views=None):
+    """
+    {view: per-key counts} of a cached analysis, or None if it has expired
+    """
+    counts = {}
+    for view in _check_views(views):
+        data = load_result_view(cache_dir, key, view)
+        if data is None:
+            return None
+        counts[view] = data[[COMPARISON_VIEWS[view], *COUNT_COLUMNS]]
+    return counts
+
+def parse_edd_window(start, end):
+    """
+    Inclusive (first, last) effective_edd day numbers of two ISO dates (either may be empty)
+    """
+    window = []
+    for value in (start, end):
+        if not value:
+            window.append(None)
+            continue
+        try:
+            window.append((datetime.strptime(value, '%Y-%m-%d').date() - EPOCH).days)
+        except ValueError:
+            raise ComparisonError(f"Invalid date (expected YYYY-MM-DD): {value}")
+    if None not in window and window[0] > window[1]:
+        raise ComparisonError('A date window must not end before it starts')
+    return tuple(window)
+
+def _group_counts(codes, categories, labels, key_column):
+    """Per-label total, delivered and RTO counts of coded breach rows"""
+    n_categories = len(SHIPMENT_CATEGORIES)
+    counts = np.bincount(
+        codes * n_categories + categories, minlength=len(labels) * n_categories
+    ).reshape(len(labels), n_categories)
+    table = pd.DataFrame({
+        key_column: labels,
+        'total_shipments': counts.sum(axis=1),
+        # Category codes follow SHIPMENT_CATEGORIES: Delivered, RTO, ...
+        'delivered_count': counts[:, 0],
+        'rto_count': counts[:, 1]
+    })
+    return table[table['total_shipments'] > 0].reset_index(drop=True)
+
+def _dimension_codes(index, dimension, mask):
+    codes = index['codes'][dimension][mask].astype(np.int64)
+    # Missing values (-1) get a trailing code
+    n_labels = len(index['labels'][dimension])
+    return np.where(codes < 0, n_labels, codes), n_labels + 1
+
+def index_count_views(index, filters=None, edd_window=(None, None), views=None):
+    """
+    {view: per-key counts} of the indexed breach rows matching filters
+    ({dimension: [values]}) whose effective_edd day falls in edd_window
+    """
+    views = _check_views(views)
+    filters = filters or {}
+    for dimension in filters:
+        if dimension not in INDEX_DIMENSIONS:
+            raise ComparisonError(f"Unknown filter dimension: {dimension}")
+    
+    mask = index_row_mask(index, filters, 0, index['rows'])
+    if edd_window != (None, None):
+        if index['edd_days'] is None:
+            raise ComparisonError('This breach index has no EDD dates; run the analysis again to compare date windows')
+        edd_days = index['edd_days']
+        if edd_window[0] is not None:
+            mask &= edd_days >= edd_window[0]
+        if edd_window[1] is not None:
+            mask &= edd_days <= edd_window[1]
+    categories = index['category'][mask].astype(np.int64)
+    
+    counts = {}
+    for view in views:
+        key_column = COMPARISON_VIEWS[view]
+        if view == 'daywise':
+            days, codes = np.unique(index['days'][mask], return_inverse=True)
+            labels = days.astype(np.float64)
+        elif view == 'route':
+            pickup_codes, n_pickup = _dimension_codes(index, 'pickup_state', mask)
+            delivery_codes, n_delivery = _dimension_codes(index, 'delivery_state', mask)
+            codes = pickup_codes * n_delivery + delivery_codes
+            # Route labels read 'nan' for a missing state, as in the route table
+            pickup_labels = index['labels']['pickup_state'] + ['nan']
+            delivery_labels = index['labels']['delivery_state'] + ['nan']
+            labels = [f"{pickup} → {delivery}" for pickup in pickup_labels for delivery in delivery_labels]
+        else:
+            codes, _ = _dimension_codes(index, key_column, mask)
+            labels = index['labels'][key_column] + [None]
+        counts[view] = _group_counts(codes, categories, labels, key_column)
+    return counts
+
+def _rate(count, total):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total > 0, count / total * 100, np.nan)
+
+def compare_count_views(baseline, current):
+    """
+    Align each view's rows on their key and compute per-row deltas (current
+    minus baseline) of the shipment count and rates, with a two-proportion
+    z-score and significance flag per rate
+    """
+    comparison = {}
+    for view, baseline_counts in baseline.items():
+        key_column = COMPARISON_VIEWS[view]
+        aligned = baseline_counts.merge(
+            current[view], on=key_column, how='outer', suffixes=('_baseline', '_current'), sort=True
+        )
+        columns = {key_column: aligned[key_column].to_numpy()}
+        
+        # A key missing on one side had no breached shipments there
+        sides = {
+            side: {column: aligned[f"{column}_{side}"].fillna(0).to_numpy(dtype=np.int64) for column in COUNT_COLUMNS}
+            for side in ('baseline', 'current')
+        }
+        baseline_total, current_total = sides['baseline']['total_shipments'], sides['current']['total_shipments']
+        columns['baseline_total_shipments'] = baseline_total
+        columns['current_total_shipments'] = current_total
+        columns['total_shipments_delta'] = current_total - baseline_total
+        
+        enough = np.minimum(baseline_total, current_total) >= MIN_COMPARISON_SHIPMENTS
+        for rate, count_column in RATE_METRICS.items():
+            baseline_count, current_count = sides['baseline'][count_column], sides['current'][count_column]
+            baseline_rate = _rate(baseline_count, baseline_total)
+            current_rate = _rate(current_count, current_total)
+            
+            pooled = _rate(baseline_count + current_count, baseline_total + current_total) / 100
+            with np.errstate(divide='ignore', invalid='ignore'):
+                standard_error = np.sqrt(pooled * (1 - pooled) * (1 / baseline_total + 1 / current_total)) * 100
+                z_score = np.where(standard_error > 0, (current_rate - baseline_rate) / standard_error, np.nan)
+            
+            columns[f"baseline_{rate}"] = baseline_rate
+            columns[f"current_{rate}"] = current_rate
+            columns[f"{rate}_delta"] = current_rate - baseline_rate
+            columns[f"{rate}_z"] = z_score
+            columns[f"{rate}_significant"] = enough & (np.abs(np.nan_to_num(z_score)) >= Z_CRITICAL)
+        comparison[view] = pd.DataFrame(columns)
+    return comparison
+
+def _complete_truncated_views(baseline, current, index_dir, baseline_key, current_key):
+    """
+    Replace truncated views with full counts from both analyses' breach
+    indexes, or else keep only the keys both truncated tables list
+    """
+    truncated = [view for view in TRUNCATED_VIEWS if view in baseline]
+    if not truncated:
+        return
+    indexes = [load_breach_index(index_dir, key) for key in (baseline_key, current_key)] if index_dir else [None]
+    if None not in indexes:
+        baseline.update(index_count_views(indexes[0], views=truncated))
+        current.update(index_count_views(indexes[1], views=truncated))
+        return
+    
+    for view in truncated:
+        key_column = COMPARISON_VIEWS[view]
+        shared = set(baseline[view][key_column]) & set(current[view][key_column])
+        baseline[view] = baseline[view][baseline[view][key_column].isin(shared)]
+        current[view] = current[view][current[view][key_column].isin(shared)]
+
+def compare_results(cache_dir, baseline_key, current_key, views=None, index_dir=None):
+    """
+    Compare two cached analyses view by view; None if either has expired.
+    Truncated views are compared on the full counts of the breach indexes in
+    index_dir when both are available, else on the keys both sides list.
+    """
+    baseline = result_count_views(cache_dir, baseline_key, views)
+    current = result_count_views(cache_dir, current_key, views)
+    if baseline is None or current is None:
+        return None
+    _complete_truncated_views(baseline, current, index_dir, baseline_key, current_key)
+    return compare_count_views(baseline, current)
+
+def compare_index_segments(index, baseline, current, views=None):
+    """
+    Compare two segments of one breach index, each {'filters': {dimension:
+    [values]}, 'edd_window': (first day, last day)}: e.g. two couriers, or
+    two effective_edd periods
+    """
+    return compare_count_views(
+        index_count_views(index, baseline.get('filters'), baseline.get('edd_window', (None, None)), views),
+        index_count_views(index, current.get('filters'), current.get('edd_window', (None, None)), views)
+    )
+
+def comparison_records(comparison, started=None):
+    """JSON-serializable form of a comparison: columns and rows per view"""
+    views = {}
+    for view, table in comparison.items():
+        views[view] = {
+            'columns': list(table.columns),
+            'rows': table.astype(object).where(table.notna(), None).to_numpy().tolist(),
+            'significant_rows': int(table[[f"{rate}_significant" for rate in RATE_METRICS]].any(axis=1).sum())
+        }
+    result = {'views': views, 'z_critical': Z_CRITICAL, 'min_shipments': MIN_COMPARISON_SHIPMENTS}
+    if started is not None:
+        result['query_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    return result
@@ -0,0 +1,182 @@
+import gzip
+import io
+import os
+import re
+import struct
+import zipfile
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Export file names accepted for analysis: plain CSV, or a CSV compressed with
+# gzip or zstd, or wrapped in a ZIP archive (one CSV per archive)
+EXPORT_EXTENSIONS = ('csv', 'csv.gz', 'csv.zst', 'zip')
+COMPRESSION_BY_EXTENSION = {'.gz': 'gzip', '.zst': 'zstd', '.zip': 'zip'}
+EXPORT_SUFFIX_PATTERN = re.compile(r'(\.csv(\.gz|\.zst|\.zip)?|\.zip)$', re.IGNORECASE)
+
+# Decompressed bytes read to estimate the size of an export whose compressed
+# format does not record it
+SIZE_SAMPLE_BYTES = 8 * 1024 * 1024
+READ_BLOCK_SIZE = 1024 * 1024
+
+# Most CSV bytes decompressed from the start of an upload to check its header
+# (bounded, so a small compressed block cannot inflate to gigabytes)
+HEADER_PEEK_BYTES = 64 * 1024
+
+ZIP_LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+ZIP_LOCAL_SIGNATURE = b'PK\x03\x04'
+ZIP_CENTRAL_SIGNATURE = b'PK\x01\x02'
+ZIP_FLAG_DATA_DESCRIPTOR = 0x08
+ZIP_FLAG_UTF8 = 0x800
+
+def is_export_file(filename):
+    """Whether filename names a CSV export, compressed or not"""
+    return filename.lower().endswith(tuple(f".{extension}" for extension in EXPORT_EXTENSIONS))
+
+def export_base_name(filename):
+    """filename without its export extension (.csv, optionally .gz, .zst or .zip after it, or .zip)"""
+    return EXPORT_SUFFIX_PATTERN.sub('', filename)
+
+def export_compression(file_path):
+    """'gzip', 'zstd', 'zip' or None (plain CSV), from the file name"""
+    return COMPRESSION_BY_EXTENSION.get(os.path.splitext(file_path)[1].lower())
+
+def _require_zstandard():
+    if zstandard is None:
+        raise ValueError('zstandard is not installed; .zst exports cannot be read')
+
+def _is_zip_csv_member(name):
+    """Whether a ZIP entry holds the export: a .csv file that is not macOS metadata"""
+    return (
+        name.lower().endswith('.csv') and not name.startswith('__MACOSX/')
+        and not os.path.basename(name).startswith('.')
+    )
+
+def _zip_member(archive):
+    """The one CSV in a ZIP archive (other entries are ignored)"""
+    csv_members = [info for info in archive.infolist() if _is_zip_csv_member(info.filename)]
+    if len(csv_members) != 1:
+        raise ValueError(f"ZIP archive must contain exactly one CSV file (found {len(csv_members)})")
+    return csv_members[0]
+
+def _decompressing_reader(raw, compression):
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=raw, mode='rb')
+    _require_zstandard()
+    # Buffered for line reads, which the zstd reader does not support itself
+    return io.BufferedReader(
+        zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True), READ_BLOCK_SIZE
+    )
+
+def open_export(file_path, filename=None):
+    """
+    Binary stream of an export's CSV bytes, decompressed as it is read (never
+    inflated in full). Use it as a context manager. The compression is taken
+    from filename when given (e.g. for a partial upload), else from file_path.
+    """
+    compression = export_compression(filename or file_path)
+    if compression is None:
+        return open(file_path, 'rb')
+    if compression == 'zip':
+        # The member stream keeps the archive file open after the ZipFile is closed
+        with zipfile.ZipFile(file_path) as archive:
+            return archive.open(_zip_member(archive))
+    
+    raw = open(file_path, 'rb')
+    try:
+        return _decompressing_reader(raw, compression)
+    except Exception:
+        raw.close()
+        raise
+
+def export_size(file_path):
+    """
+    Size of an export's CSV in bytes: recorded by plain files, ZIP archives
+    and most zstd frames, otherwise estimated from the compression ratio of
+    its first SIZE_SAMPLE_BYTES
+    """
+    compression = export_compression(file_path)
+    if compression is None:
+        return os.path.getsize(file_path)
+    if compression == 'zip':
+        with zipfile.ZipFile(file_path) as archive:
+            return _zip_member(archive).file_size
+    
+    with open(file_path, 'rb') as raw:
+        if compression == 'zstd':
+            _require_zstandard()
+            content_size = zstandard.frame_content_size(raw.read(18))
+            if content_size >= 0:
+                return content_size
+            raw.seek(0)
+        
+        reader = _decompressing_reader(raw, compression)
+        sampled = 0
+        while sampled < SIZE_SAMPLE_BYTES:
+            block = reader.read(READ_BLOCK_SIZE)
+            if not block:
+                # The whole file was read
+                return sampled
+            sampled += len(block)
+        return int(sampled / max(raw.tell(), 1) * os.path.getsize(file_path))
+
+def _inflate_head(data, method):
+    if method == zipfile.ZIP_STORED:
+        return data[:HEADER_PEEK_BYTES]
+    if method == zipfile.ZIP_DEFLATED:
+        return zlib.decompressobj(-zlib.MAX_WBITS).decompress(data, HEADER_PEEK_BYTES)
+    raise ValueError('ZIP archive must be stored or deflated')
+
+def _zip_head(data):
+    """
+    Leading bytes of the first CSV entry among the local entries in data,
+    skipping the entries _zip_member ignores. None when that entry starts past
+    data (or past an entry whose size is only recorded after its data), so it
+    is checked once the upload is complete.
+    """
+    if not data.startswith(ZIP_LOCAL_SIGNATURE):
+        raise ValueError('File is not a ZIP archive')
+    
+    offset = 0
+    while offset + ZIP_LOCAL_HEADER.size <= len(data) and data.startswith(ZIP_LOCAL_SIGNATURE, offset):
+        fields = ZIP_LOCAL_HEADER.unpack_from(data, offset)
+        flags, method, compressed_size, name_length, extra_length = fields[2], fields[3], fields[7], fields[9], fields[10]
+        name_start = offset + ZIP_LOCAL_HEADER.size
+        name = data[name_start:name_start + name_length].decode('utf-8' if flags & ZIP_FLAG_UTF8 else 'cp437')
+        start = name_start + name_length + extra_length
+        
+        if _is_zip_csv_member(name):
+            end = start + compressed_size if compressed_size and not flags & ZIP_FLAG_DATA_DESCRIPTOR else len(data)
+            return _inflate_head(data[start:end], method)
+        if flags & ZIP_FLAG_DATA_DESCRIPTOR or compressed_size == 0xFFFFFFFF:
+            return None
+        offset = start + compressed_size
+    
+    if data.startswith(ZIP_CENTRAL_SIGNATURE, offset):
+        # Every entry was skipped
+        raise ValueError('ZIP archive must contain exactly one CSV file (found 0)')
+    return None
+
+def decompress_head(data, filename):
+    """
+    At most HEADER_PEEK_BYTES of CSV from the first bytes of an export (e.g.
+    its first upload chunk), to check its header before the rest arrives.
+    None for a ZIP whose CSV entry is not within data.
+    """
+    compression = export_compression(filename)
+    if compression is None:
+        return data
+    if compression == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(data, HEADER_PEEK_BYTES)
+    if compression == 'zstd':
+        _require_zstandard()
+        return zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).read(HEADER_PEEK_BYTES)
+    return _zip_head(data)
+
+def read_export_head(file_path, filename=None):
+    """At most HEADER_PEEK_BYTES from the start of a stored export's CSV"""
+    with open_export(file_path, filename) as f:
+        return f.read(HEADER_PEEK_BYTES)
@@ -0,0 +1,151 @@
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from compressed_input import open_export
+
+try:
+    from pandas.tseries.api import guess_datetime_format
+except ImportError:
+    # pandas < 2.2 only has the private helper
+    from pandas._libs.tslibs.parsing import guess_datetime_format
+
+# Declared format of the export date columns (unset = detect it per column
+# from a sample of its values, falling back to ISO8601)
+DATE_FORMAT = os.environ.get('CSV_DATE_FORMAT') or None
+
+# Date columns with at most this share of distinct values in the sample are
+# read as categoricals and each distinct string is parsed once; columns of
+# near-unique timestamps are parsed during the read instead
+MAX_DISTINCT_DATE_RATIO = float(os.environ.get('MAX_DISTINCT_DATE_RATIO', 0.2))
+
+# Rows sampled to detect the format and cardinality of the date columns
+DATE_SAMPLE_ROWS = 5000
+
+# Parsed strings remembered across chunks and files (cleared when full)
+DATE_PARSE_CACHE_SIZE = 100000
+
+# Day number (days since 1970-01-01) of a missing date
+MISSING_DAY = np.iinfo(np.int32).min
+
+NANOSECONDS_PER_DAY = 86400 * 10 ** 9
+
+_parsed_dates = {}
+
+def detect_date_format(values):
+    """
+    strftime format that parses every value (None if no single format does)
+    """
+    values = pd.Index(values).dropna().unique()
+    if len(values) == 0:
+        return None
+    
+    # Month-first, then day-first guesses from a few values spread over the
+    # sample; the first format that parses every value wins
+    spread = values.take(np.unique(np.linspace(0, len(values) - 1, 5).astype(int)))
+    for dayfirst in (False, True):
+        with warnings.catch_warnings():
+            # guess_datetime_format warns about day-first formats
+            warnings.simplefilter('ignore', UserWarning)
+            candidates = dict.fromkeys(guess_datetime_format(value, dayfirst=dayfirst) for value in spread)
+        for date_format in candidates:
+            if date_format is not None and _parses(values, date_format):
+                return date_format
+    return 'ISO8601' if _parses(values, 'ISO8601') else None
+
+def _parses(values, date_format):
+    try:
+        pd.to_datetime(values, format=date_format)
+    except (ValueError, TypeError):
+        return False
+    return True
+
+def sample_date_columns(file_path, columns, sample_rows=DATE_SAMPLE_ROWS):
+    """
+    {column: (format, distinct share)} of the date columns in the first
+    sample_rows rows of a CSV
+    """
+    if not columns:
+        return {}
+    with open_export(file_path) as f:
+        sample = pd.read_csv(f, usecols=columns, nrows=sample_rows, dtype=str)
+    profile = {}
+    for col in columns:
+        values = sample[col].dropna()
+        distinct = values.nunique() / len(values) if len(values) else 0
+        profile[col] = (DATE_FORMAT or detect_date_format(values), distinct)
+    return profile
+
+def _parse_strings(values, date_format):
+    column_format = date_format or detect_date_format(values)
+    try:
+        dates = pd.to_datetime(values, format=column_format)
+    except (ValueError, TypeError):
+        # Values that do not match one format are inferred one by one as before
+        dates = pd.to_datetime(values, errors='coerce')
+    return pd.DatetimeIndex(dates).as_unit('ns').asi8
+
+def parse_date_strings(values, date_format=None):
+    """
+    Parse distinct date strings into int64 nanoseconds (NaT for unparseable
+    values). With a known format, strings parsed before by any chunk or file
+    in this process are not parsed again.
+    """
+    values = pd.Index(values, dtype=object)
+    date_format = date_format or DATE_FORMAT
+    if date_format is None:
+        # Without a format a string's meaning depends on the values detected
+        # with it (e.g. 01/02/2024 month- or day-first), so it is not shared
+        return _parse_strings(values, None)
+    
+    parsed = np.empty(len(values), dtype=np.int64)
+    missing = []
+    for i, value in enumerate(values):
+        cached = _parsed_dates.get((date_format, value))
+        if cached is None:
+            missing.append(i)
+        else:
+            parsed[i] = cached
+    
+    if missing:
+        new_values = values.take(missing)
+        new_parsed = _parse_strings(new_values, date_format)
+        parsed[missing] = new_parsed
+        
+        if len(_parsed_dates) + len(missing) > DATE_PARSE_CACHE_SIZE:
+            _parsed_dates.clear()
+        if len(missing) <= DATE_PARSE_CACHE_SIZE:
+            _parsed_dates.update(zip(((date_format, value) for value in new_values), new_parsed.tolist()))
+    return parsed
+
+def to_day_numbers(nanoseconds):
+    """
+    Day-truncated int32 day numbers of int64 nanoseconds (NaT -> MISSING_DAY)
+    """
+    days = np.floor_divide(nanoseconds, NANOSECONDS_PER_DAY).astype(np.int32)
+    days[nanoseconds == np.iinfo(np.int64).min] = MISSING_DAY
+    return days
+
+def parse_date_column(series, date_format=None):
+    """
+    (datetime64[ns] Series, int32 day numbers) of a date column. Categorical
+    and string columns are parsed once per distinct value and mapped back
+    through their codes; datetime columns are only truncated to days.
+    """
+    if pd.api.types.is_datetime64_dtype(series):
+        values = series.to_numpy(dtype='datetime64[ns]')
+        return series.astype('datetime64[ns]'), to_day_numbers(values.view(np.int64))
+    
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        labels = series.cat.categories.astype(str)
+    else:
+        codes, labels = pd.factorize(series)
+    
+    # Code -1 (missing) picks the trailing NaT
+    parsed = np.append(parse_date_strings(labels, date_format), np.iinfo(np.int64).min)
+    days = np.append(to_day_numbers(parsed[:-1]), MISSING_DAY)
+    dates = pd.Series(parsed[codes].view('datetime64[ns]'), index=series.index, name=series.name)
+    return dates, days[codes]
@@ -0,0 +1,168 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from analysis import SHIPMENT_CATEGORIES
+from date_parse import MISSING_DAY
+
+# Dimensions the calendar cube is broken down by
+CALENDAR_DIMENSIONS = ['parent_courier_name', 'applied_zone']
+CALENDAR_BUCKETS = ('day', 'week', 'month')
+
+# Buckets trend series are rolled over by default, and the most buckets one
+# query may return (per dimension value)
+DEFAULT_ROLLING_WINDOW = 4
+MAX_CALENDAR_BUCKETS = 3660
+
+CALENDAR_DAYS_FILE = 'calendar_days.npy'
+
+# Breach rows counted per block while the cube is written
+CALENDAR_BLOCK_ROWS = 1024 * 1024
+
+class CalendarQueryError(ValueError):
+    """Invalid calendar bucket, dimension or window"""
+
+def _cube_path(entry_dir, dimension):
+    return os.path.join(entry_dir, f"calendar_{dimension}.npy")
+
+def write_edd_calendar(entry_dir, edd_days, categories, codes, label_counts):
+    """
+    Write the calendar cube of a set of breach rows: for every effective_edd
+    day present and every CALENDAR_DIMENSIONS value (missing values last), the
+    shipment category counts, stored as running totals over the days so any
+    date range is the difference of two rows. The row arrays (which may be
+    memory-mapped) are read CALENDAR_BLOCK_ROWS at a time.
+    """
+    n_categories = len(SHIPMENT_CATEGORIES)
+    blocks = [slice(start, start + CALENDAR_BLOCK_ROWS) for start in range(0, len(edd_days), CALENDAR_BLOCK_ROWS)]
+    days = np.unique(np.concatenate([np.unique(edd_days[block]) for block in blocks] or [np.empty(0, dtype=np.int32)]))
+    days = days[days != MISSING_DAY]
+    np.save(os.path.join(entry_dir, CALENDAR_DAYS_FILE), days.astype(np.int32))
+    
+    n_groups = {dimension: label_counts[dimension] + 1 for dimension in CALENDAR_DIMENSIONS}
+    counts = {dimension: np.zeros(len(days) * n_groups[dimension] * n_categories, dtype=np.int64) for dimension in CALENDAR_DIMENSIONS}
+    for block in blocks:
+        block_days = np.asarray(edd_days[block])
+        has_edd = block_days != MISSING_DAY
+        day_codes = np.searchsorted(days, block_days[has_edd]).astype(np.int64)
+        category_codes = np.asarray(categories[block])[has_edd].astype(np.int64)
+        for dimension in CALENDAR_DIMENSIONS:
+            dimension_codes = np.asarray(codes[dimension][block])[has_edd].astype(np.int64)
+            dimension_codes = np.where(dimension_codes < 0, n_groups[dimension] - 1, dimension_codes)
+            counts[dimension] += np.bincount(
+                (day_codes * n_groups[dimension] + dimension_codes) * n_categories + category_codes,
+                minlength=len(counts[dimension])
+            )
+    
+    for dimension in CALENDAR_DIMENSIONS:
+        cumulative = np.zeros((len(days) + 1, n_groups[dimension], n_categories), dtype=np.int64)
+        np.cumsum(counts[dimension].reshape(len(days), n_groups[dimension], n_categories), axis=0, out=cumulative[1:])
+        np.save(_cube_path(entry_dir, dimension), cumulative)
+
+def load_edd_calendar(entry_dir):
+    """
+    Memory-mapped calendar cube of a breach index entry (None if it has none)
+    """
+    try:
+        return {
+            'days': np.load(os.path.join(entry_dir, CALENDAR_DAYS_FILE), mmap_mode='r'),
+            'cumulative': {
+                dimension: np.load(_cube_path(entry_dir, dimension), mmap_mode='r')
+                for dimension in CALENDAR_DIMENSIONS
+            }
+        }
+    except FileNotFoundError:
+        return None
+
+def bucket_starts(first_day, last_day, bucket):
+    """
+    First day number of every day, week (Monday) or month bucket overlapping
+    first_day..last_day
+    """
+    if bucket == 'day':
+        starts = np.arange(first_day, last_day + 1)
+    elif bucket == 'week':
+        # Day 0 (1970-01-01) was a Thursday
+        starts = np.arange(first_day - (first_day + 3) % 7, last_day + 1, 7)
+    else:
+        months = np.arange(np.datetime64(first_day, 'D').astype('datetime64[M]'),
+                           np.datetime64(last_day, 'D').astype('datetime64[M]') + 1)
+        starts = months.astype('datetime64[D]').astype(np.int64)
+    
+    if len(starts) > MAX_CALENDAR_BUCKETS:
+        raise CalendarQueryError(f"{len(starts):,} {bucket} buckets requested; narrow the date range or use a larger bucket")
+    return starts
+
+def _rates(counts):
+    total = counts.sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delivery = np.where(total > 0, counts[..., 0] / total * 100, np.nan)
+        rto = np.where(total > 0, counts[..., 1] / total * 100, np.nan)
+    return total, delivery, rto
+
+def query_edd_calendar(calendar, labels, dimension=None, bucket='week', edd_window=(None, None),
+                       values=None, window=DEFAULT_ROLLING_WINDOW):
+    """
+    Breach counts and rates per effective_edd bucket (and per dimension value,
+    or overall when dimension is None) within edd_window, with rolling
+    delivery_percentage and rto_rate over the last `window` buckets. Every
+    bucket is answered by subtracting two running totals, never by scanning rows.
+    """
+    if bucket not in CALENDAR_BUCKETS:
+        raise CalendarQueryError(f"bucket must be one of: {', '.join(CALENDAR_BUCKETS)}")
+    if dimension is not None and dimension not in CALENDAR_DIMENSIONS:
+        raise CalendarQueryError(f"Unknown calendar dimension: {dimension}")
+    if window < 1:
+        raise CalendarQueryError('window must be at least 1 bucket')
+    
+    label_column = dimension or 'dimension'
+    columns = [f"edd_{bucket}", label_column, 'total_shipments', 'delivered_count', 'rto_count',
+               'delivery_percentage', 'rto_rate', 'rolling_delivery_percentage', 'rolling_rto_rate']
+    days = calendar['days']
+    first_day = edd_window[0] if edd_window[0] is not None else (int(days[0]) if len(days) else None)
+    last_day = edd_window[1] if edd_window[1] is not None else (int(days[-1]) if len(days) else None)
+    if first_day is None or last_day is None or first_day > last_day:
+        return pd.DataFrame(columns=columns)
+    
+    # Bucket i covers edges[i]..edges[i + 1] - 1, clipped to the window
+    starts = bucket_starts(first_day, last_day, bucket)
+    edges = np.append(np.maximum(starts, first_day), last_day + 1)
+    positions = np.searchsorted(days, edges, side='left')
+    cumulative = calendar['cumulative'][dimension or CALENDAR_DIMENSIONS[0]]
+    counts = cumulative[positions[1:]] - cumulative[positions[:-1]]
+    
+    if dimension is None:
+        counts = counts.sum(axis=1, keepdims=True)
+        group_labels = ['All']
+    else:
+        group_labels = list(labels[dimension]) + [None]
+    
+    groups = np.flatnonzero(counts.sum(axis=(0, 2)) > 0)
+    if values is not None:
+        groups = [group for group in groups if group_labels[group] in values]
+    counts = counts[:, groups]
+    
+    # Rolling sums are differences of running totals over the buckets
+    running = np.concatenate([np.zeros((1, *counts.shape[1:]), dtype=np.int64), np.cumsum(counts, axis=0)])
+    ends = np.arange(1, len(starts) + 1)
+    rolling = running[ends] - running[np.maximum(ends - window, 0)]
+    
+    total, delivery, rto = _rates(counts)
+    _, rolling_delivery, rolling_rto = _rates(rolling)
+    n_buckets, n_groups = total.shape
+    
+    # One row per (bucket, dimension value), buckets labelled by their calendar
+    # start (the first day of the week or month, even when the window starts later)
+    bucket_labels = np.datetime_as_string(starts.astype('datetime64[D]'))
+    return pd.DataFrame({
+        columns[0]: np.repeat(bucket_labels, n_groups),
+        label_column: np.tile(np.array([group_labels[group] for group in groups], dtype=object), n_buckets),
+        'total_shipments': total.ravel(),
+        'delivered_count': counts[..., 0].ravel(),
+        'rto_count': counts[..., 1].ravel(),
+        'delivery_percentage': delivery.ravel(),
+        'rto_rate': rto.ravel(),
+        'rolling_delivery_percentage': rolling_delivery.ravel(),
+        'rolling_rto_rate': rolling_rto.ravel()
+    })
@@ -0,0 +1,338 @@
+import os
+import pickle
+import tempfile
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from pyarrow import feather
+
+from analysis import (
+    ANALYSIS_VERSION, CSV_DTYPES, read_large_csv_optimized, derive_effective_edd,
+    classify_tat_breaches, aggregate_breach_dimensions, merge_breach_aggregates,
+    subtract_breach_aggregates, calculate_daywise_statistics, calculate_payment_method_analysis,
+    calculate_zone_performance_analysis, calculate_route_performance_analysis,
+    calculate_parent_courier_performance
+)
+
+# Column that identifies a shipment across daily exports
+SHIPMENT_KEY_COLUMN = os.environ.get('SHIPMENT_KEY_COLUMN', 'awb')
+
+# A shipment is recomputed when any of these change between exports
+TRACKED_COLUMNS = [
+    'tracking_status_group', 'first_attempt_date', 'delivered_date', 'effective_edd',
+    'payment_method', 'applied_zone', 'parent_courier_name', 'pickup_state', 'delivery_state'
+]
+CONTRIBUTION_COLUMNS = ['tat_breach', 'days_after_tat_breach', 'shipment_category']
+
+# Small state file (aggregates, shipment count and the partition list),
+# rewritten each run. Shipment rows are appended per run as uncompressed
+# Feather partitions sorted by key hash, each next to its sorted key hashes
+# (.keys.npy) and the positions of its rows aged against the current date
+# (.dated.npy); the newest partition holding a key has the shipment's row.
+STATE_FILENAME = 'incremental_state.pkl'
+PARTITION_FOLDER = 'shipments'
+
+# Partitions are merged into one when there would be more than this many, or
+# when superseded rows would outnumber the current ones
+MAX_STATE_PARTITIONS = int(os.environ.get('MAX_INCREMENTAL_PARTITIONS', 16))
+
+def _empty_shipments(key_column):
+    shipments = pd.DataFrame(columns=[*TRACKED_COLUMNS, *CONTRIBUTION_COLUMNS])
+    shipments.index.name = key_column
+    return shipments
+
+def _empty_state():
+    return {'version': ANALYSIS_VERSION, 'aggregates': None, 'partitions': [], 'stored_rows': 0, 'shipment_count': 0}
+
+def _key_hashes(keys):
+    """64-bit hashes of shipment keys, the order partitions are sorted and searched in"""
+    return pd.util.hash_array(np.asarray(keys, dtype=object))
+
+def _partition_path(store_dir, name, suffix):
+    return os.path.join(store_dir, PARTITION_FOLDER, f"{name}{suffix}")
+
+def _write_partition(store_dir, shipments):
+    hashes = _key_hashes(shipments.index)
+    order = np.argsort(hashes, kind='stable')
+    shipments = shipments.iloc[order]
+    
+    name = uuid.uuid4().hex
+    os.makedirs(os.path.join(store_dir, PARTITION_FOLDER), exist_ok=True)
+    shipments.reset_index().to_feather(_partition_path(store_dir, name, '.feather'), compression='uncompressed')
+    np.save(_partition_path(store_dir, name, '.keys.npy'), hashes[order])
+    np.save(_partition_path(store_dir, name, '.dated.npy'), np.flatnonzero(_date_dependent(shipments)))
+    return name
+
+def _read_rows(store_dir, name, rows, key_column):
+    """Rows of a partition by position, taken from the memory-mapped file"""
+    table = feather.read_table(_partition_path(store_dir, name, '.feather'), memory_map=True)
+    return table.take(rows).to_pandas().set_index(key_column)
+
+def _concat_rows(frames, key_column):
+    return _compact(pd.concat(frames)) if frames else _empty_shipments(key_column)
+
+def _locate(store_dir, partitions, hashes):
+    """
+    Partition number and row of each key hash's stored row, searching the
+    newest partition first (partition -1 for keys never stored)
+    """
+    partition = np.full(len(hashes), -1)
+    row = np.zeros(len(hashes), dtype=np.int64)
+    for number in range(len(partitions) - 1, -1, -1):
+        pending = np.flatnonzero(partition < 0)
+        if len(pending) == 0:
+            break
+        stored = np.load(_partition_path(store_dir, partitions[number], '.keys.npy'), mmap_mode='r')
+        position = np.searchsorted(stored, hashes[pending])
+        found = stored[np.minimum(position, len(stored) - 1)] == hashes[pending]
+        partition[pending[found]] = number
+        row[pending[found]] = position[found]
+    return partition, row
+
+def _fetch_rows(store_dir, partitions, partition, row, key_column):
+    return _concat_rows([
+        _read_rows(store_dir, partitions[number], row[partition == number], key_column)
+        for number in np.unique(partition)
+    ], key_column)
+
+def _aged_rows(store_dir, partitions, key_column):
+    """
+    Stored shipments aged against the current date. Every run rewrites them,
+    so the current ones are all in the newest partition.
+    """
+    if not partitions:
+        return _empty_shipments(key_column)
+    rows = np.load(_partition_path(store_dir, partitions[-1], '.dated.npy'))
+    return _concat_rows([_read_rows(store_dir, partitions[-1], rows, key_column)], key_column)
+
+def _read_live(store_dir, partitions, key_column):
+    """Current row of every stored shipment (reads every partition)"""
+    seen = np.empty(0, dtype=np.uint64)
+    frames = []
+    for name in reversed(partitions):
+        hashes = np.load(_partition_path(store_dir, name, '.keys.npy'))
+        frames.append(_read_rows(store_dir, name, np.flatnonzero(~np.isin(hashes, seen)), key_column))
+        seen = np.union1d(seen, hashes)
+    return _concat_rows(frames, key_column)
+
+def _write_state(store_dir, state):
+    """Atomically replace the state file, then delete unlisted partition files"""
+    partition_dir = os.path.join(store_dir, PARTITION_FOLDER)
+    os.makedirs(partition_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=store_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, os.path.join(store_dir, STATE_FILENAME))
+    
+    # Partitions merged away, or left by a save that failed
+    for entry in os.scandir(partition_dir):
+        if entry.name.split('.')[0] not in state['partitions']:
+            os.remove(entry.path)
+
+def _migrate_state(store_dir, state):
+    """
+    Rewrite a state saved without key hashes (one pickle holding every
+    shipment, or unsorted partitions) as a single partition
+    """
+    shipments = state.pop('shipments', None)
+    if shipments is None:
+        key_column = state['key_column']
+        frames = [pd.read_feather(os.path.join(store_dir, PARTITION_FOLDER, name)) for name in state['partitions']]
+        shipments = pd.concat(frames, ignore_index=True).drop_duplicates(subset=[key_column], keep='last')
+        shipments = shipments.set_index(key_column)
+    
+    print(f"🔁 Migrating incremental state of {len(shipments):,} shipments...")
+    shipments.index = shipments.index.astype(str)
+    state.update(
+        partitions=[_write_partition(store_dir, shipments)] if len(shipments) else [],
+        stored_rows=len(shipments), shipment_count=len(shipments), key_column=shipments.index.name
+    )
+    _write_state(store_dir, state)
+    return state
+
+def load_incremental_state(store_dir):
+    """
+    Persisted aggregate counts, shipment count and partition list, or an empty state
+    """
+    try:
+        with open(os.path.join(store_dir, STATE_FILENAME), 'rb') as f:
+            state = pickle.load(f)
+    except FileNotFoundError:
+        return _empty_state()
+    if 'shipment_count' not in state:
+        state = _migrate_state(store_dir, state)
+    
+    if state['version'] != ANALYSIS_VERSION:
+        # Analysis logic changed: every stored shipment is reclassified on this run
+        print(f"🔁 Incremental state is from analysis v{state['version']}; reclassifying all shipments...")
+        state['aggregates'] = None
+        state['stale'] = True
+    return state
+
+def save_incremental_state(store_dir, state, delta):
+    """
+    Append delta (the shipments classified this run) as a partition, merging
+    every partition into one when there are too many or superseded rows
+    outnumber current ones. The state file is replaced atomically last, so a
+    failed save leaves the previous state intact.
+    """
+    state = dict(state)
+    if len(delta):
+        state['partitions'] = [*state['partitions'], _write_partition(store_dir, delta)]
+        state['stored_rows'] += len(delta)
+    
+    if len(state['partitions']) > MAX_STATE_PARTITIONS or state['stored_rows'] > 2 * state['shipment_count']:
+        shipments = _read_live(store_dir, state['partitions'], state['key_column'])
+        state['partitions'] = [_write_partition(store_dir, shipments)] if len(shipments) else []
+        state['stored_rows'] = len(shipments)
+    _write_state(store_dir, state)
+
+def _rows_equal(left, right):
+    """
+    Row-wise equality of the tracked columns of two aligned frames (missing == missing)
+    """
+    equal = np.ones(len(left), dtype=bool)
+    for col in TRACKED_COLUMNS:
+        if pd.api.types.is_datetime64_dtype(left[col]):
+            left_values = left[col].to_numpy(dtype='datetime64[ns]').view('i8')
+            right_values = pd.to_datetime(right[col]).to_numpy(dtype='datetime64[ns]').view('i8')
+        else:
+            left_values = left[col].astype(str).to_numpy()
+            right_values = right[col].astype(str).to_numpy()
+        equal &= left_values == right_values
+    return equal
+
+def _date_dependent(shipments):
+    """
+    Shipments whose breach status or days are aged against the current date
+    (an EDD but no first attempt, and not delivered with a delivered_date)
+    """
+    delivered_with_date = (shipments['tracking_status_group'] == 'Delivered') & shipments['delivered_date'].notna()
+    return (
+        shipments['effective_edd'].notna()
+        & shipments['first_attempt_date'].isna()
+        & ~delivered_with_date
+    ).to_numpy()
+
+def _compact(shipments):
+    for col in TRACKED_COLUMNS:
+        if col in CSV_DTYPES and not isinstance(shipments[col].dtype, pd.CategoricalDtype):
+            shipments[col] = shipments[col].astype('category')
+    return shipments
+
+def _classify_shipments(shipments, current_date):
+    """
+    Recompute the breach contribution of each shipment (no EDD: no contribution)
+    """
+    shipments = _compact(shipments[TRACKED_COLUMNS].copy())
+    shipments['tat_breach'] = False
+    shipments['days_after_tat_breach'] = np.nan
+    shipments['shipment_category'] = None
+    
+    has_edd = shipments['effective_edd'].notna().to_numpy()
+    if has_edd.any():
+        classified = classify_tat_breaches(shipments[has_edd].copy(), current_date)
+        for col in CONTRIBUTION_COLUMNS:
+            shipments.loc[has_edd, col] = classified[col].to_numpy()
+    
+    shipments['tat_breach'] = shipments['tat_breach'].astype(bool)
+    shipments['days_after_tat_breach'] = shipments['days_after_tat_breach'].astype('float64')
+    return shipments
+
+def _aggregate_breaches(shipments):
+    breach_rows = shipments[shipments['tat_breach'].astype(bool)]
+    if len(breach_rows) == 0:
+        return None
+    return aggregate_breach_dimensions(_compact(breach_rows.copy()), workers=1)
+
+def update_incremental_analysis(file_path, store_dir, key_column=None):
+    """
+    Merge a new export into the persisted shipment state and aggregates.
+    
+    Only shipments that are new, whose tracked columns changed, or whose breach
+    status depends on today's date are classified; their previous contribution
+    is subtracted from the stored aggregates and the new one added. Returns the
+    same tuple as analyze_comprehensive_delivery_performance_corrected, over
+    every shipment seen so far.
+    """
+    try:
+        key_column = key_column or SHIPMENT_KEY_COLUMN
+        print(f"🔁 Incremental update of {store_dir} from {file_path}")
+        
+        state = load_incremental_state(store_dir)
+        partitions, stored_rows = state['partitions'], state['stored_rows']
+        
+        df = read_large_csv_optimized(file_path, extra_columns=[key_column])
+        if df is None:
+            return None, None, None, None, None
+        if key_column not in df.columns:
+            print(f"❌ Key column '{key_column}' not found; cannot match shipments across exports")
+            return None, None, None, None, None
+        
+        df = df.dropna(subset=[key_column]).drop_duplicates(subset=[key_column], keep='last')
+        df[key_column] = df[key_column].astype(str)
+        df = derive_effective_edd(df.set_index(key_column))[TRACKED_COLUMNS]
+        
+        # Stored rows of this export's shipments, and the stored shipments that
+        # must be re-aged against today (or, after an analysis version change,
+        # every stored shipment, reclassified and rewritten as one partition)
+        if state.get('stale'):
+            stored = aged = _read_live(store_dir, partitions, key_column)
+            known = df.index.isin(stored.index)
+            partitions, stored_rows = [], 0
+        else:
+            partition, row = _locate(store_dir, partitions, _key_hashes(df.index))
+            known = partition >= 0
+            stored = _fetch_rows(store_dir, partitions, partition[known], row[known], key_column)
+            aged = _aged_rows(store_dir, partitions, key_column)
+        
+        # New and changed shipments in this export
+        changed = np.zeros(len(df), dtype=bool)
+        if known.any():
+            changed[known] = ~_rows_equal(df[known], stored.loc[df.index[known]])
+        incoming = df[~known | changed]
+        refreshed = aged.loc[~aged.index.isin(incoming.index), TRACKED_COLUMNS]
+        
+        print(f"🔁 {(~known).sum():,} new, {changed.sum():,} changed and {len(refreshed):,} re-aged shipments "
+              f"({len(df):,} in export, {state['shipment_count']:,} stored)")
+        
+        delta = _classify_shipments(pd.concat([incoming, refreshed]), datetime.now())
+        delta.index.name = key_column
+        shipment_count = state['shipment_count'] + int((~known).sum())
+        
+        aggregates = state['aggregates']
+        if not state.get('stale'):
+            superseded = pd.concat([stored, aged])
+            superseded = superseded[~superseded.index.duplicated() & superseded.index.isin(delta.index)]
+            aggregates = subtract_breach_aggregates(aggregates, _aggregate_breaches(superseded))
+        aggregates = merge_breach_aggregates(aggregates, _aggregate_breaches(delta))
+        
+        save_incremental_state(store_dir, {
+            'version': ANALYSIS_VERSION,
+            'aggregates': aggregates,
+            'partitions': partitions,
+            'stored_rows': stored_rows,
+            'shipment_count': shipment_count,
+            'key_column': key_column,
+            'updated_at': datetime.now().isoformat()
+        }, delta)
+        
+        if aggregates is None:
+            print("❌ No TAT breach cases found in the stored shipments")
+            return None, None, None, None, None
+        
+        print(f"✅ Incremental state holds {shipment_count:,} shipments")
+        return (
+            calculate_daywise_statistics(aggregates),
+            calculate_payment_method_analysis(None, aggregates),
+            calculate_zone_performance_analysis(None, aggregates),
+            calculate_route_performance_analysis(None, aggregates),
+            calculate_parent_courier_performance(None, aggregates),
+            shipment_count
+        )
+    
+    except Exception as e:
+        print(f"❌ Error during incremental analysis: {str(e)}")
+        return None, None, None, None, None
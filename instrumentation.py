@@ -0,0 +1,239 @@
+import contextvars
+import glob
+import itertools
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+# Per-run JSON profiles are written here and read back by the metrics endpoint
+PROFILE_FOLDER = os.environ.get('PROFILE_FOLDER', 'profiles')
+
+# Oldest profiles are deleted beyond this many files, checked every
+# PROFILE_PRUNE_INTERVAL writes of a process (and on its first write)
+PROFILE_RETENTION = int(os.environ.get('PROFILE_RETENTION', 500))
+PROFILE_PRUNE_INTERVAL = int(os.environ.get('PROFILE_PRUNE_INTERVAL', 50))
+
+# Number of most recent runs summarized by the metrics endpoint
+METRICS_WINDOW = int(os.environ.get('METRICS_WINDOW', 100))
+
+_active_profile = contextvars.ContextVar('active_profile', default=None)
+_profile_writes = itertools.count()
+
+def current_rss_bytes():
+    """Resident set size of this process (peak RSS where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return peak_rss_bytes()
+
+def peak_rss_bytes():
+    """High-water RSS of this process (ru_maxrss is in KB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def _mb(n_bytes):
+    return round(n_bytes / (1024 * 1024), 1)
+
+class RunProfile:
+    """
+    Stage timings of one run. Repeated stages (e.g. one per streamed chunk)
+    accumulate into a single entry.
+    """
+    def __init__(self, kind, label=None):
+        self.run_id = uuid.uuid4().hex
+        self.kind = kind
+        self.label = label
+        self.started_at = datetime.now()
+        self.info = {}
+        self.stages = {}
+        self.result = None
+        self._start = time.perf_counter()
+        self._rss_start = current_rss_bytes()
+        self._lock = threading.Lock()
+    
+    def record(self, name, seconds, rows_in, rows_out, rss_delta):
+        with self._lock:
+            entry = self.stages.setdefault(name, {
+                'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'rows_in': None, 'rows_out': None,
+                'rss_delta_mb': 0.0, 'peak_rss_mb': 0.0
+            })
+            entry['calls'] += 1
+            entry['seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+            if rows_in is not None:
+                entry['rows_in'] = (entry['rows_in'] or 0) + int(rows_in)
+            if rows_out is not None:
+                entry['rows_out'] = (entry['rows_out'] or 0) + int(rows_out)
+            entry['rss_delta_mb'] += _mb(rss_delta)
+            entry['peak_rss_mb'] = max(entry['peak_rss_mb'], _mb(peak_rss_bytes()))
+    
+    def finish(self, status):
+        return {
+            'run_id': self.run_id,
+            'kind': self.kind,
+            'label': self.label,
+            'status': status,
+            'started_at': self.started_at.isoformat(),
+            'total_seconds': round(time.perf_counter() - self._start, 4),
+            'rss_delta_mb': _mb(current_rss_bytes() - self._rss_start),
+            'peak_rss_mb': _mb(peak_rss_bytes()),
+            'pid': os.getpid(),
+            'info': self.info,
+            'stages': [
+                {'stage': name, **entry, 'seconds': round(entry['seconds'], 4),
+                 'max_seconds': round(entry['max_seconds'], 4), 'rss_delta_mb': round(entry['rss_delta_mb'], 1)}
+                for name, entry in self.stages.items()
+            ]
+        }
+
+@contextmanager
+def profile_run(kind, label=None, profile_folder=None):
+    """
+    Collect the stages run inside this block and write them to a JSON profile
+    on exit. Inside an active run, joins that run instead.
+    """
+    active = _active_profile.get()
+    if active is not None:
+        yield active
+        return
+    
+    profile = RunProfile(kind, label)
+    token = _active_profile.set(profile)
+    status = 'ok'
+    try:
+        yield profile
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        _active_profile.reset(token)
+        # The finished profile stays readable on the yielded object
+        profile.result = profile.finish(profile.info.pop('status', status))
+        write_profile(profile.result, profile_folder or PROFILE_FOLDER)
+
+@contextmanager
+def stage(name, rows_in=None):
+    """
+    Time one pipeline stage of the active run. The yielded dict takes the
+    row counts: counts['rows_out'] = len(result). No-op outside a run.
+    """
+    counts = {'rows_in': rows_in, 'rows_out': None}
+    profile = _active_profile.get()
+    if profile is None:
+        yield counts
+        return
+    
+    rss_before = current_rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield counts
+    finally:
+        profile.record(name, time.perf_counter() - start, counts['rows_in'], counts['rows_out'],
+                       current_rss_bytes() - rss_before)
+
+def staged_chunks(name, chunks):
+    """Yield from a chunk iterator, timing each read as a stage"""
+    iterator = iter(chunks)
+    while True:
+        with stage(name) as counts:
+            chunk = next(iterator, None)
+            counts['rows_out'] = len(chunk) if chunk is not None else 0
+        if chunk is None:
+            return
+        yield chunk
+
+def write_profile(result, profile_folder):
+    """
+    Atomically write a run profile, pruning the oldest beyond PROFILE_RETENTION
+    every PROFILE_PRUNE_INTERVAL writes
+    """
+    try:
+        os.makedirs(profile_folder, exist_ok=True)
+        filename = f"{result['started_at'].replace(':', '').replace('-', '')}_{result['run_id']}.json"
+        fd, tmp_path = tempfile.mkstemp(dir=profile_folder, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(result, f, indent=2)
+        os.replace(tmp_path, os.path.join(profile_folder, filename))
+        
+        if next(_profile_writes) % PROFILE_PRUNE_INTERVAL == 0:
+            for old_profile in sorted(glob.glob(os.path.join(profile_folder, '*.json')))[:-PROFILE_RETENTION]:
+                os.remove(old_profile)
+    except Exception as e:
+        print(f"Error writing run profile: {e}")
+
+def load_profiles(profile_folder, limit=METRICS_WINDOW):
+    """Most recent run profiles, newest first"""
+    profiles = []
+    for path in sorted(glob.glob(os.path.join(profile_folder, '*.json')), reverse=True)[:limit]:
+        try:
+            with open(path) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+def load_profile(profile_folder, run_id):
+    """One run profile by run id, or None"""
+    for path in glob.glob(os.path.join(profile_folder, f"*_{os.path.basename(run_id)}.json")):
+        with open(path) as f:
+            return json.load(f)
+    return None
+
+def metrics_summary(profile_folder, window=METRICS_WINDOW):
+    """
+    Per-stage timing and memory statistics over the most recent runs
+    """
+    profiles = load_profiles(profile_folder, window)
+    runs = {}
+    stages = {}
+    for profile in profiles:
+        run = runs.setdefault(profile['kind'], {'runs': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+        run['runs'] += 1
+        run['errors'] += profile['status'] != 'ok'
+        run['total_seconds'] += profile['total_seconds']
+        run['max_seconds'] = max(run['max_seconds'], profile['total_seconds'])
+        
+        for entry in profile['stages']:
+            stats = stages.setdefault(f"{profile['kind']}.{entry['stage']}", {
+                'runs': 0, 'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'last_seconds': None,
+                'rows_in': 0, 'rows_out': 0, 'max_rss_delta_mb': None, 'max_peak_rss_mb': 0.0
+            })
+            stats['runs'] += 1
+            stats['calls'] += entry['calls']
+            stats['seconds'] += entry['seconds']
+            stats['max_seconds'] = max(stats['max_seconds'], entry['seconds'])
+            if stats['last_seconds'] is None:
+                stats['last_seconds'] = entry['seconds']
+            stats['rows_in'] += entry['rows_in'] or 0
+            stats['rows_out'] += entry['rows_out'] or 0
+            if stats['max_rss_delta_mb'] is None or entry['rss_delta_mb'] > stats['max_rss_delta_mb']:
+                stats['max_rss_delta_mb'] = entry['rss_delta_mb']
+            stats['max_peak_rss_mb'] = max(stats['max_peak_rss_mb'], entry['peak_rss_mb'])
+    
+    for run in runs.values():
+        run['mean_seconds'] = round(run.pop('total_seconds') / run['runs'], 4)
+        run['max_seconds'] = round(run['max_seconds'], 4)
+    for stats in stages.values():
+        stats['mean_seconds'] = round(stats['seconds'] / stats['runs'], 4)
+        stats['rows_per_second'] = round(stats['rows_in'] / stats['seconds']) if stats['rows_in'] and stats['seconds'] > 0 else None
+        stats['seconds'] = round(stats['seconds'], 4)
+        stats['max_seconds'] = round(stats['max_seconds'], 4)
+    
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'window': len(profiles),
+        'process_rss_mb': _mb(current_rss_bytes()),
+        'process_peak_rss_mb': _mb(peak_rss_bytes()),
+        'runs': runs,
+        'stages': stages,
+        'recent_runs': [
+            {key: profile[key] for key in ('run_id', 'kind', 'label', 'status', 'started_at', 'total_seconds', 'peak_rss_mb')}
+            for profile in profiles[:20]
+        ]
+    }
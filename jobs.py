@@ -0,0 +1,394 @@
+import fcntl
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import redirect_stdout
+
+from analysis import analyze_comprehensive_delivery_performance_corrected
+from result_cache import result_cache_key, batch_cache_key, load_cached_results, store_cached_results, single_flight
+from instrumentation import profile_run, stage
+from breach_index import BreachIndexBuilder, breach_index_exists
+from batch import analyze_batch
+from memory_budget import set_concurrent_analyses
+
+# Number of analyses that may run in parallel (each gets an equal part of the
+# memory budget, see memory_budget.py)
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', 2))
+
+# Finished jobs are forgotten after this many seconds
+JOB_RETENTION_SECONDS = 60 * 60
+
+# Every job is also recorded as <job id>.json in the job folder, so any web
+# worker can report on it; submissions are serialized through this lock file
+SUBMIT_LOCK_FILENAME = '.submit.lock'
+JOB_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+# Progress checkpoints: (text printed by analysis.py, percent complete)
+PROGRESS_CHECKPOINTS = [
+    ('Starting Memory-Optimized', 5),
+    ('Loading large dataset', 10),
+    ('Streaming dataset', 10),
+    ('Dataset loaded', 35),
+    ('Streamed', 60),
+    ('Filtered dataset', 40),
+    ('Calculating TAT breaches', 45),
+    ('TAT breach cases', 60),
+    ('Calculating daywise statistics', 70),
+    ('Calculating Payment Method Analysis', 75),
+    ('Calculating Zone Performance Analysis', 80),
+    ('Calculating Route Performance Analysis', 85),
+    ('Calculating Parent Courier Performance', 90),
+    ('analysis completed successfully', 95),
+    ('Batch analysis of', 5),
+    ('Combining batch results', 90),
+    ('Batch analysis completed', 95)
+]
+
+# Batch progress line: files analyzed out of the batch size, scaled into 10-90%
+BATCH_PROGRESS_PATTERN = re.compile(r'Batch: analyzed (\d+)/(\d+) files')
+
+_executor = None
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+class _ProgressWriter:
+    """
+    stdout replacement that also appends every printed line to a progress file
+    """
+    def __init__(self, progress_path, stream):
+        self.progress_file = open(progress_path, 'a', buffering=1, encoding='utf-8')
+        self.stream = stream
+    
+    def write(self, text):
+        self.stream.write(text)
+        self.progress_file.write(text)
+        return len(text)
+    
+    def flush(self):
+        self.stream.flush()
+        self.progress_file.flush()
+    
+    def close(self):
+        self.progress_file.close()
+
+def run_analysis_job(filepath, progress_path, cache_dir, cache_max_bytes, profile_folder=None,
+                     index_dir=None, index_max_bytes=None):
+    """
+    Worker-process entry point: analyze one upload, reporting progress through
+    the analysis prints, and return the result cache key (None on failure).
+    Stage timings are written to a run profile in profile_folder and the
+    breach rows are indexed for drill-down queries in index_dir.
+    """
+    writer = _ProgressWriter(progress_path, sys.stdout)
+    builder = None
+    try:
+        with redirect_stdout(writer), profile_run('analysis', os.path.basename(filepath), profile_folder) as profile:
+            profile.info['file_size_mb'] = round(os.path.getsize(filepath) / (1024 * 1024), 2)
+            with stage('content_hash'):
+                cache_key = result_cache_key(filepath)
+            with stage('cache_load'):
+                results = load_cached_results(cache_dir, cache_key)
+            profile.info['cache_hit'] = results is not None
+            
+            # A cached result whose breach index was evicted is analyzed again
+            if index_dir is not None and not breach_index_exists(index_dir, cache_key):
+                # Breach rows are spilled next to the indexes until the index is written
+                builder = BreachIndexBuilder(index_dir)
+            
+            if results is None or builder is not None:
+                # One analysis per key across all workers; the others wait for it
+                with single_flight(cache_dir, cache_key) as waited:
+                    if waited:
+                        if results is None:
+                            results = load_cached_results(cache_dir, cache_key)
+                        if builder is not None and breach_index_exists(index_dir, cache_key):
+                            builder = None
+                        profile.info['shared_result'] = results is not None and builder is None
+                    
+                    if results is None or builder is not None:
+                        results = analyze_comprehensive_delivery_performance_corrected(
+                            filepath, breach_sink=builder.add if builder is not None else None
+                        )
+                        if results is None or results[0] is None:
+                            profile.info['status'] = 'failed'
+                            return None
+                        with stage('cache_store'):
+                            store_cached_results(cache_dir, cache_key, results, cache_max_bytes)
+                        if builder is not None:
+                            with stage('breach_index'):
+                                builder.write(index_dir, cache_key, index_max_bytes)
+            
+            profile.info['total_records'] = int(results[5])
+            return cache_key
+    finally:
+        if builder is not None:
+            # Spill files of an analysis that failed or was not written
+            builder.close()
+        writer.close()
+
+def run_batch_job(filepaths, progress_path, cache_dir, cache_max_bytes, profile_folder=None):
+    """
+    Worker-process entry point for a multi-file batch: analyze the exports as
+    one dataset and return the cache key of the combined results (None on failure)
+    """
+    writer = _ProgressWriter(progress_path, sys.stdout)
+    try:
+        with redirect_stdout(writer), profile_run('batch', f"{len(filepaths)} files", profile_folder) as profile:
+            profile.info['file_size_mb'] = round(sum(os.path.getsize(path) for path in filepaths) / (1024 * 1024), 2)
+            with stage('content_hash'):
+                cache_key = batch_cache_key(filepaths)
+            with stage('cache_load'):
+                results = load_cached_results(cache_dir, cache_key)
+            profile.info['cache_hit'] = results is not None
+            
+            if results is None:
+                with single_flight(cache_dir, cache_key) as waited:
+                    if waited:
+                        results = load_cached_results(cache_dir, cache_key)
+                        profile.info['shared_result'] = results is not None
+                    
+                    if results is None:
+                        batch = analyze_batch(filepaths)
+                        results = batch['combined']
+                        if results is None or batch['failed']:
+                            profile.info['status'] = 'failed'
+                            return None
+                        with stage('cache_store'):
+                            store_cached_results(cache_dir, cache_key, results, cache_max_bytes)
+            
+            profile.info['total_records'] = int(results[5])
+            return cache_key
+    finally:
+        writer.close()
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # spawn: never fork a threaded web worker
+        _executor = ProcessPoolExecutor(
+            max_workers=ANALYSIS_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=set_concurrent_analyses,
+            initargs=(ANALYSIS_WORKERS,)
+        )
+    return _executor
+
+def _record_path(job_folder, job_id):
+    return os.path.join(job_folder, f"{job_id}.json")
+
+def _write_job_record(job_folder, record):
+    # Written aside and renamed, so other workers never read a partial record
+    path = _record_path(job_folder, record['job_id'])
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(record, f)
+    os.replace(tmp_path, path)
+
+def _read_job_record(job_folder, job_id):
+    if job_folder is None or not JOB_ID_PATTERN.fullmatch(job_id):
+        return None
+    try:
+        with open(_record_path(job_folder, job_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _record_active(record):
+    """Whether a recorded job is still queued or running in a live worker"""
+    return record['status'] not in ('done', 'failed') and _process_alive(record['owner_pid'])
+
+def _future_outcome(future):
+    """(status, message, cache key) of a finished job future"""
+    if future.exception() is not None:
+        return 'failed', f"Analysis error: {future.exception()}", None
+    if future.result() is None:
+        return 'failed', 'Analysis failed. Please check your data format and ensure all required columns are present.', None
+    return 'done', None, future.result()
+
+def _finish_job_record(job_folder, record, future):
+    record['status'], record['message'], record['cache_key'] = _future_outcome(future)
+    try:
+        _write_job_record(job_folder, record)
+    except OSError as e:
+        print(f"Error recording job {record['job_id']}: {e}")
+
+def _prune_jobs(job_folder):
+    cutoff = time.time() - JOB_RETENTION_SECONDS
+    for job_id, job in list(_jobs.items()):
+        if job['future'].done() and job['submitted_at'] < cutoff:
+            _jobs.pop(job_id, None)
+    
+    # Records and progress files of every worker's jobs
+    for entry in os.scandir(job_folder):
+        if not entry.name.endswith('.json'):
+            continue
+        job_id = entry.name[:-len('.json')]
+        record = _read_job_record(job_folder, job_id)
+        if record is None or record['submitted_at'] >= cutoff or _record_active(record):
+            continue
+        for path in (entry.path, record['progress_path']):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def submit_analysis_job(filepath, job_folder, cache_dir, cache_max_bytes, profile_folder=None,
+                        index_dir=None, index_max_bytes=None):
+    """
+    Queue an analysis of filepath and return its job id. A file that is
+    already queued or running (in any web worker) returns the existing job.
+    """
+    return _submit_job(
+        filepath, os.path.basename(filepath), job_folder,
+        lambda progress_path: (run_analysis_job, filepath, progress_path, cache_dir, cache_max_bytes,
+                               profile_folder, index_dir, index_max_bytes)
+    )
+
+def submit_batch_job(filepaths, filename, job_folder, cache_dir, cache_max_bytes, profile_folder=None):
+    """
+    Queue a combined analysis of several exports, shown under filename, and
+    return its job id
+    """
+    return _submit_job(
+        list(filepaths), filename, job_folder,
+        lambda progress_path: (run_batch_job, list(filepaths), progress_path, cache_dir, cache_max_bytes,
+                               profile_folder)
+    )
+
+def _submit_job(filepath, filename, job_folder, job_args):
+    global _executor
+    
+    os.makedirs(job_folder, exist_ok=True)
+    with _jobs_lock, open(os.path.join(job_folder, SUBMIT_LOCK_FILENAME), 'a') as submit_lock:
+        fcntl.flock(submit_lock, fcntl.LOCK_EX)
+        _prune_jobs(job_folder)
+        
+        for entry in os.scandir(job_folder):
+            if entry.name.endswith('.json'):
+                record = _read_job_record(job_folder, entry.name[:-len('.json')])
+                if record is not None and record['filepath'] == filepath and _record_active(record):
+                    return record['job_id']
+        
+        job_id = uuid.uuid4().hex
+        progress_path = os.path.join(job_folder, f"{job_id}.log")
+        args = job_args(progress_path)
+        
+        try:
+            future = _get_executor().submit(*args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); start a fresh pool
+            _executor = None
+            future = _get_executor().submit(*args)
+        
+        record = {
+            'job_id': job_id,
+            'filepath': filepath,
+            'filename': filename,
+            'progress_path': progress_path,
+            'submitted_at': time.time(),
+            'owner_pid': os.getpid(),
+            'status': 'queued',
+            'message': None,
+            'cache_key': None
+        }
+        _write_job_record(job_folder, record)
+        _jobs[job_id] = {**record, 'future': future}
+        future.add_done_callback(lambda future: _finish_job_record(job_folder, dict(record), future))
+        return job_id
+
+def _read_progress(progress_path, tail_lines=20):
+    try:
+        with open(progress_path, encoding='utf-8') as f:
+            lines = [line.strip() for line in f if line.strip()]
+    except FileNotFoundError:
+        return 0, []
+    
+    percent = 0
+    for line in lines:
+        for marker, checkpoint in PROGRESS_CHECKPOINTS:
+            if marker in line:
+                percent = max(percent, checkpoint)
+        batch_progress = BATCH_PROGRESS_PATTERN.search(line)
+        if batch_progress:
+            done, total = map(int, batch_progress.groups())
+            percent = max(percent, 10 + 80 * done // total)
+    return percent, lines[-tail_lines:]
+
+def _job_state(job_id, job_folder):
+    """
+    (job, status, message, cache key) of a job submitted by this web worker
+    or, through its record, by another one; None for an unknown job id
+    """
+    job = _jobs.get(job_id)
+    if job is not None:
+        future = job['future']
+        if future.running():
+            return job, 'running', None, None
+        if not future.done():
+            return job, 'queued', None, None
+        return (job, *_future_outcome(future))
+    
+    job = _read_job_record(job_folder, job_id)
+    if job is None:
+        return None
+    if job['status'] in ('done', 'failed'):
+        return job, job['status'], job['message'], job['cache_key']
+    if not _process_alive(job['owner_pid']):
+        return job, 'failed', 'The web worker running this analysis stopped. Please upload the file again.', None
+    # The analysis process opens the progress file as it starts
+    return job, 'running' if os.path.exists(job['progress_path']) else 'queued', None, None
+
+def get_job_status(job_id, job_folder=None):
+    """
+    JSON-serializable status of a job, or None for an unknown job id
+    """
+    state = _job_state(job_id, job_folder)
+    if state is None:
+        return None
+    
+    job, job_status, message, _ = state
+    percent, log = _read_progress(job['progress_path'])
+    status = {
+        'job_id': job_id,
+        'filename': job['filename'],
+        'elapsed_seconds': round(time.time() - job['submitted_at'], 1),
+        'progress': percent,
+        'message': message or (log[-1] if log else 'Starting analysis...'),
+        'log': log,
+        'status': job_status
+    }
+    if job_status == 'queued':
+        status['message'] = 'Waiting for a free analysis worker...'
+    elif job_status == 'done':
+        status['progress'] = 100
+    
+    return status
+
+def get_job_results(job_id, cache_dir, job_folder=None):
+    """
+    (cache key, results tuple) of a successfully finished job, otherwise None.
+    The results are read back from the result cache; an evicted entry gives
+    (cache key, None).
+    """
+    state = _job_state(job_id, job_folder)
+    if state is None or state[1] != 'done':
+        return None
+    
+    cache_key = state[3]
+    return cache_key, load_cached_results(cache_dir, cache_key)
@@ -0,0 +1,228 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from compressed_input import open_export, export_size
+
+# Memory an analysis may use, in MB (0 = a share of the memory available to
+# this container or host, see MEMORY_BUDGET_FRACTION)
+MEMORY_BUDGET_MB = int(os.environ.get('MEMORY_BUDGET_MB', 0))
+MEMORY_BUDGET_FRACTION = float(os.environ.get('MEMORY_BUDGET_FRACTION', 0.5))
+
+# Analyses sharing that fraction at once (set in each analysis worker process
+# by jobs.py, see set_concurrent_analyses)
+_concurrent_analyses = 1
+
+# Rows parsed to estimate the in-memory size of an export
+SAMPLE_ROWS = 5000
+
+# Peak memory while parsing a chunk, relative to the parsed chunk
+PARSE_OVERHEAD = 3
+# Peak memory of the in-memory pipeline, relative to the loaded frame (derived
+# day arrays, masks and the breach copy)
+PIPELINE_OVERHEAD = 3
+
+MIN_CHUNK_ROWS = 10000
+MAX_CHUNK_ROWS = 1000000
+# Streamed chunk size when the available memory is unknown
+DEFAULT_STREAM_CHUNK_ROWS = 100000
+
+CGROUP_LIMIT_FILES = [
+    ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory.current'),
+    ('/sys/fs/cgroup/memory/memory.limit_in_bytes', '/sys/fs/cgroup/memory/memory.usage_in_bytes')
+]
+
+def _read_int(path):
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        # Missing file, or 'max' for an unlimited cgroup
+        return None
+
+def available_memory_bytes():
+    """
+    Memory this process can still allocate: the cgroup limit minus its usage
+    when running in a limited container, capped by the host's MemAvailable
+    """
+    available = []
+    for limit_path, usage_path in CGROUP_LIMIT_FILES:
+        limit = _read_int(limit_path)
+        # cgroup v1 reports a huge number when unlimited
+        if limit is not None and limit < 2 ** 60:
+            available.append(limit - (_read_int(usage_path) or 0))
+            break
+    
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    available.append(int(line.split()[1]) * 1024)
+                    break
+    except OSError:
+        pass
+    
+    return max(min(available), 0) if available else None
+
+def set_concurrent_analyses(count):
+    """Split the share of available memory between count analyses running at once"""
+    global _concurrent_analyses
+    _concurrent_analyses = max(int(count), 1)
+
+def memory_budget_bytes():
+    """
+    Configured memory budget, or this analysis's part of the share of the
+    available memory (None if unknown)
+    """
+    if MEMORY_BUDGET_MB > 0:
+        return MEMORY_BUDGET_MB * 1024 * 1024
+    available = available_memory_bytes()
+    if available is None:
+        return None
+    return int(available * MEMORY_BUDGET_FRACTION / _concurrent_analyses)
+
+def estimate_csv_size(file_path, read_options, sample_rows=SAMPLE_ROWS):
+    """
+    (estimated rows, in-memory bytes per row) of a CSV, from the byte length
+    and parsed size of its first sample_rows rows
+    """
+    with open_export(file_path) as f:
+        sample = pd.read_csv(f, nrows=sample_rows, low_memory=False, **read_options)
+    if len(sample) == 0:
+        return 0, 0
+    
+    # open_export is a binary stream, so multi-byte UTF-8 is counted in bytes
+    with open_export(file_path) as f:
+        header_bytes = len(f.readline())
+        sample_bytes = sum(len(line) for _, line in zip(range(len(sample)), f))
+    
+    # Compressed exports are sized by their CSV content, not the file on disk
+    file_bytes = export_size(file_path)
+    rows = len(sample) if sample_bytes >= file_bytes - header_bytes else int((file_bytes - header_bytes) / (sample_bytes / len(sample)))
+    row_bytes = sample.memory_usage(deep=True, index=False).sum() / len(sample)
+    return rows, row_bytes
+
+def plan_csv_read(file_path, read_options, budget=None):
+    """
+    How to load a CSV within the memory budget: 'single' when parsing it in one
+    call fits, otherwise 'chunked' with the largest chunk that fits next to the
+    loaded frame. 'fits' tells whether the in-memory pipeline fits at all.
+    """
+    budget = budget or memory_budget_bytes()
+    rows, row_bytes = estimate_csv_size(file_path, read_options)
+    frame_bytes = int(rows * row_bytes)
+    plan = {
+        'budget_bytes': budget,
+        'estimated_rows': rows,
+        'estimated_frame_bytes': frame_bytes,
+        'fits': budget is None or frame_bytes * PIPELINE_OVERHEAD <= budget,
+        'strategy': 'single',
+        'chunk_rows': None
+    }
+    if budget is None or frame_bytes * PARSE_OVERHEAD <= budget:
+        return plan
+    
+    # Whatever the loaded frame leaves over is working memory for one chunk
+    spare = max(budget - frame_bytes, 0)
+    plan['strategy'] = 'chunked'
+    plan['chunk_rows'] = chunk_rows_for_budget(spare, row_bytes)
+    return plan
+
+def chunk_rows_for_budget(budget, row_bytes):
+    """Rows per chunk so parsing one chunk stays within budget"""
+    if not row_bytes:
+        return MAX_CHUNK_ROWS
+    return int(np.clip(budget / (row_bytes * PARSE_OVERHEAD), MIN_CHUNK_ROWS, MAX_CHUNK_ROWS))
+
+def stream_chunk_rows(plan):
+    """Rows per streamed chunk, so one chunk and its derived pipeline columns fit the budget"""
+    if plan['budget_bytes'] is None or not plan['estimated_rows']:
+        return DEFAULT_STREAM_CHUNK_ROWS
+    row_bytes = plan['estimated_frame_bytes'] / plan['estimated_rows']
+    return chunk_rows_for_budget(plan['budget_bytes'] / PIPELINE_OVERHEAD, row_bytes)
+
+class ColumnarFrameBuilder:
+    """
+    Assembles CSV chunks into one DataFrame in linear time. Fixed-width columns
+    are copied into preallocated arrays (grown geometrically past the estimated
+    row count) and categoricals into integer codes against one shared category
+    list; other columns are concatenated once at the end.
+    """
+    def __init__(self, capacity):
+        self.capacity = max(int(capacity), 1)
+        self.rows = 0
+        self.columns = None
+        self.arrays = {}
+        self.categories = {}
+        self.parts = {}
+    
+    def _grow(self, needed):
+        self.capacity = max(needed, int(self.capacity * 1.5))
+        for col, array in self.arrays.items():
+            grown = np.empty(self.capacity, dtype=array.dtype)
+            grown[:self.rows] = array[:self.rows]
+            self.arrays[col] = grown
+    
+    def _init_column(self, col, series):
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            self.categories[col] = {}
+            self.arrays[col] = np.empty(self.capacity, dtype=np.int32)
+        elif isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufmM':
+            self.arrays[col] = np.empty(self.capacity, dtype=series.dtype)
+        else:
+            self.parts[col] = []
+    
+    def _to_parts(self, col):
+        """Fall back to concatenation for a column whose dtype changed between chunks"""
+        self.parts[col] = [self._build_column(col)] if self.rows else []
+        self.arrays.pop(col)
+        self.categories.pop(col, None)
+    
+    def append(self, chunk):
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+            for col in self.columns:
+                self._init_column(col, chunk[col])
+        
+        n = len(chunk)
+        if self.rows + n > self.capacity:
+            self._grow(self.rows + n)
+        
+        for col in self.columns:
+            series = chunk[col]
+            if col in self.categories and not isinstance(series.dtype, pd.CategoricalDtype):
+                self._to_parts(col)
+            elif col in self.arrays and col not in self.categories and series.dtype != self.arrays[col].dtype:
+                self._to_parts(col)
+            
+            if col in self.categories:
+                known = self.categories[col]
+                # The trailing -1 keeps missing values (code -1) missing
+                mapping = np.array([known.setdefault(label, len(known)) for label in series.cat.categories] + [-1], dtype=np.int32)
+                self.arrays[col][self.rows:self.rows + n] = mapping[series.cat.codes.to_numpy()]
+            elif col in self.arrays:
+                self.arrays[col][self.rows:self.rows + n] = series.to_numpy()
+            else:
+                self.parts[col].append(series)
+        self.rows += n
+    
+    def _build_column(self, col):
+        if col in self.categories:
+            labels = np.array(list(self.categories[col]), dtype=object)
+            # Sorted categories, as a single read_csv call produces
+            order = np.argsort(labels, kind='stable')
+            rank = np.empty(len(order) + 1, dtype=np.int32)
+            rank[order] = np.arange(len(order), dtype=np.int32)
+            rank[-1] = -1
+            return pd.Series(pd.Categorical.from_codes(rank[self.arrays[col][:self.rows]], categories=labels[order]), name=col)
+        if col in self.arrays:
+            return pd.Series(self.arrays[col][:self.rows], name=col)
+        return pd.concat(self.parts[col], ignore_index=True)
+    
+    def build(self):
+        if self.columns is None:
+            return pd.DataFrame()
+        frame = pd.DataFrame({col: self._build_column(col) for col in self.columns})
+        self.arrays, self.categories, self.parts = {}, {}, {}
+        return frame
@@ -0,0 +1,259 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import date
+
+from pyarrow import feather
+
+from analysis import ANALYSIS_VERSION
+
+HASH_BLOCK_SIZE = 1024 * 1024
+META_FILENAME = 'meta.json'
+TMP_PREFIX = '.tmp-'
+
+# Sidecar holding the content hash of an upload, written as it is received
+CONTENT_HASH_SUFFIX = '.sha256'
+
+# Per-key lock files shared by every worker process (kept apart from the entries)
+LOCK_FOLDER = '.locks'
+
+# Result tables in the order of the analysis results tuple
+RESULT_TABLES = [
+    'daywise_analysis',
+    'payment_method_analysis',
+    'zone_performance_analysis',
+    'route_performance_analysis',
+    'courier_performance_analysis'
+]
+
+def _content_hash_path(file_path):
+    return f"{file_path}{CONTENT_HASH_SUFFIX}"
+
+def write_content_hash(file_path, content_hash):
+    """
+    Record a hash computed while the file was received, so it is not read again
+    """
+    with open(_content_hash_path(file_path), 'w') as f:
+        f.write(content_hash)
+
+def file_content_hash(file_path):
+    """
+    SHA-256 of a file's content, read in fixed-size blocks (or the hash recorded
+    when it was uploaded, if the file has not changed since)
+    """
+    hash_path = _content_hash_path(file_path)
+    try:
+        if os.path.getmtime(hash_path) >= os.path.getmtime(file_path):
+            with open(hash_path) as f:
+                return f.read().strip()
+    except OSError:
+        pass
+    
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def result_cache_key(file_path, content_hash=None):
+    """
+    Cache key for an upload: content hash, analysis version and the reference
+    date (undelivered shipments are aged against today)
+    """
+    content_hash = content_hash or file_content_hash(file_path)
+    return f"{content_hash}-v{ANALYSIS_VERSION}-{date.today().isoformat()}"
+
+def batch_cache_key(file_paths):
+    """
+    Cache key for the combined analysis of several exports (in any order)
+    """
+    digest = hashlib.sha256()
+    for content_hash in sorted(file_content_hash(path) for path in file_paths):
+        digest.update(content_hash.encode())
+    return result_cache_key(None, f"batch-{digest.hexdigest()}")
+
+def _entry_dir(cache_dir, key):
+    return os.path.join(cache_dir, key)
+
+def _table_path(cache_dir, key, table):
+    return os.path.join(_entry_dir(cache_dir, key), f"{table}.feather")
+
+def _lock_path(cache_dir, key, kind):
+    return os.path.join(cache_dir, LOCK_FOLDER, f"{key}.{kind}.lock")
+
+def _lock_file(cache_dir, key, kind):
+    os.makedirs(os.path.join(cache_dir, LOCK_FOLDER), exist_ok=True)
+    return open(_lock_path(cache_dir, key, kind), 'a')
+
+def _remove_compute_lock(cache_dir, key):
+    """Delete an evicted key's compute lock file, unless a worker is computing the key"""
+    try:
+        with open(_lock_path(cache_dir, key, 'compute')) as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            os.remove(f.name)
+    except FileNotFoundError:
+        pass
+
+@contextmanager
+def single_flight(cache_dir, key):
+    """
+    Run one computation of key at a time across threads and worker processes.
+    Yields True when another worker held the lock first, so the caller should
+    look for its result before computing again.
+    """
+    with _lock_file(cache_dir, key, 'compute') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            waited = False
+        except BlockingIOError:
+            print("⏳ Another worker is analyzing the same data, waiting for its results...")
+            fcntl.flock(f, fcntl.LOCK_EX)
+            waited = True
+        try:
+            yield waited
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+@contextmanager
+def _reading_entry(cache_dir, key):
+    """Shared lock held while an entry is read, so eviction skips it"""
+    with _lock_file(cache_dir, key, 'read') as f:
+        fcntl.flock(f, fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _read_table(cache_dir, key, table):
+    # Memory-mapped and converted a column per block: numeric columns without
+    # missing values stay read-only views of the mapped file, whose pages every
+    # worker reading the entry shares (the other columns are copied)
+    return feather.read_table(_table_path(cache_dir, key, table), memory_map=True).to_pandas(split_blocks=True)
+
+def _read_meta(cache_dir, key):
+    try:
+        with open(os.path.join(_entry_dir(cache_dir, key), META_FILENAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def cached_result_tables(cache_dir, key):
+    """
+    Names of the tables stored under key, or None if the entry is absent
+    """
+    meta = _read_meta(cache_dir, key)
+    return meta['tables'] if meta is not None else None
+
+def load_cached_table(cache_dir, key, table):
+    """
+    One result table of a cached analysis, or None if absent
+    """
+    with _reading_entry(cache_dir, key):
+        meta = _read_meta(cache_dir, key)
+        if meta is None or table not in meta['tables']:
+            return None
+        return _read_table(cache_dir, key, table)
+
+def load_cached_results(cache_dir, key):
+    """
+    Return the cached analysis results tuple for key, or None on a miss
+    """
+    try:
+        with _reading_entry(cache_dir, key):
+            meta = _read_meta(cache_dir, key)
+            if meta is None:
+                return None
+            
+            tables = [
+                _read_table(cache_dir, key, table) if table in meta['tables'] else None
+                for table in RESULT_TABLES
+            ]
+            
+            # Touch the entry so eviction is least-recently-used
+            os.utime(os.path.join(_entry_dir(cache_dir, key), META_FILENAME))
+    except FileNotFoundError:
+        # Evicted by another worker while it was being read: a miss
+        return None
+    except Exception as e:
+        print(f"Error reading cached results {key}: {e}")
+        return None
+    print(f"⚡ Loaded cached analysis results: {key}")
+    return (*tables, meta['initial_total_records'])
+
+def store_cached_results(cache_dir, key, results, max_bytes):
+    """
+    Store an analysis results tuple under key as Feather tables, then evict
+    down to max_bytes
+    """
+    tmp_dir = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        
+        # Write into a temporary directory first so readers never see a partial entry
+        tmp_dir = tempfile.mkdtemp(dir=cache_dir, prefix=TMP_PREFIX)
+        tables = []
+        for table, data in zip(RESULT_TABLES, results[:5]):
+            if data is not None and not data.empty:
+                # Uncompressed and in one record batch, so readers map each
+                # column's buffer instead of decoding or concatenating it
+                data.reset_index(drop=True).to_feather(
+                    os.path.join(tmp_dir, f"{table}.feather"), compression='uncompressed', chunksize=len(data)
+                )
+                tables.append(table)
+        
+        with open(os.path.join(tmp_dir, META_FILENAME), 'w') as f:
+            json.dump({'key': key, 'tables': tables, 'initial_total_records': int(results[5])}, f)
+        
+        try:
+            os.replace(tmp_dir, _entry_dir(cache_dir, key))
+            tmp_dir = None
+        except OSError:
+            # Another worker stored the same result first
+            pass
+        
+        evict_cached_results(cache_dir, max_bytes)
+    except Exception as e:
+        print(f"Error caching analysis results {key}: {e}")
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def evict_cached_results(cache_dir, max_bytes):
+    """
+    Delete least-recently-used cache entries (and their lock files) until the
+    cache fits in max_bytes
+    """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if not entry.is_dir() or entry.name.startswith(TMP_PREFIX):
+            continue
+        try:
+            last_used = os.stat(os.path.join(entry.path, META_FILENAME)).st_mtime
+            size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+        except FileNotFoundError:
+            continue
+        entries.append((last_used, size, entry.path))
+    
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        # Entries another worker is reading right now are left for a later pass
+        key = os.path.basename(path)
+        with _lock_file(cache_dir, key, 'read') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            # A reader waiting on this lock finds the entry gone: a miss
+            os.remove(f.name)
+        _remove_compute_lock(cache_dir, key)
+        total_bytes -= size
@@ -0,0 +1,181 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from result_cache import RESULT_TABLES, load_cached_table
+from instrumentation import stage
+
+# Views the results page and JSON API serve: (result table, summary dimension).
+# Summary views roll the per-day table up to one row per dimension value.
+RESULT_VIEWS = {
+    'daywise': ('daywise_analysis', None),
+    'payment': ('payment_method_analysis', 'payment_method'),
+    'zone': ('zone_performance_analysis', 'applied_zone'),
+    'courier': ('courier_performance_analysis', 'parent_courier_name'),
+    'route': ('route_performance_analysis', None),
+    'payment_method_analysis': ('payment_method_analysis', None),
+    'zone_performance_analysis': ('zone_performance_analysis', None),
+    'courier_performance_analysis': ('courier_performance_analysis', None)
+}
+
+# Result tables are stored once as Feather; downloads are rendered on demand
+DOWNLOAD_FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'feather': 'application/vnd.apache.arrow.file',
+    'json': 'application/json'
+}
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 500
+
+# Loaded views kept in memory per web worker
+RESULT_VIEW_CACHE_SIZE = int(os.environ.get('RESULT_VIEW_CACHE_SIZE', 64))
+
+_view_cache = OrderedDict()
+_view_cache_lock = threading.Lock()
+
+class ResultQueryError(ValueError):
+    """Invalid sort, filter or paging parameters"""
+
+def summarize_dimension(table, dimension):
+    """
+    One row per dimension value: summed counts and the overall delivery percentage
+    """
+    summary = table.groupby(dimension).agg({
+        'total_shipments': 'sum',
+        'delivered_count': 'sum',
+        'rto_count': 'sum',
+        'delivery_percentage': 'mean'
+    }).reset_index()
+    summary['delivery_percentage'] = (summary['delivered_count'] / summary['total_shipments'] * 100)
+    return summary
+
+def load_result_view(cache_dir, key, view):
+    """
+    A result view of a cached analysis (None if the cache entry is gone). Views
+    are built once per worker and must not be modified by callers.
+    """
+    with _view_cache_lock:
+        if (key, view) in _view_cache:
+            _view_cache.move_to_end((key, view))
+            return _view_cache[(key, view)]
+    
+    table_name, dimension = RESULT_VIEWS[view]
+    data = load_cached_table(cache_dir, key, table_name)
+    if data is None:
+        return None
+    if dimension is not None:
+        data = summarize_dimension(data, dimension)
+    
+    with _view_cache_lock:
+        _view_cache[(key, view)] = data
+        while len(_view_cache) > RESULT_VIEW_CACHE_SIZE:
+            _view_cache.popitem(last=False)
+    return data
+
+def _filter_rows(data, filters):
+    """
+    Boolean mask for column filters: 'col' matches any of comma-separated
+    values, 'col_min'/'col_max' bound numeric columns and 'search' matches a
+    substring of any text column
+    """
+    mask = np.ones(len(data), dtype=bool)
+    for name, value in filters.items():
+        if value == '':
+            continue
+        
+        if name == 'search':
+            text_columns = [col for col in data.columns if not pd.api.types.is_numeric_dtype(data[col])]
+            matches = np.zeros(len(data), dtype=bool)
+            for col in text_columns:
+                matches |= data[col].astype(str).str.contains(value, case=False, regex=False).to_numpy()
+            mask &= matches
+            continue
+        
+        column, bound = name, None
+        if name.endswith(('_min', '_max')) and name[:-4] in data.columns:
+            column, bound = name[:-4], name[-3:]
+        if column not in data.columns:
+            raise ResultQueryError(f"Unknown filter column: {name}")
+        
+        if bound is None:
+            values = [v.strip().lower() for v in value.split(',')]
+            mask &= data[column].astype(str).str.lower().isin(values).to_numpy()
+        else:
+            if not pd.api.types.is_numeric_dtype(data[column]):
+                raise ResultQueryError(f"Range filters need a numeric column: {column}")
+            try:
+                limit = float(value)
+            except ValueError:
+                raise ResultQueryError(f"Invalid number for {name}: {value}")
+            column_values = data[column].to_numpy(dtype=float)
+            mask &= column_values >= limit if bound == 'min' else column_values <= limit
+    return mask
+
+def query_result_view(data, sort=None, order='asc', page=1, per_page=DEFAULT_PAGE_SIZE, filters=None):
+    """
+    One sorted, filtered page of a result view as a JSON-serializable dict
+    """
+    if sort is not None and sort not in data.columns:
+        raise ResultQueryError(f"Unknown sort column: {sort}")
+    if order not in ('asc', 'desc'):
+        raise ResultQueryError("order must be 'asc' or 'desc'")
+    if page < 1 or not 1 <= per_page <= MAX_PAGE_SIZE:
+        raise ResultQueryError(f"page must be >= 1 and per_page between 1 and {MAX_PAGE_SIZE}")
+    
+    rows = data
+    if filters:
+        rows = rows[_filter_rows(rows, filters)]
+    if sort is not None:
+        # Stable sort so pages do not reshuffle rows with equal keys
+        rows = rows.sort_values(sort, ascending=order == 'asc', kind='mergesort', na_position='last')
+    
+    total_rows = len(rows)
+    page_rows = rows.iloc[(page - 1) * per_page:page * per_page]
+    values = page_rows.astype(object).where(page_rows.notna(), None).to_numpy().tolist()
+    
+    return {
+        'columns': list(data.columns),
+        'rows': values,
+        'total_rows': total_rows,
+        'unfiltered_rows': len(data),
+        'page': page,
+        'per_page': per_page,
+        'pages': max(1, -(-total_rows // per_page)),
+        'sort': sort,
+        'order': order
+    }
+
+def render_result_table(data, file_format):
+    """Serialize a result table in one of DOWNLOAD_FORMATS"""
+    buffer = io.BytesIO()
+    with stage(f"{file_format}_export", rows_in=len(data)):
+        if file_format == 'csv':
+            buffer.write(data.to_csv(index=False).encode('utf-8'))
+        elif file_format == 'parquet':
+            data.to_parquet(buffer, index=False)
+        elif file_format == 'feather':
+            data.to_feather(buffer)
+        elif file_format == 'json':
+            data.to_json(buffer, orient='records', date_format='iso')
+    return buffer.getvalue()
+
+def write_result_tables(results, folder, file_format='csv'):
+    """
+    Write the non-empty tables of an analysis results tuple to folder, one
+    file per table, and return their paths
+    """
+    os.makedirs(folder, exist_ok=True)
+    written = []
+    for table_name, data in zip(RESULT_TABLES, results):
+        if data is not None and not data.empty:
+            path = os.path.join(folder, f"{table_name}.{file_format}")
+            with open(path, 'wb') as f:
+                f.write(render_result_table(data, file_format))
+            written.append(path)
+    return written
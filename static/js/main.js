@@ -11,16 +11,18 @@ document.addEventListener('DOMContentLoaded', function() {
             const file = e.target.files[0];
             if (file) {
                 // File size validation
-                if (file.size > 50 * 1024 * 1024) {
-                    showAlert('File size must be less than 50MB', 'danger');
+                const maxUploadMb = parseInt(uploadForm.dataset.maxUploadMb, 10) || 50;
+                if (file.size > maxUploadMb * 1024 * 1024) {
+                    showAlert(`File size must be less than ${maxUploadMb}MB`, 'danger');
                     e.target.value = '';
                     hideFileInfo();
                     return;
                 }
                 
                 // File type validation
-                if (!file.name.toLowerCase().endsWith('.csv')) {
-                    showAlert('Please select a CSV file', 'danger');
+                const exportExtensions = ['.csv', '.csv.gz', '.csv.zst', '.zip'];
+                if (!exportExtensions.some(extension => file.name.toLowerCase().endsWith(extension))) {
+                    showAlert('Please select a CSV file (.csv, .csv.gz, .csv.zst or .zip)', 'danger');
                     e.target.value = '';
                     hideFileInfo();
                     return;
@@ -41,14 +43,94 @@ document.addEventListener('DOMContentLoaded', function() {
             }
             
             // Update button state
-            submitBtn.innerHTML = '<span class="loading-spinner"></span> Processing...';
+            submitBtn.innerHTML = '<span class="loading-spinner"></span> Uploading...';
             submitBtn.disabled = true;
             
-            // Show processing message
-            showAlert('File uploaded successfully!', 'info');
+            // Uploaded in resumable chunks; the plain form post is the fallback
+            if (uploadForm.dataset.sessionUrl && window.fetch && Blob.prototype.slice) {
+                e.preventDefault();
+                chunkedUpload(fileInput.files[0], uploadForm.dataset.sessionUrl)
+                    .then(result => {
+                        window.location.href = result.analyze_url;
+                    })
+                    .catch(error => {
+                        showAlert(`Upload failed: ${error.message}. Submit again to resume.`, 'danger');
+                        submitBtn.innerHTML = '🚀 Analyze Data';
+                        submitBtn.disabled = false;
+                    });
+            }
         });
     }
     
+    async function chunkedUpload(file, sessionUrl) {
+        // The upload id is remembered per file so a failed transfer resumes
+        const resumeKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+        let session = null;
+        const savedId = localStorage.getItem(resumeKey);
+        if (savedId) {
+            const response = await fetch(`${sessionUrl}/${savedId}`);
+            session = response.ok ? await response.json() : null;
+        }
+        if (!session) {
+            const response = await fetch(sessionUrl, {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({filename: file.name, size: file.size})
+            });
+            session = await response.json();
+            if (!response.ok) {
+                throw new Error(session.error);
+            }
+            localStorage.setItem(resumeKey, session.upload_id);
+        }
+        
+        const sessionPath = `${sessionUrl}/${session.upload_id}`;
+        let offset = session.offset;
+        let failures = 0;
+        while (offset < file.size) {
+            updateUploadProgress(offset, file.size);
+            let response;
+            try {
+                response = await fetch(`${sessionPath}?offset=${offset}`, {
+                    method: 'PUT',
+                    body: file.slice(offset, offset + session.chunk_size)
+                });
+            } catch (networkError) {
+                response = null;
+            }
+            
+            const result = response ? await response.json().catch(() => ({})) : {};
+            if (response && response.ok) {
+                offset = result.offset;
+                failures = 0;
+            } else if (response && response.status === 409 && typeof result.offset === 'number') {
+                // The server has a different offset (e.g. a retried chunk landed)
+                offset = result.offset;
+            } else if (response && response.status !== 409 && response.status < 500) {
+                localStorage.removeItem(resumeKey);
+                throw new Error(result.error || 'upload rejected');
+            } else if (++failures > 5) {
+                throw new Error('connection lost');
+            } else {
+                await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+            }
+        }
+        updateUploadProgress(file.size, file.size);
+        
+        const response = await fetch(`${sessionPath}/complete`, {method: 'POST'});
+        const result = await response.json();
+        if (!response.ok) {
+            throw new Error(result.error);
+        }
+        localStorage.removeItem(resumeKey);
+        return result;
+    }
+    
+    function updateUploadProgress(sent, total) {
+        const percent = total ? Math.floor(sent / total * 100) : 100;
+        submitBtn.innerHTML = `<span class="loading-spinner"></span> Uploading... ${percent}%`;
+    }
+    
     // Auto-dismiss alerts
     const alerts = document.querySelectorAll('.alert');
     alerts.forEach(alert => {
@@ -77,6 +159,149 @@ document.addEventListener('DOMContentLoaded', function() {
     // Table enhancements
     enhanceTables();
     
+    // Result tables are fetched page by page from the results API
+    document.querySelectorAll('.result-table').forEach(container => initResultTable(container));
+    
+    // Background analysis progress polling
+    const jobProgress = document.getElementById('jobProgress');
+    if (jobProgress) {
+        pollJobStatus(jobProgress);
+    }
+    
+    function pollJobStatus(container) {
+        const statusUrl = container.dataset.statusUrl;
+        const resultsUrl = container.dataset.resultsUrl;
+        const progressBar = document.getElementById('jobProgressBar');
+        const statusText = document.getElementById('jobStatus');
+        const messageText = document.getElementById('jobMessage');
+        const logText = document.getElementById('jobLog');
+        
+        fetch(statusUrl)
+            .then(response => response.json())
+            .then(job => {
+                progressBar.style.width = `${job.progress}%`;
+                progressBar.setAttribute('aria-valuenow', job.progress);
+                progressBar.textContent = `${job.progress}%`;
+                statusText.textContent = job.status;
+                messageText.textContent = job.message;
+                logText.textContent = (job.log || []).join('\n');
+                
+                if (job.status === 'done' || job.status === 'failed' || job.status === 'unknown') {
+                    window.location.href = resultsUrl;
+                } else {
+                    setTimeout(() => pollJobStatus(container), 2000);
+                }
+            })
+            .catch(() => setTimeout(() => pollJobStatus(container), 5000));
+    }
+    
+    function initResultTable(container) {
+        const state = {
+            page: 1,
+            perPage: parseInt(container.dataset.perPage, 10) || 25,
+            sort: container.dataset.sort || '',
+            order: container.dataset.order || 'asc',
+            search: ''
+        };
+        const searchInput = container.querySelector('.result-table-search');
+        let searchTimer = null;
+        
+        searchInput.addEventListener('input', () => {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => {
+                state.search = searchInput.value.trim();
+                state.page = 1;
+                loadResultTable(container, state);
+            }, 300);
+        });
+        container.querySelector('.result-table-prev').addEventListener('click', () => {
+            state.page -= 1;
+            loadResultTable(container, state);
+        });
+        container.querySelector('.result-table-next').addEventListener('click', () => {
+            state.page += 1;
+            loadResultTable(container, state);
+        });
+        
+        loadResultTable(container, state);
+    }
+    
+    function loadResultTable(container, state) {
+        const params = new URLSearchParams({page: state.page, per_page: state.perPage});
+        if (state.sort) {
+            params.set('sort', state.sort);
+            params.set('order', state.order);
+        }
+        if (state.search) {
+            params.set('search', state.search);
+        }
+        
+        fetch(`${container.dataset.url}?${params}`)
+            .then(response => response.json())
+            .then(result => {
+                if (result.error) {
+                    container.querySelector('tbody').innerHTML = `<tr><td class="text-muted">${escapeHtml(result.error)}</td></tr>`;
+                    return;
+                }
+                renderResultTable(container, state, result);
+            })
+            .catch(() => {
+                container.querySelector('tbody').innerHTML = '<tr><td class="text-muted">Could not load this table.</td></tr>';
+            });
+    }
+    
+    function renderResultTable(container, state, result) {
+        const table = container.querySelector('table');
+        const headerRow = document.createElement('tr');
+        result.columns.forEach(column => {
+            const th = document.createElement('th');
+            const arrow = state.sort === column ? (state.order === 'asc' ? ' ▲' : ' ▼') : '';
+            th.textContent = column + arrow;
+            th.style.cursor = 'pointer';
+            th.addEventListener('click', () => {
+                state.order = state.sort === column && state.order === 'asc' ? 'desc' : 'asc';
+                state.sort = column;
+                state.page = 1;
+                loadResultTable(container, state);
+            });
+            headerRow.appendChild(th);
+        });
+        table.querySelector('thead').replaceChildren(headerRow);
+        
+        table.querySelector('tbody').innerHTML = result.rows.map(row => `<tr>${
+            row.map((value, i) => `<td>${escapeHtml(formatResultValue(result.columns[i], value))}</td>`).join('')
+        }</tr>`).join('');
+        
+        const first = result.total_rows ? (result.page - 1) * result.per_page + 1 : 0;
+        const last = Math.min(result.page * result.per_page, result.total_rows);
+        container.querySelector('.result-table-info').textContent =
+            `Rows ${first}-${last} of ${result.total_rows.toLocaleString()}` +
+            (result.total_rows !== result.unfiltered_rows ? ` (filtered from ${result.unfiltered_rows.toLocaleString()})` : '');
+        container.querySelector('.result-table-prev').disabled = result.page <= 1;
+        container.querySelector('.result-table-next').disabled = result.page >= result.pages;
+        
+        enhanceTable(table);
+    }
+    
+    function formatResultValue(column, value) {
+        if (value === null) {
+            return column.startsWith('drop') ? 'N/A' : '';
+        }
+        if (typeof value === 'number' && (column.endsWith('percentage') || column.endsWith('rate'))) {
+            return column.startsWith('drop') ? `${value >= 0 ? '+' : ''}${value.toFixed(2)}%` : `${value.toFixed(2)}%`;
+        }
+        if (typeof value === 'number' && !Number.isInteger(value)) {
+            return value.toFixed(2);
+        }
+        return typeof value === 'number' ? value.toLocaleString() : String(value);
+    }
+    
+    function escapeHtml(text) {
+        const div = document.createElement('div');
+        div.textContent = text;
+        return div.innerHTML;
+    }
+    
     function showFileInfo(file) {
         const sizeInMB = (file.size / (1024 * 1024)).toFixed(2);
         const lastModified = new Date(file.lastModified).toLocaleDateString();
@@ -118,8 +343,10 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     function enhanceTables() {
-    const tables = document.querySelectorAll('.table');
-    tables.forEach(table => {
+        document.querySelectorAll('.table').forEach(table => enhanceTable(table));
+    }
+    
+    function enhanceTable(table) {
         table.classList.add('table-striped');
         table.classList.add('table-hover');
         
@@ -164,7 +391,6 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
             }
         });
-    });
-}
+    }
 
 });
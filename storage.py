@@ -0,0 +1,210 @@
+import fcntl
+import json
+import os
+import threading
+import time
+
+from werkzeug.utils import secure_filename
+
+from compressed_input import export_base_name
+from result_cache import CONTENT_HASH_SUFFIX, RESULT_TABLES
+from upload_sessions import prune_upload_sessions
+
+# Uploads and download files of an analysis are deleted once unused for this long
+STORAGE_MAX_AGE = int(os.environ.get('STORAGE_MAX_AGE_HOURS', 72)) * 3600
+
+# Least-recently-used analyses are deleted while uploads and downloads
+# together exceed this size; analyses used within the grace period are kept
+STORAGE_MAX_BYTES = int(os.environ.get('STORAGE_MAX_MB', 5000)) * 1024 * 1024
+STORAGE_GRACE_SECONDS = 60 * 60
+
+# Seconds between background cleanup passes (0 disables the thread)
+STORAGE_CLEANUP_INTERVAL = int(os.environ.get('STORAGE_CLEANUP_INTERVAL', 600))
+
+MANIFEST_SUFFIX = '_manifest.json'
+INDEX_LOCK_FILENAME = '.index.lock'
+CLEANUP_LOCK_FILENAME = '.cleanup.lock'
+
+_cleanup_thread = None
+
+def analysis_id(filename):
+    """Id an upload's files and its downloads are indexed under"""
+    return secure_filename(export_base_name(filename))
+
+def _record_path(index_folder, key):
+    return os.path.join(index_folder, f"{key}.json")
+
+def _index_lock(index_folder):
+    os.makedirs(index_folder, exist_ok=True)
+    lock = open(os.path.join(index_folder, INDEX_LOCK_FILENAME), 'a')
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    return lock
+
+def _write_record(index_folder, record):
+    path = _record_path(index_folder, record['analysis_id'])
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(record, f)
+    os.replace(tmp_path, path)
+
+def lookup_analysis(index_folder, key):
+    """
+    Index record of an analysis: its files, their total size, when it was
+    created and last used (None if it is not indexed)
+    """
+    path = _record_path(index_folder, analysis_id(key))
+    try:
+        with open(path) as f:
+            record = json.load(f)
+        record['last_used'] = os.path.getmtime(path)
+    except (OSError, ValueError):
+        return None
+    return record
+
+def register_files(index_folder, key, paths):
+    """
+    Add files (an upload and its hash sidecar, a download manifest) to the
+    index record of an analysis, which also marks it used
+    """
+    key = analysis_id(key)
+    with _index_lock(index_folder):
+        record = lookup_analysis(index_folder, key) or {
+            'analysis_id': key, 'files': [], 'bytes': 0, 'created_at': time.time()
+        }
+        record.pop('last_used', None)
+        for path in paths:
+            if path in record['files'] or not os.path.exists(path):
+                continue
+            record['files'].append(path)
+            record['bytes'] += os.path.getsize(path)
+        _write_record(index_folder, record)
+
+def register_upload(index_folder, filepath):
+    """Index a stored upload (with its content hash sidecar, if any)"""
+    register_files(index_folder, os.path.basename(filepath), [filepath, f"{filepath}{CONTENT_HASH_SUFFIX}"])
+
+def touch_analysis(index_folder, key):
+    """Mark an analysis used, so retention keeps it longer"""
+    try:
+        os.utime(_record_path(index_folder, analysis_id(key)))
+    except OSError:
+        pass
+
+def _owner_id(filename):
+    """Analysis id of a file in the upload or download folder"""
+    name = filename[:-len(CONTENT_HASH_SUFFIX)] if filename.endswith(CONTENT_HASH_SUFFIX) else filename
+    if name.endswith(MANIFEST_SUFFIX):
+        return analysis_id(name[:-len(MANIFEST_SUFFIX)])
+    stem = name.rsplit('.', 1)[0]
+    for table in RESULT_TABLES:
+        if stem.endswith(f"_{table}"):
+            return analysis_id(stem[:-len(table) - 1])
+    return analysis_id(name)
+
+def _load_records(index_folder):
+    records = {}
+    for entry in os.scandir(index_folder):
+        if entry.name.endswith('.json') and not entry.name.startswith('.'):
+            record = lookup_analysis(index_folder, entry.name[:-len('.json')])
+            if record is not None:
+                records[record['analysis_id']] = record
+    return records
+
+def _adopt_untracked(index_folder, folders, records):
+    """Index files stored before the index existed, dated by their modification time"""
+    tracked = {path for record in records.values() for path in record['files']}
+    untracked = {}
+    for folder in folders:
+        if not os.path.isdir(folder):
+            continue
+        for entry in os.scandir(folder):
+            if entry.is_file() and not entry.name.startswith('.') and entry.path not in tracked:
+                untracked.setdefault(_owner_id(entry.name), []).append(entry.path)
+    
+    for key, paths in untracked.items():
+        last_used = max(os.path.getmtime(path) for path in paths)
+        if key in records:
+            last_used = max(last_used, records[key]['last_used'])
+        register_files(index_folder, key, paths)
+        os.utime(_record_path(index_folder, key), (last_used, last_used))
+        records[key] = lookup_analysis(index_folder, key)
+    return len(untracked)
+
+def _delete_analysis(index_folder, key, last_used):
+    with _index_lock(index_folder):
+        record = lookup_analysis(index_folder, key)
+        # Used again since the cleanup pass looked at it
+        if record is None or record['last_used'] > last_used:
+            return None
+        for path in record['files']:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        os.remove(_record_path(index_folder, key))
+        return record['bytes']
+
+def cleanup_storage(index_folder, folders, max_age=STORAGE_MAX_AGE, max_bytes=STORAGE_MAX_BYTES):
+    """
+    Delete the files of analyses unused for max_age seconds, then of the
+    least-recently-used ones until the rest fit in max_bytes. Returns a summary.
+    """
+    now = time.time()
+    os.makedirs(index_folder, exist_ok=True)
+    records = _load_records(index_folder)
+    adopted = _adopt_untracked(index_folder, folders, records)
+    
+    deleted, freed = 0, 0
+    total_bytes = sum(record['bytes'] for record in records.values())
+    for record in sorted(records.values(), key=lambda record: record['last_used']):
+        idle = now - record['last_used']
+        if idle <= max_age and (total_bytes <= max_bytes or idle < STORAGE_GRACE_SECONDS):
+            continue
+        size = _delete_analysis(index_folder, record['analysis_id'], record['last_used'])
+        if size is None:
+            continue
+        total_bytes -= size
+        freed += size
+        deleted += 1
+    
+    if deleted:
+        print(f"🧹 Storage cleanup: deleted {deleted} analyses ({freed / (1024 * 1024):.1f}MB), "
+              f"{total_bytes / (1024 * 1024):.1f}MB kept")
+    return {
+        'analyses': len(records) - deleted,
+        'bytes': total_bytes,
+        'deleted': deleted,
+        'freed_bytes': freed,
+        'adopted': adopted
+    }
+
+def _cleanup_loop(index_folder, folders, session_folder, interval):
+    while True:
+        try:
+            # One worker process cleans up at a time; the others skip the pass
+            with open(os.path.join(index_folder, CLEANUP_LOCK_FILENAME), 'a') as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    pass
+                else:
+                    cleanup_storage(index_folder, folders)
+                    prune_upload_sessions(session_folder)
+        except Exception as e:
+            print(f"Error cleaning up storage: {e}")
+        time.sleep(interval)
+
+def start_storage_cleanup(index_folder, folders, session_folder, interval=STORAGE_CLEANUP_INTERVAL):
+    """
+    Start the background cleanup thread of this process (once; not at all
+    when interval is 0)
+    """
+    global _cleanup_thread
+    if interval <= 0 or _cleanup_thread is not None:
+        return
+    os.makedirs(index_folder, exist_ok=True)
+    _cleanup_thread = threading.Thread(
+        target=_cleanup_loop, args=(index_folder, list(folders), session_folder, interval),
+        name='storage-cleanup', daemon=True
+    )
+    _cleanup_thread.start()
@@ -0,0 +1,135 @@
+import argparse
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from analysis import ANALYSIS_COLUMNS
+
+# Rows generated and written per batch, bounds generator memory at any size
+GENERATOR_BATCH_SIZE = 250000
+
+# Value distributions modelled on real shipment exports (None = missing)
+PARENT_COURIERS = {
+    'Delhivery': 0.34, 'Xpressbees': 0.22, 'Ekart': 0.16, 'Bluedart': 0.1, 'Shadowfax': 0.07,
+    'Ecom Express': 0.05, 'DTDC': 0.03, 'Amazon Shipping': 0.02, None: 0.01
+}
+COURIER_SERVICES = ['Surface', 'Air', 'Surface 2kg', 'Surface 5kg', 'Express']
+PAYMENT_METHODS = {'COD': 0.62, 'PREPAID': 0.37, None: 0.01}
+ZONES = {'A': 0.12, 'B': 0.18, 'C': 0.21, 'D': 0.33, 'E': 0.16}
+STATES = {
+    'Maharashtra': 0.15, 'Uttar Pradesh': 0.12, 'Delhi': 0.1, 'Karnataka': 0.09, 'Tamil Nadu': 0.07,
+    'Gujarat': 0.07, 'West Bengal': 0.06, 'Rajasthan': 0.05, 'Telangana': 0.05, 'Haryana': 0.05,
+    'Bihar': 0.04, 'Madhya Pradesh': 0.04, 'Kerala': 0.03, 'Punjab': 0.03, 'Assam': 0.02,
+    'Odisha': 0.02, None: 0.01
+}
+STATUS_GROUPS = {
+    'Delivered': 0.58, 'RTO': 0.14, 'In Transit': 0.09, 'Out For Delivery': 0.03, 'Manifested': 0.06,
+    'Damage/Lost': 0.02, 'Cancelled': 0.05, 'NDR': 0.03
+}
+COMPANIES = 40
+CITIES_PER_STATE = 12
+SHIPMENT_MODES = {'SURFACE': 0.82, 'AIR': 0.18}
+
+MISSING_COURIER_EDD_RATE = 0.08
+MISSING_BOTH_EDD_RATE = 0.02
+
+def _choice(rng, distribution, n):
+    values = list(distribution)
+    weights = np.array(list(distribution.values()), dtype=float)
+    codes = rng.choice(len(values), size=n, p=weights / weights.sum())
+    return np.array(values, dtype=object)[codes]
+
+def _format_dates(values):
+    # datetime_as_string is several times faster than Series.dt.strftime; the
+    # ISO 'T' separator is swapped for a space in the fixed-width buffer
+    text = np.datetime_as_string(values, unit='s').astype('<U19')
+    text.view('<u4').reshape(len(text), 19)[:, 10] = ord(' ')
+    return pd.Series(text).where(~np.isnat(values))
+
+def generate_shipment_batch(n, rng, start_date, span_days=90):
+    """
+    One batch of n synthetic shipments covering every column analysis.py reads
+    """
+    status = _choice(rng, STATUS_GROUPS, n)
+    pickup_state = _choice(rng, STATES, n)
+    delivery_state = _choice(rng, STATES, n)
+    
+    # Shipments are created over span_days; the courier EDD is 2-8 days later
+    created = np.datetime64(start_date, 's') + rng.integers(0, span_days * 86400, n).astype('timedelta64[s]')
+    courier_edd = created + rng.integers(2, 9, n).astype('timedelta64[D]')
+    rapidshyp_edd = courier_edd + rng.integers(-1, 2, n).astype('timedelta64[D]')
+    
+    # Most attempts land around the EDD with a long tail of late ones
+    lateness = np.rint(rng.gamma(1.5, 2.0, n) - 2.5).astype('int64')
+    first_attempt = courier_edd + lateness.astype('timedelta64[D]') + rng.integers(-6, 6, n).astype('timedelta64[h]')
+    delivered = first_attempt + rng.geometric(0.6, n).astype('timedelta64[D]') - np.timedelta64(1, 'D')
+    
+    is_delivered = status == 'Delivered'
+    in_flight = np.isin(status, ['In Transit', 'Manifested', 'Cancelled', 'Out For Delivery'])
+    no_attempt = in_flight | (rng.random(n) < 0.03)
+    first_attempt = np.where(no_attempt, np.datetime64('NaT'), first_attempt)
+    delivered = np.where(is_delivered, delivered, np.datetime64('NaT'))
+    
+    edd_draw = rng.random(n)
+    courier_edd = np.where(edd_draw < MISSING_COURIER_EDD_RATE, np.datetime64('NaT'), courier_edd)
+    rapidshyp_edd = np.where(edd_draw < MISSING_BOTH_EDD_RATE, np.datetime64('NaT'), rapidshyp_edd)
+    
+    city_codes = rng.integers(0, CITIES_PER_STATE, n)
+    return pd.DataFrame({
+        'awb': rng.integers(10 ** 11, 10 ** 12, n),
+        'company_name': np.char.add('Company ', rng.zipf(1.6, n).clip(1, COMPANIES).astype(str)),
+        'parent_courier_name': _choice(rng, PARENT_COURIERS, n),
+        'courier_name': np.array(COURIER_SERVICES)[rng.integers(0, len(COURIER_SERVICES), n)],
+        'shipment_mode': _choice(rng, SHIPMENT_MODES, n),
+        'payment_method': _choice(rng, PAYMENT_METHODS, n),
+        'applied_zone': _choice(rng, ZONES, n),
+        'pickup_state': pickup_state,
+        'delivery_state': delivery_state,
+        'delivery_city': np.char.add(np.char.add(delivery_state.astype(str), ' City '), city_codes.astype(str)),
+        'tracking_status_group': status,
+        'order_created_date': _format_dates(created),
+        'final_courier_edd': _format_dates(courier_edd),
+        'rapidshyp_edd': _format_dates(rapidshyp_edd),
+        'first_attempt_date': _format_dates(first_attempt),
+        'delivered_date': _format_dates(delivered),
+        'weight_kg': np.round(rng.lognormal(-0.3, 0.7, n), 2)
+    })
+
+def generate_shipment_export(path, rows, seed=0, start_date=None, batch_size=GENERATOR_BATCH_SIZE):
+    """
+    Write a synthetic shipment export CSV of the given size, batch by batch
+    """
+    rng = np.random.default_rng(seed)
+    if start_date is None:
+        start_date = (datetime.now() - timedelta(days=100)).date()
+    
+    print(f"🧪 Generating {rows:,} synthetic shipments: {path}")
+    written = 0
+    while written < rows:
+        batch = generate_shipment_batch(min(batch_size, rows - written), rng, start_date)
+        batch.to_csv(path, mode='w' if written == 0 else 'a', header=written == 0, index=False)
+        written += len(batch)
+        print(f"Generated {written:,} rows...")
+    
+    missing = set(ANALYSIS_COLUMNS) - set(batch.columns)
+    assert not missing, f"synthetic export is missing analysis columns: {missing}"
+    print(f"✅ Synthetic export written ({os.path.getsize(path) / (1024 * 1024):.2f} MB)")
+    return path
+
+def parse_row_count(value):
+    """Parse row counts such as 10000, 10k or 1M"""
+    multipliers = {'k': 1000, 'm': 1000 ** 2}
+    value = value.strip().lower()
+    if value[-1] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(value)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic shipment export CSV')
+    parser.add_argument('rows', type=parse_row_count, help='number of shipments, e.g. 10k, 1M, 10M')
+    parser.add_argument('output', help='CSV file to write')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate_shipment_export(args.output, args.rows, seed=args.seed)
@@ -0,0 +1,173 @@
+"""
+Parity of the vectorized analysis with the original row-wise version
+(tests/baseline_analysis.py) on synthetic exports and hand-written edge rows.
+"""
+import contextlib
+import io
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import analysis
+import baseline_analysis
+from synthetic_data import generate_shipment_batch
+
+SYNTHETIC_ROWS = 20000
+RESULT_TABLES = ['daywise', 'payment', 'zone', 'route', 'courier']
+
+def _day(today, offset, time='12:00:00'):
+    return f"{(today + timedelta(days=offset)):%Y-%m-%d} {time}"
+
+def _edge_rows(today):
+    """
+    Shipments the synthetic generator rarely or never produces, keyed by awb:
+    (awb, status, courier EDD, rapidshyp EDD, first attempt, delivered)
+    """
+    rows = [
+        ('delivered_no_attempt', 'Delivered', _day(today, -10), None, None, _day(today, -7)),
+        ('nan_status_no_attempt', None, _day(today, -10), None, None, None),
+        ('nan_status_late_attempt', None, _day(today, -10), None, _day(today, -8), None),
+        ('unknown_status_delivered', 'Lost In Space', _day(today, -10), None, _day(today, -9), _day(today, -8)),
+        ('manifested_past_edd', 'Manifested', _day(today, -10), None, None, None),
+        ('manifested_before_edd', 'Manifested', _day(today, 1), None, None, None),
+        ('manifested_with_attempt', 'Manifested', _day(today, -10), None, _day(today, -6), None),
+        ('delivered_same_day', 'Delivered', _day(today, -10, '09:00:00'), None, _day(today, -10, '18:00:00'), _day(today, -10, '19:00:00')),
+        ('delivered_next_day', 'Delivered', _day(today, -10, '23:00:00'), None, _day(today, -9, '00:30:00'), _day(today, -9, '01:00:00')),
+        ('rto_same_day', 'RTO', _day(today, -10, '08:00:00'), None, _day(today, -10, '20:00:00'), None),
+        ('in_transit_edd_today', 'In Transit', _day(today, 0), None, None, None),
+        ('rapidshyp_edd_only', 'RTO', None, _day(today, -10), _day(today, -6), None),
+        ('missing_edd', 'Delivered', None, None, _day(today, -9), _day(today, -8))
+    ]
+    edge = pd.DataFrame(rows, columns=[
+        'awb', 'tracking_status_group', 'final_courier_edd', 'rapidshyp_edd', 'first_attempt_date', 'delivered_date'
+    ])
+    return edge.assign(
+        parent_courier_name='Delhivery', courier_name='Surface', payment_method='COD', applied_zone='C',
+        pickup_state='Maharashtra', delivery_state='Delhi', delivery_city='Delhi City 0',
+        company_name='Company 1', shipment_mode='SURFACE'
+    )
+
+def _delivered_without_attempt(df):
+    return ((df['tracking_status_group'] == 'Delivered') & df['delivered_date'].notna() & df['first_attempt_date'].isna()).to_numpy()
+
+def _export(today, seed=0, rows=SYNTHETIC_ROWS, baseline_readable=True):
+    """
+    Synthetic shipments followed by the edge rows; baseline_readable drops the
+    delivered rows without a first attempt date, which the baseline crashes on
+    """
+    synthetic = generate_shipment_batch(rows, np.random.default_rng(seed), (today - timedelta(days=100)).date())
+    export = pd.concat([synthetic.astype({'awb': str}), _edge_rows(today)], ignore_index=True)
+    if baseline_readable:
+        export = export[~_delivered_without_attempt(export)]
+    return export
+
+def _parsed(df):
+    """Dates parsed and rows without any EDD dropped, as the baseline does"""
+    df = df.astype({col: 'category' for col in analysis.CSV_DTYPES})
+    for col in analysis.DATE_COLUMNS:
+        df[col] = pd.to_datetime(df[col], errors='coerce')
+    df['effective_edd'] = df['final_courier_edd'].fillna(df['rapidshyp_edd'])
+    return df.dropna(subset=['effective_edd']).reset_index(drop=True)
+
+def _baseline_classification(df, current_date):
+    df = df.copy()
+    df['tat_breach'] = df.apply(baseline_analysis.calculate_tat_breach, axis=1, current_date=current_date).astype(bool)
+    df['days_after_tat_breach'] = np.nan
+    if df['tat_breach'].any():
+        df.loc[df['tat_breach'], 'days_after_tat_breach'] = df.loc[df['tat_breach']].apply(
+            baseline_analysis.calculate_days_after_tat_breach, axis=1, current_date=current_date
+        )
+    df['shipment_category'] = df.apply(baseline_analysis.categorize_shipment_status, axis=1)
+    return df
+
+def _classification(df, current_date):
+    df = analysis.classify_tat_breaches(df.copy(), current_date)
+    if 'days_after_tat_breach' not in df.columns:
+        df['days_after_tat_breach'] = np.nan
+    return df
+
+def _quiet(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_classification_matches_baseline(seed):
+    current_date = datetime.now()
+    df = _parsed(_export(current_date, seed, rows=5000))
+    expected = _baseline_classification(df, current_date)
+    actual = _classification(df, current_date)
+    
+    np.testing.assert_array_equal(actual['tat_breach'].to_numpy(), expected['tat_breach'].to_numpy())
+    np.testing.assert_array_equal(actual['days_after_tat_breach'].to_numpy(), expected['days_after_tat_breach'].to_numpy())
+    np.testing.assert_array_equal(actual['shipment_category'].to_numpy(), expected['shipment_category'].to_numpy())
+
+@pytest.mark.parametrize('awb, breach, days, category', [
+    ('nan_status_no_attempt', True, 10, 'Undelivered'),
+    ('nan_status_late_attempt', True, 2, 'Undelivered'),
+    ('unknown_status_delivered', False, None, 'Other'),
+    ('manifested_past_edd', True, 10, 'Undelivered'),
+    ('manifested_before_edd', False, None, 'Undelivered'),
+    ('manifested_with_attempt', True, 4, 'Undelivered'),
+    ('delivered_same_day', False, None, 'Delivered'),
+    ('delivered_next_day', True, 1, 'Delivered'),
+    ('rto_same_day', False, None, 'RTO'),
+    ('in_transit_edd_today', False, None, 'Undelivered'),
+    ('rapidshyp_edd_only', True, 4, 'RTO')
+])
+def test_edge_rows(awb, breach, days, category):
+    current_date = datetime.now()
+    edge = _edge_rows(current_date)
+    df = _parsed(edge[edge['awb'] == awb])
+    for classified in (_classification(df, current_date), _baseline_classification(df, current_date)):
+        row = classified.iloc[0]
+        assert bool(row['tat_breach']) is breach
+        assert (pd.isna(row['days_after_tat_breach']) if days is None else row['days_after_tat_breach'] == days)
+        assert row['shipment_category'] == category
+
+def test_missing_edd_rows_are_dropped():
+    edge = _edge_rows(datetime.now())
+    df = _quiet(analysis.apply_effective_edd, edge.astype({col: 'category' for col in analysis.CSV_DTYPES}))
+    assert 'missing_edd' not in set(df['awb'])
+    assert len(df) == len(edge) - 1
+
+def test_delivered_without_attempt_is_not_breached():
+    # The row-wise version compared a missing first attempt date and crashed
+    current_date = datetime.now()
+    edge = _edge_rows(current_date)
+    df = _parsed(edge[edge['awb'] == 'delivered_no_attempt'])
+    with pytest.raises(TypeError):
+        _baseline_classification(df, current_date)
+    
+    row = _classification(df, current_date).iloc[0]
+    assert not row['tat_breach']
+    assert row['shipment_category'] == 'Delivered'
+
+def _assert_results_equal(actual, expected):
+    assert actual[0] is not None and expected[0] is not None
+    for name, actual_table, expected_table in zip(RESULT_TABLES, actual[:5], expected[:5]):
+        pd.testing.assert_frame_equal(actual_table, expected_table, obj=name)
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_result_tables_match_baseline(tmp_path, streaming):
+    path = tmp_path / 'export.csv'
+    _export(datetime.now()).to_csv(path, index=False)
+    expected = _quiet(baseline_analysis.analyze_comprehensive_delivery_performance_corrected, str(path))
+    actual = _quiet(analysis.analyze_comprehensive_delivery_performance_corrected, str(path), streaming=streaming)
+    
+    _assert_results_equal(actual, expected)
+    assert actual[5] == expected[5]
+
+def test_delivered_without_attempt_leaves_tables_unchanged(tmp_path):
+    today = datetime.now()
+    with_rows, without_rows = tmp_path / 'with.csv', tmp_path / 'without.csv'
+    export = _export(today, baseline_readable=False)
+    export.to_csv(with_rows, index=False)
+    export[~_delivered_without_attempt(export)].to_csv(without_rows, index=False)
+    
+    expected = _quiet(baseline_analysis.analyze_comprehensive_delivery_performance_corrected, str(without_rows))
+    actual = _quiet(analysis.analyze_comprehensive_delivery_performance_corrected, str(with_rows))
+    _assert_results_equal(actual, expected)
+    assert _delivered_without_attempt(export).any()
+    assert actual[5] == expected[5] + _delivered_without_attempt(export).sum()
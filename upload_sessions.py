@@ -0,0 +1,253 @@
+import csv
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from analysis import REQUIRED_COLUMNS
+from result_cache import HASH_BLOCK_SIZE, file_content_hash, write_content_hash
+from compressed_input import HEADER_PEEK_BYTES, decompress_head, export_compression, read_export_head
+
+# In-progress chunked uploads live here, one directory per upload id
+UPLOAD_SESSION_FOLDER = os.environ.get('UPLOAD_SESSION_FOLDER', os.path.join('uploads', '.sessions'))
+
+# Largest export accepted through chunked uploads, and the largest single chunk
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_MB', 2048)) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_BYTES = 32 * 1024 * 1024
+
+# Sessions untouched for this long are deleted
+UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL_HOURS', 24)) * 3600
+
+SESSION_META = 'session.json'
+SESSION_DATA = 'data.part'
+
+# Running content hash per session, valid while its offset matches the part file.
+# A session whose chunks reach several worker processes (or span a restart) is
+# hashed once, in a single pass, when it completes.
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+class UploadError(ValueError):
+    """Rejected upload session, chunk or header"""
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+def _session_dir(session_folder, upload_id):
+    # Upload ids are server-generated hex strings
+    if not upload_id.isalnum():
+        raise UploadError('Unknown upload', 404)
+    return os.path.join(session_folder, upload_id)
+
+def _read_session(session_folder, upload_id):
+    try:
+        with open(os.path.join(_session_dir(session_folder, upload_id), SESSION_META)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise UploadError('Unknown or expired upload', 404)
+
+def _write_session(session_folder, session):
+    session_dir = _session_dir(session_folder, session['upload_id'])
+    tmp_path = os.path.join(session_dir, f"{SESSION_META}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(session, f)
+    os.replace(tmp_path, os.path.join(session_dir, SESSION_META))
+
+def _session_status(session_folder, session):
+    offset = os.path.getsize(os.path.join(_session_dir(session_folder, session['upload_id']), SESSION_DATA))
+    return {
+        'upload_id': session['upload_id'],
+        'filename': session['filename'],
+        'size': session['size'],
+        'offset': offset,
+        'chunk_size': UPLOAD_CHUNK_SIZE,
+        'complete': offset == session['size']
+    }
+
+def delete_upload_session(session_folder, upload_id):
+    with _hashers_lock:
+        _hashers.pop(upload_id, None)
+    shutil.rmtree(_session_dir(session_folder, upload_id), ignore_errors=True)
+
+def prune_upload_sessions(session_folder, ttl=UPLOAD_SESSION_TTL):
+    """Delete sessions whose part file has not been written to within ttl seconds"""
+    cutoff = time.time() - ttl
+    try:
+        upload_ids = os.listdir(session_folder)
+    except FileNotFoundError:
+        return
+    for upload_id in upload_ids:
+        try:
+            if os.path.getmtime(os.path.join(session_folder, upload_id, SESSION_DATA)) < cutoff:
+                delete_upload_session(session_folder, upload_id)
+        except (OSError, UploadError):
+            continue
+
+def create_upload_session(session_folder, filename, size):
+    """
+    Start a chunked upload of size bytes that will be saved as filename
+    """
+    if size <= 0:
+        raise UploadError('File is empty')
+    if size > MAX_UPLOAD_BYTES:
+        raise UploadError(f'File too large! Please upload a file smaller than {MAX_UPLOAD_BYTES // (1024 * 1024)}MB.', 413)
+    
+    prune_upload_sessions(session_folder)
+    session = {
+        'upload_id': uuid.uuid4().hex,
+        'filename': filename,
+        'size': size,
+        'created_at': time.time()
+    }
+    os.makedirs(_session_dir(session_folder, session['upload_id']))
+    open(os.path.join(_session_dir(session_folder, session['upload_id']), SESSION_DATA), 'wb').close()
+    _write_session(session_folder, session)
+    return _session_status(session_folder, session)
+
+def get_upload_session(session_folder, upload_id):
+    """Progress of an upload: the offset the next chunk must start at"""
+    return _session_status(session_folder, _read_session(session_folder, upload_id))
+
+def validate_csv_header(first_chunk, final=False):
+    """
+    Check the header line at the start of an export carries every column the
+    analysis needs. The header must end within the first chunk unless the
+    chunk is the whole file.
+    """
+    end = first_chunk.find(b'\n')
+    if end == -1 and not final:
+        raise UploadError('CSV header does not fit in the first chunk')
+    header_line = first_chunk if end == -1 else first_chunk[:end]
+    try:
+        header = next(csv.reader([header_line.decode('utf-8-sig').rstrip('\r')]), [])
+    except UnicodeDecodeError:
+        raise UploadError('File is not a UTF-8 CSV export')
+    
+    missing = [col for col in REQUIRED_COLUMNS if col not in {name.strip() for name in header}]
+    if missing:
+        raise UploadError(f"CSV is missing required columns: {', '.join(missing)}")
+    return header
+
+def _export_head(first_chunk, filename):
+    """
+    CSV bytes at the start of a (possibly compressed) first chunk, or None
+    for a ZIP whose CSV starts past it
+    """
+    try:
+        return decompress_head(first_chunk, filename)
+    except Exception as e:
+        raise UploadError(f"File is not a readable compressed CSV export: {e}")
+
+def _session_hasher(upload_id, offset):
+    """
+    Running hash of the first offset bytes of the part file, or None if this
+    process did not receive all of them. The part file is never rehashed here.
+    """
+    with _hashers_lock:
+        hasher = _hashers.get(upload_id)
+        if hasher is None or hasher[0] != offset:
+            # Chunks went to another worker: hash once when the upload completes
+            _hashers.pop(upload_id, None)
+            return None
+        # A copy, so a failed chunk leaves the stored hash untouched
+        return hasher[1].copy()
+
+def write_upload_chunk(session_folder, upload_id, offset, stream, length):
+    """
+    Append length bytes from stream at offset and return the new status.
+    Chunks must arrive in order; a mismatched offset (e.g. a retried chunk)
+    is rejected with the offset to resume from.
+    """
+    session = _read_session(session_folder, upload_id)
+    if length is None or length <= 0 or length > MAX_CHUNK_BYTES:
+        raise UploadError(f'Chunks must be between 1 byte and {MAX_CHUNK_BYTES // (1024 * 1024)}MB')
+    if offset + length > session['size']:
+        raise UploadError('Chunk extends past the declared file size')
+    
+    data_path = os.path.join(_session_dir(session_folder, upload_id), SESSION_DATA)
+    try:
+        _append_chunk(upload_id, session, data_path, offset, stream, length)
+    except UploadError as e:
+        if e.status == 400 and offset == 0 and e.offset is None:
+            # A bad header rejects the whole upload, not just this chunk
+            delete_upload_session(session_folder, upload_id)
+        raise
+    return _session_status(session_folder, session)
+
+def _append_chunk(upload_id, session, data_path, offset, stream, length):
+    with open(data_path, 'ab') as f:
+        # One writer per session, across threads and worker processes
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            current = os.fstat(f.fileno()).st_size
+            if offset != current:
+                raise UploadError('Chunk offset does not match the upload', 409, current)
+            
+            digest = hashlib.sha256() if offset == 0 else _session_hasher(upload_id, current)
+            
+            remaining = length
+            first_block = offset == 0
+            while remaining > 0:
+                block = stream.read(min(HASH_BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                if first_block:
+                    # Reject anything that is not an analyzable export before storing it
+                    head = _export_head(block, session['filename'])
+                    if head is not None:
+                        validate_csv_header(head, final=len(block) == session['size'])
+                    first_block = False
+                f.write(block)
+                if digest is not None:
+                    digest.update(block)
+                remaining -= len(block)
+            
+            if remaining:
+                # Client disconnected mid-chunk: roll back to the last complete chunk
+                f.truncate(current)
+                raise UploadError('Incomplete chunk', 400, current)
+            f.flush()
+            
+            if digest is not None:
+                with _hashers_lock:
+                    _hashers[upload_id] = (current + length, digest)
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _check_zip_upload(session_folder, upload_id, data_path, filename):
+    try:
+        try:
+            head = read_export_head(data_path, filename)
+        except Exception as e:
+            raise UploadError(f"File is not a readable compressed CSV export: {e}")
+        validate_csv_header(head, final=len(head) < HEADER_PEEK_BYTES)
+    except UploadError:
+        delete_upload_session(session_folder, upload_id)
+        raise
+
+def complete_upload_session(session_folder, upload_id, filepath):
+    """
+    Move a fully received upload to filepath, record its content hash for the
+    result cache and delete the session
+    """
+    session = _read_session(session_folder, upload_id)
+    data_path = os.path.join(_session_dir(session_folder, upload_id), SESSION_DATA)
+    size = os.path.getsize(data_path)
+    if size != session['size']:
+        raise UploadError('Upload is not complete', 409, size)
+    if export_compression(session['filename']) == 'zip':
+        # The member the analysis will read (the first chunk may not reach it)
+        _check_zip_upload(session_folder, upload_id, data_path, session['filename'])
+    
+    digest = _session_hasher(upload_id, size)
+    content_hash = digest.hexdigest() if digest is not None else file_content_hash(data_path)
+    os.replace(data_path, filepath)
+    write_content_hash(filepath, content_hash)
+    delete_upload_session(session_folder, upload_id)
+    return content_hash